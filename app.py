@@ -1,11 +1,11 @@
 import logging
-import asyncio
 import streamlit as st
 import os
 import sys
 import json
+import time
+import uuid
 from pathlib import Path
-from openai import AzureOpenAI
 from dotenv import load_dotenv
 
 # Create project root variable which will ensure repo directory will be used when importing modules
@@ -13,12 +13,31 @@ project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 # Import custom modules
-from src.core import ChatMessage, get_streaming_chat_completion, get_chat_completion
+from src.core import ChatMessage, get_chat_completion, create_azure_client
 from src.core.chat import setup_assistant
-from src.auth import get_access_token_client_credentials, get_access_token_on_behalf_of, EntraUserAuth, UserSecurityContext
-from src.utils import setup_logger
+from src.core.compare import compare_models
+from src.core.conversation import compact_conversation
+from src.core.prompt_cache import get_prompt_cache_stats
+from src.core.stream_task import StreamTask, get_stream_task_registry
+from src.core.usage_ledger import BudgetExceededError, get_usage_ledger
+from src.core.router import AUTO_MODEL, get_model_router, record_routing_outcome
+from src.core.retrieval import build_context_message
+from src.auth import (
+    get_access_token_client_credentials,
+    get_access_token_on_behalf_of,
+    get_token_lifecycle_manager,
+    EntraUserAuth,
+    UserSecurityContext
+)
+from src.auth.token_cache import delete_user_token_cache, save_user_token_cache
+from src.utils import process_image, setup_logger
+from src.utils.rerun_profiler import get_rerun_profiler
+from src.ui.session import schedule_session_housekeeping, tracked_session_run
 from src.ui import create_sidebar, display_chat_messages, display_token_usage, setup_main_page
 from src.ui.components import (
+    display_model_comparison,
+    fragment,
+    fragments_enabled,
     create_user_message_with_image, 
     create_user_message_text_only, 
     remove_image_from_message
@@ -28,9 +47,20 @@ from src.ui.components import (
 setup_logger()
 logger = logging.getLogger(__name__)
 
+# Retrieval settings for uploaded documents
+DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "5"))
+DOCUMENT_CONTEXT_TOKENS = int(os.getenv("DOCUMENT_CONTEXT_TOKENS", "1500"))
+
+# Seconds each run of the stream fragment follows the answer before it yields, so clicks are handled in between
+STREAM_POLL_INTERVAL = 0.5
+
 
 def initialize_session_state():
     """Initialize all session state variables."""
+    # Stable identifier for this browser session, used by process-wide services
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
     # Chat-related session state
     if "messages" not in st.session_state:
         st.session_state["messages"] = [
@@ -53,12 +83,32 @@ def initialize_session_state():
 
     if "app_auth_expiry" not in st.session_state:
         st.session_state.app_auth_expiry = None
+
+    # Rendering state shared by the chat fragments
+    if "history_rendered_count" not in st.session_state:
+        st.session_state.history_rendered_count = 0
+
+    # Bumped whenever the conversation is replaced rather than appended to
+    if "history_generation" not in st.session_state:
+        st.session_state.history_generation = 0
+
+    if "history_rendered_generation" not in st.session_state:
+        st.session_state.history_rendered_generation = 0
+
+    if "last_token_usage" not in st.session_state:
+        st.session_state.last_token_usage = None
     
     if "id_token" not in st.session_state:
         st.session_state.id_token = None
     
     if "auth_expiry" not in st.session_state:
         st.session_state.auth_expiry = None
+
+    if "home_account_id" not in st.session_state:
+        st.session_state.home_account_id = None
+
+    if "user_auth" not in st.session_state:
+        st.session_state.user_auth = None
     
     # Security context
     if "security_context" not in st.session_state:
@@ -76,6 +126,20 @@ def check_user_authentication() -> bool:
     return st.session_state.user_authenticated
 
 
+def get_user_auth() -> EntraUserAuth:
+    """Return an auth instance bound to the current user's token cache."""
+    if st.session_state.get("user_auth") is not None:
+        return st.session_state.user_auth
+
+    return EntraUserAuth(
+        client_id=os.getenv("AZURE_CLIENT_ID"),
+        tenant_id=os.getenv("AZURE_TENANT_ID"),
+        redirect_uri=os.getenv("REDIRECT_URI"),
+        client_secret=os.getenv("AZURE_CLIENT_SECRET"),
+        home_account_id=st.session_state.get("home_account_id")
+    )
+
+
 def render_login_page():
     """Render the login page for unauthenticated users."""
     st.title("Login Required")
@@ -88,12 +152,7 @@ def render_login_page():
         return
     
     # Create auth instance
-    auth = EntraUserAuth(
-        client_id=os.getenv("AZURE_CLIENT_ID"),
-        tenant_id=os.getenv("AZURE_TENANT_ID"),
-        redirect_uri=os.getenv("REDIRECT_URI"),
-        client_secret=os.getenv("AZURE_CLIENT_SECRET")
-    )
+    auth = get_user_auth()
     
     try:
         login_url = auth.get_login_url()
@@ -112,12 +171,7 @@ def render_login_page():
 def handle_auth_callback(auth_code: str):
     """Handle the OAuth callback from Entra ID."""
     try:
-        auth = EntraUserAuth(
-            client_id=os.getenv("AZURE_CLIENT_ID"),
-            tenant_id=os.getenv("AZURE_TENANT_ID"),
-            redirect_uri=os.getenv("REDIRECT_URI"),
-            client_secret=os.getenv("AZURE_CLIENT_SECRET")
-        )
+        auth = get_user_auth()
         
         result = auth.handle_callback(auth_code)
         if result:
@@ -125,12 +179,18 @@ def handle_auth_callback(auth_code: str):
             st.session_state.user_info = result.get("user_info")
             st.session_state.graph_access_token = result.get("access_token")
             st.session_state.id_token = result.get("id_token")  # Store ID token for OnBehalfOf
-            st.session_state.auth_expiry = result.get("expires_in")
+            st.session_state.home_account_id = result.get("home_account_id")
+            st.session_state.user_auth = auth
+
+            st.session_state.app_access_token = result.get("access_token_app")
 
-            result_app = auth.get_application_token() 
-            if result_app:
-                st.session_state.app_access_token = result_app.get("access_token_app")
-                st.session_state.app_auth_expiry = result_app.get("expires_in_app")
+            # Hand the tokens to the lifecycle manager so they are refreshed in the background before they expire
+            get_token_lifecycle_manager().register(
+                st.session_state.session_id,
+                refresher=auth.refresh_tokens,
+                token_result=result
+            )
+            sync_session_tokens()
             
             # Create security context
             st.session_state.security_context = UserSecurityContext(
@@ -150,6 +210,23 @@ def handle_auth_callback(auth_code: str):
         logger.error(f"Auth callback error: {e}", exc_info=True)
 
 
+def sync_session_tokens():
+    """Copy the latest tokens from the lifecycle manager into session state and persist the token cache."""
+    tokens = get_token_lifecycle_manager().get_tokens(st.session_state.session_id)
+    if tokens is None:
+        return
+
+    st.session_state.graph_access_token = tokens.graph_access_token
+    st.session_state.id_token = tokens.id_token
+    st.session_state.auth_expiry = tokens.graph_expires_at
+    st.session_state.app_access_token = tokens.app_access_token
+    st.session_state.app_auth_expiry = tokens.app_expires_at
+
+    # Background refreshes only update the in-memory cache, so persist it from the script thread
+    if st.session_state.user_auth is not None:
+        save_user_token_cache(st.session_state.home_account_id, st.session_state.user_auth.token_cache)
+
+
 def render_top_logout_button():
     """Render logout button in top right corner."""
     if st.session_state.user_authenticated and st.session_state.user_info:
@@ -184,64 +261,208 @@ def logout_user():
     st.session_state.auth_token = None
     st.session_state.id_token = None
     st.session_state.auth_expiry = None
+    st.session_state.app_access_token = None
+    st.session_state.app_auth_expiry = None
+    get_token_lifecycle_manager().unregister(st.session_state.session_id)
+    get_stream_task_registry().remove(st.session_state.session_id)
+    delete_user_token_cache(st.session_state.home_account_id)
+    st.session_state.home_account_id = None
+    st.session_state.user_auth = None
     st.session_state.security_context = None
+    st.session_state.last_token_usage = None
     st.session_state.messages = [
         setup_assistant(),
         {"role": "assistant", "content": "Hello!"}
     ]
+    st.session_state.history_generation += 1
     st.rerun()
 
 
-def create_azure_client(token_provider):
-    """Create and return an Azure OpenAI client."""
-    return AzureOpenAI(
-        api_version=os.environ.get("AZURE_OPENAI_API_VERSION"),
-        azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
-        azure_ad_token_provider=token_provider
+def handle_conversation_length(client, model, max_tokens):
+    """Handle conversation length by folding older turns into the running summary if it exceeds threshold."""
+    messages, chat_message = compact_conversation(
+        client=client,
+        deployment_name=model,
+        messages=st.session_state.messages,
+        max_tokens=max_tokens,
+        security_context=st.session_state.get('security_context')
     )
+    if chat_message is not None:
+        get_prompt_cache_stats().record(model, chat_message.prompt_tokens, chat_message.cached_tokens)
+        record_usage(model, chat_message)
+        st.session_state.messages = messages
+        st.session_state.history_generation += 1
+
+
+def record_usage(model, chat_message):
+    """Record the token usage of a completion in the usage ledger."""
+    get_usage_ledger().record_completion(st.session_state.get('security_context'), model, chat_message)
+
+
+def render_active_stream(sidebar_config, follow_for=None, stoppable=True):
+    """
+    Attach to this session's background stream, replaying the text received so far and following it.
+
+    Args:
+        sidebar_config (dict): Sidebar configuration with the status box to show token usage in
+        follow_for (float): Seconds to follow the stream before returning; None to follow it to the end
+        stoppable (bool): Whether to show the stop button
+
+    Returns:
+        bool: True if the stream finished and its answer was added to the conversation
+    """
+    registry = get_stream_task_registry()
+    task = registry.get(st.session_state.session_id)
+    if task is None:
+        return False
+
+    if stoppable and st.button("⏹ Stop generating", key="stop_generation"):
+        task.cancel()
+
+    with st.chat_message("assistant"):
+        message_placeholder = st.empty()
+
+    # Neither a rerun nor the end of the follow window stops the task, so the next run picks up where this one left off
+    deadline = None if follow_for is None else time.monotonic() + follow_for
+    shown = 0
+    done = False
+    while not done:
+        text, done = task.wait_for_update(shown)
+        if len(text) != shown:
+            message_placeholder.markdown(text)
+            shown = len(text)
+        if not done and deadline is not None and time.monotonic() >= deadline:
+            return False
+
+    finish_stream(task, sidebar_config, message_placeholder)
+    return True
+
+
+@fragment("stream", run_every=STREAM_POLL_INTERVAL)
+def poll_active_stream(sidebar_config):
+    """
+    Follow the answer being streamed for one poll interval at a time.
+
+    A fragment run blocks every widget interaction until it ends, so following the whole answer in one run would
+    leave the stop button and the prompt box unanswered until the model is done.
+    """
+    # A fragment can only draw into its own elements
+    sidebar_config = dict(sidebar_config)
+    sidebar_config['status_box'] = st.empty()
+    if render_active_stream(sidebar_config, follow_for=STREAM_POLL_INTERVAL):
+        # Redraw the page with the finished answer, which also ends the polling
+        st.rerun()
+
+
+def follow_active_stream(sidebar_config):
+    """Show the answer being streamed; as a polling fragment if fragments are on, otherwise until it ends."""
+    if get_stream_task_registry().get(st.session_state.session_id) is None:
+        return
+    if fragments_enabled():
+        poll_active_stream(sidebar_config)
+    else:
+        render_active_stream(sidebar_config)
 
 
-def handle_conversation_length(client, model, max_tokens):
-    """Handle conversation length by summarizing if it exceeds threshold."""
-    if len(st.session_state.messages) > 7:
-        logging.info("Conversation has exceeded maximum threshold. Summarizing conversation...")
-        
-        message = {
-            "role": "user",
-            "content": "Summarize the conversation you've had with the user. Ensure you keep the most important points."
-        }
-        st.session_state.messages.append(message)
-        
-        chat_message = get_chat_completion(
-            client=client, 
-            deployment_name=model, 
-            messages=st.session_state.messages, 
-            max_tokens=max_tokens,
-            security_context=st.session_state.get('security_context')
+def finish_stream(task, sidebar_config, message_placeholder):
+    """Record the result of a finished background stream in the conversation."""
+    # Remove the task before touching the history so a rerun can never record the same answer twice
+    get_stream_task_registry().remove(st.session_state.session_id, task)
+
+    chat_message = task.chat_message
+    if chat_message is None:
+        chat_message = ChatMessage("Sorry, I was unable to generate a response.", 0, 0, 0)
+    elif chat_message.cancelled and not chat_message.full_response:
+        chat_message.full_response = "_Generation stopped._"
+
+    st.session_state.messages.append(
+        {"role": "assistant", "content": chat_message.full_response}
+    )
+    message_placeholder.markdown(chat_message.full_response)
+    if task.error:
+        st.error(f"Streaming failed: {task.error}")
+    if chat_message.cancelled:
+        logger.info(
+            f"Streaming response from {task.deployment_name} stopped after {len(chat_message.full_response)} "
+            f"characters; estimated completion tokens {chat_message.completion_tokens}"
         )
+
+    metadata = task.metadata
+    complete_turn(chat_message, sidebar_config, metadata["client"], task.deployment_name, metadata["max_tokens"],
+                  metadata["prompt"], metadata["has_image"], metadata.get("routing"), task.error)
+
+
+def complete_turn(chat_message, sidebar_config, client, model, max_tokens, prompt, has_image, routing=None, error=None):
+    """Show token usage, drop the image from the history and compact the conversation after a response."""
+    record_usage(model, chat_message)
+    if routing is not None:
+        record_routing_outcome(routing["decision"], time.perf_counter() - routing["started"], chat_message, error)
+    if not chat_message.usage_estimated:
+        get_prompt_cache_stats().record(model, chat_message.prompt_tokens, chat_message.cached_tokens)
+    show_token_usage(sidebar_config['status_box'], chat_message, get_prompt_cache_stats().hit_ratio(model))
+
+    # Clean up image data to save tokens
+    if has_image:
+        remove_image_from_message(st.session_state.messages, prompt)
+        release_uploaded_image()
         
-        st.session_state.messages.append(
-            {"role": "assistant", "content": chat_message.full_response}
+    # Handle conversation length
+    handle_conversation_length(client, model, max_tokens)
+
+
+def release_uploaded_image():
+    """Clear the image uploader once its image is out of the history so the uploaded file can be freed."""
+    st.session_state.image_uploader_key = st.session_state.get("image_uploader_key", 0) + 1
+    st.session_state.sidebar_config['uploaded_file'] = None
+    st.session_state.sidebar_stale = True
+
+
+def show_token_usage(status_box, chat_message, cache_hit_ratio=None):
+    """Display token usage and keep it so later runs of the input fragment can redraw it."""
+    st.session_state.last_token_usage = (chat_message, cache_hit_ratio)
+    display_token_usage(status_box, chat_message, cache_hit_ratio)
+
+
+def add_document_context(prompt, messages, client):
+    """Return the request messages with the most relevant document excerpts added to the latest user message."""
+    document_index = st.session_state.get("document_index")
+    if document_index is None or not document_index.documents:
+        return messages
+
+    # Dense retrieval is used when an embeddings deployment is configured
+    embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    if embedding_deployment:
+        document_index.enable_embeddings(
+            lambda texts: [item.embedding for item in client.embeddings.create(model=embedding_deployment, input=texts).data]
         )
-        
-        # Keep only system message and last 2 messages (summary)
-        st.session_state.messages = [
-            st.session_state.messages[0]
-        ] + st.session_state.messages[-2:]
+
+    chunks = document_index.select_context(prompt, k=DOCUMENT_TOP_K, token_budget=DOCUMENT_CONTEXT_TOKENS)
+    if not chunks:
+        return messages
+
+    st.caption(f"Using {len(chunks)} excerpts from uploaded documents")
+    return messages[:-1] + [build_context_message(messages[-1], chunks)]
 
 
 def process_chat_input(prompt, sidebar_config, client):
     """Process user input and generate response."""
     uploaded_file = sidebar_config['uploaded_file']
-    base64_data = sidebar_config['base64_data']
     image_detail = sidebar_config['image_detail']
     streaming = sidebar_config['streaming']
     model = sidebar_config['model']
     max_tokens = sidebar_config['max_tokens']
     status_box = sidebar_config['status_box']
+
+    # Refuse the prompt up front if the user or tenant has used up its token budget
+    try:
+        get_usage_ledger().check_budget(st.session_state.get('security_context'))
+    except BudgetExceededError as e:
+        st.error(str(e))
+        return
     
     # Add user message to session state
     if uploaded_file is not None:
+        base64_data = process_image(original_image=uploaded_file.getvalue(), image_detail=image_detail)
         user_message = create_user_message_with_image(prompt, base64_data, image_detail)
         st.session_state.messages.append(user_message)
     else:
@@ -251,23 +472,67 @@ def process_chat_input(prompt, sidebar_config, client):
     # Display user message
     st.chat_message("user").write(prompt)
 
-    # Get AI response
-    messages = st.session_state['messages']
+    # With the auto model choice, pick the deployment for this turn from cheap local features
+    routing = None
+    if model == AUTO_MODEL:
+        decision = get_model_router().route(
+            prompt,
+            has_image=uploaded_file is not None,
+            conversation_depth=len(st.session_state.messages)
+        )
+        model = decision.model
+        if not sidebar_config['compare_models']:
+            routing = {"decision": decision, "started": time.perf_counter()}
+            st.caption(f"Auto selected {model} ({decision.reason})")
+
+    # Get AI response. Document excerpts are only added to this request, not to the stored history
+    messages = add_document_context(prompt, st.session_state['messages'], client)
     security_context = st.session_state.get('security_context')
     
-    if streaming:
-        chat_message = asyncio.run(get_streaming_chat_completion(
-            client=client,
-            deployment_name=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            security_context=security_context
-        ))
-        
-        # Display streaming response (already displayed in get_streaming_chat_completion)
+    if sidebar_config['compare_models']:
+        deployment_names = sidebar_config['compare_deployments']
+        with st.chat_message("assistant"):
+            results = display_model_comparison(
+                compare_models(client, deployment_names, messages, max_tokens, security_context),
+                deployment_names
+            )
+
+        for name, result in results.items():
+            if result.chat_message is not None:
+                record_usage(name, result.chat_message)
+                get_prompt_cache_stats().record(
+                    name, result.chat_message.prompt_tokens, result.chat_message.cached_tokens
+                )
+
+        # Keep the answer of the first model that succeeded in the conversation history
+        chat_message = next(
+            (results[name].chat_message for name in deployment_names if results[name].chat_message is not None),
+            ChatMessage("Sorry, I was unable to generate a response.", 0, 0, 0)
+        )
         st.session_state.messages.append(
             {"role": "assistant", "content": chat_message.full_response}
         )
+    elif streaming:
+        # Generate in the background so reruns reattach to the stream instead of losing it
+        get_stream_task_registry().start(
+            st.session_state.session_id,
+            StreamTask(
+                client=client,
+                deployment_name=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                security_context=security_context,
+                metadata={
+                    "client": client,
+                    "max_tokens": max_tokens,
+                    "prompt": prompt,
+                    "has_image": uploaded_file is not None,
+                    "routing": routing
+                }
+            )
+        )
+        # The answer is drawn by follow_active_stream once the input fragment has handled the prompt
+        return
     else:
         chat_message = get_chat_completion(
             client=client, 
@@ -283,55 +548,67 @@ def process_chat_input(prompt, sidebar_config, client):
             {"role": "assistant", "content": chat_message.full_response}
         )
 
-    # Display token usage
-    display_token_usage(status_box, chat_message)
-
-    # Clean up image data to save tokens
-    if uploaded_file is not None:
-        remove_image_from_message(st.session_state.messages, prompt)
-        
-    # Handle conversation length
-    handle_conversation_length(client, model, max_tokens)
+    # Display token usage, clean up image data and handle conversation length
+    if sidebar_config['compare_models']:
+        show_token_usage(status_box, chat_message)
+        if uploaded_file is not None:
+            remove_image_from_message(st.session_state.messages, prompt)
+            release_uploaded_image()
+        handle_conversation_length(client, model, max_tokens)
+    else:
+        complete_turn(chat_message, sidebar_config, client, model, max_tokens, prompt, uploaded_file is not None, routing)
 
 
-def main():
-    """Main application entry point with authentication gate."""
-    # Setup phase
-    load_dotenv('config/.env.local')
-    load_dotenv('config/.env.local.secrets')
-    
-    # Set page config
-    st.set_page_config(
-        page_title="Azure OpenAI Chatbot",
-        layout="wide"
-    )
-    
-    # Initialize session state
-    initialize_session_state()
-    
-    # Dump session state for debugging (you can comment this out when not needed)
-    dump_session_state_to_log()
-    
-    # Authentication gate
-    if not st.session_state.user_authenticated:
-        render_login_page()
+def dump_session_state_to_log():
+    """Log the session state as JSON when debug logging is enabled."""
+    # Serializing the whole session state on every rerun is expensive, so skip it unless someone will read it
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
         return
-    
-    render_top_logout_button()
-    
-    setup_main_page()
-    
-    # Create sidebar and get configuration set by the user
-    sidebar_config = create_sidebar()
 
-    # Add user info to sidebar
-    render_user_info_sidebar()
-    
-    # Display chat messages
+    try:
+        session_data = {}
+        for key, value in st.session_state.items():
+            try:
+                json.dumps(value)  # Test if serializable
+                session_data[key] = value
+            except (TypeError, ValueError):
+                session_data[key] = str(value)  # Convert non-serializable to string
+        logging.debug(json.dumps(session_data, indent=2, default=str))
+    except Exception as e:
+        logging.error(f"Failed to dump session state: {e}")
+
+
+@fragment("history")
+def render_chat_history():
+    """Render the conversation so far. Other fragments rerunning leave it in place."""
     display_chat_messages(st.session_state.messages)
-    
+    st.session_state.history_rendered_count = len(st.session_state.messages)
+    st.session_state.history_rendered_generation = st.session_state.history_generation
+
+
+@fragment("input")
+def render_chat_input():
+    """Render the prompt box, the turns added since the history was drawn and the answer being streamed."""
+    sidebar_config = dict(st.session_state.sidebar_config)
+
+    # Turns from earlier runs of this fragment are not part of the history fragment until the next full run
+    display_chat_messages(st.session_state.messages[st.session_state.history_rendered_count:])
+
+    # Token usage is shown here because a fragment can only draw into its own elements
+    sidebar_config['status_box'] = st.empty()
+    if st.session_state.last_token_usage is not None:
+        display_token_usage(sidebar_config['status_box'], *st.session_state.last_token_usage)
+
+    # A new prompt replaces an answer that is still streaming; the part received so far is kept in the conversation
+    prompt = st.chat_input()
+    if prompt and (active_task := get_stream_task_registry().get(st.session_state.session_id)) is not None:
+        active_task.cancel()
+        render_active_stream(sidebar_config, stoppable=False)
+
     # Handle user input
-    if prompt := st.chat_input():
+    if prompt:
+        # Fragment runs skip main(), so pick up tokens refreshed in the background before building the client
+        sync_session_tokens()
 
         if sidebar_config['on_behalf_of']:
             logging.info(st.session_state.app_access_token)
@@ -356,18 +633,73 @@ def main():
         # Process the user's chat input and include the sidebar configuration to ensure any options are triggered
         process_chat_input(prompt, sidebar_config, client)
 
-        # Dump session state as valid JSON
-        try:
-            session_data = {}
-            for key, value in st.session_state.items():
-                try:
-                    json.dumps(value)  # Test if serializable
-                    session_data[key] = value
-                except (TypeError, ValueError):
-                    session_data[key] = str(value)  # Convert non-serializable to string
-            logging.info(json.dumps(session_data, indent=2, default=str))
-        except Exception as e:
-            logging.error(f"Failed to dump session state: {e}")
+        dump_session_state_to_log()
+
+    # Follow the answer started above or still streaming from before this rerun
+    follow_active_stream(sidebar_config)
+
+    # Compaction replaced turns the history fragment has drawn, even if the history kept its length, or the sidebar
+    # still shows a released image, so redraw the whole page
+    if (st.session_state.history_generation != st.session_state.history_rendered_generation
+            or st.session_state.pop("sidebar_stale", False)):
+        st.rerun()
+
+
+# Environment files only add variables that are not set yet, so reading them again on every run changes nothing.
+# Nothing session specific is cached here; conversations, images and documents stay in the session, where the
+# memory accountant can spill or evict them
+@st.cache_resource(show_spinner=False)
+def load_settings():
+    """Load the environment files once per process."""
+    load_dotenv('config/.env.local')
+    load_dotenv('config/.env.local.secrets')
+
+
+def main():
+    """Main application entry point with authentication gate."""
+    # Setup phase
+    load_settings()
+    
+    # Set page config
+    st.set_page_config(
+        page_title="Azure OpenAI Chatbot",
+        layout="wide"
+    )
+
+    with get_rerun_profiler().measure("app"):
+        # Initialize session state
+        initialize_session_state()
+
+        # Restores a conversation spilled to disk while the session was idle
+        with tracked_session_run():
+            # Dump session state for debugging
+            dump_session_state_to_log()
+            
+            # Authentication gate
+            if not st.session_state.user_authenticated:
+                render_login_page()
+                return
+            
+            # Pick up tokens refreshed in the background since the last run
+            sync_session_tokens()
+
+            render_top_logout_button()
+            
+            setup_main_page()
+            
+            # Create sidebar; changing its controls only reruns the sidebar fragment
+            create_sidebar()
+
+            # Add user info to sidebar
+            render_user_info_sidebar()
+            
+            # Display chat messages, then the prompt box and the active answer
+            render_chat_history()
+            render_chat_input()
+
+            # Lets an idle session spill or evict itself when the sweeper marks it
+            if fragments_enabled():
+                schedule_session_housekeeping()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
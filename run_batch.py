@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Run a JSONL file of prompts through the chatbot's chat core without the Streamlit UI.
+Usage: python run_batch.py prompts.jsonl results.jsonl [--concurrency 8] [--rpm 120]
+       python run_batch.py prompts.jsonl results.jsonl --mode batch-api
+"""
+
+import argparse
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+from src.auth.client_auth import get_access_token_client_credentials
+from src.auth.security_context import UserSecurityContext
+from src.core.batch import BatchOptions, run_batch
+from src.core.batch_api import run_batch_api
+from src.core.client import create_azure_client
+from src.core.usage_ledger import BudgetExceededError, get_usage_ledger
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run JSONL prompts through Azure OpenAI")
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("output", help="JSONL file results are appended to; completed rows are skipped on resume")
+    parser.add_argument("--mode", choices=("sync", "batch-api"), default="sync",
+                        help="sync sends requests directly; batch-api submits Azure OpenAI Batch API jobs")
+    parser.add_argument("--poll-max-interval", type=float, default=300,
+                        help="Maximum seconds between Batch API status checks")
+    parser.add_argument("--model", default="gpt-35-turbo", help="Deployment used for rows without a model")
+    parser.add_argument("--max-tokens", type=int, default=1000, help="Max tokens for rows without max_tokens")
+    parser.add_argument("--system-prompt", default="You are a helpful assistant")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of requests in flight")
+    parser.add_argument("--rpm", type=float, default=None, help="Maximum requests per minute")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--end-user-id", default=None, help="User id sent in the user security context")
+    parser.add_argument("--application-name", default="Azure OpenAI Chatbot Batch")
+    return parser.parse_args()
+
+def main():
+    """Run the batch job."""
+    args = parse_args()
+
+    load_dotenv('config/.env.local')
+    load_dotenv('config/.env.local.secrets')
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(asctime)s %(name)s:%(message)s")
+
+    token_provider = get_access_token_client_credentials(
+        scope="https://cognitiveservices.azure.com/.default"
+    )
+    if token_provider is None:
+        print("Error: unable to obtain a token provider for Azure OpenAI")
+        sys.exit(1)
+
+    security_context = None
+    if args.end_user_id:
+        security_context = UserSecurityContext(
+            application_name=args.application_name,
+            end_user_id=args.end_user_id,
+            source_ip="unknown",
+            end_user_tenant_id=os.getenv("AZURE_TENANT_ID")
+        )
+
+    options = BatchOptions(
+        default_model=args.model,
+        default_max_tokens=args.max_tokens,
+        system_prompt=args.system_prompt,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries
+    )
+
+    if args.mode == "sync":
+        # The runner retries with its own backoff and every attempt waits for the rate limiter, so SDK retries
+        # would send requests the limiter never saw
+        client = create_azure_client(token_provider, max_retries=0)
+    else:
+        client = create_azure_client(token_provider)
+    # Completions count towards the same budgets as the chat UI, against the --end-user-id user
+    usage_ledger = get_usage_ledger()
+
+    try:
+        if args.mode == "batch-api":
+            counts = run_batch_api(
+                client, args.input, args.output, options, security_context,
+                poll_max_interval=args.poll_max_interval, usage_ledger=usage_ledger
+            )
+        else:
+            counts = run_batch(client, args.input, args.output, options, security_context, usage_ledger)
+    except KeyboardInterrupt:
+        print("\nBatch run interrupted. Run the same command again to resume.")
+        sys.exit(130)
+    except BudgetExceededError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        usage_ledger.flush()
+
+    print(f"Succeeded: {counts['succeeded']}, failed: {counts['failed']}, skipped: {counts['skipped']}")
+    sys.exit(1 if counts["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Measure document indexing and retrieval on synthetic documents.
+Usage: python run_retrieval_benchmark.py [--pages 500] [--chunks 20000] [--queries 200] [--format json]
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import statistics
+import string
+import time
+
+from src.core.retrieval import DocumentIndex
+from src.utils.document_processor import DocumentChunk, get_document_executor, process_document
+
+# Synthetic vocabulary with a Zipf-like word frequency, so common words match many chunks and rare ones few
+VOCABULARY = ["".join(random.Random(i).choices(string.ascii_lowercase, k=4 + i % 6)) for i in range(5000)]
+CUMULATIVE_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+
+def sample_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE_WEIGHTS, k=words))
+
+
+def make_sample_pdf(pages: int, lines: int = 40, seed: int = 0) -> bytes:
+    """Return a PDF of text pages, written directly so no PDF library is needed to create it."""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for _ in range(pages):
+        content = "".join(
+            f"BT /F1 10 Tf 40 {750 - i * 18} Td ({sample_text(rng, 10)}) Tj ET\n" for i in range(lines)
+        ).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(page_refs), pages)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+def hash_embed(texts, dimensions: int = 256):
+    """Deterministic stand-in for an embeddings deployment: a bag of hashed words."""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * dimensions
+        for word in text.split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dimensions] += 1.0
+        vectors.append(vector)
+    return vectors
+
+
+def latency_summary(samples) -> dict:
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000, 3),
+    }
+
+
+def benchmark_retrieval(pages: int = 500, chunks: int = 20000, queries: int = 200, seed: int = 0) -> dict:
+    """
+    Time PDF processing, indexing, queries with and without embeddings, and document removal.
+
+    Args:
+        pages: Pages of the synthetic PDF processed by the worker pool
+        chunks: Chunks indexed, spread over ten documents
+        queries: Queries timed for each retrieval mode
+        seed: Seed of the synthetic text
+
+    Returns:
+        dict: Timings of each stage
+    """
+    rng = random.Random(seed)
+    results = {}
+
+    # Start the worker pool first so process start-up is not counted
+    get_document_executor().submit(sum, []).result()
+    pdf = make_sample_pdf(pages, seed=seed)
+    started = time.perf_counter()
+    pdf_chunks = process_document("sample.pdf", pdf)
+    results["pdf"] = {"pages": pages, "chunks": len(pdf_chunks), "seconds": round(time.perf_counter() - started, 3)}
+
+    index = DocumentIndex()
+    documents = {
+        f"doc{d}": [DocumentChunk(f"doc{d}", i, sample_text(rng, 225), 300) for i in range(chunks // 10)]
+        for d in range(10)
+    }
+    started = time.perf_counter()
+    for key, document_chunks in documents.items():
+        index.add_document(key, document_chunks)
+    elapsed = time.perf_counter() - started
+    results["index"] = {"chunks": chunks, "seconds": round(elapsed, 3), "chunks_per_s": round(chunks / elapsed)}
+
+    prompts = [sample_text(rng, 12) for _ in range(queries)]
+    samples = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        index.select_context(prompt)
+        samples.append(time.perf_counter() - started)
+    results["query_bm25"] = latency_summary(samples)
+
+    started = time.perf_counter()
+    index.enable_embeddings(hash_embed, background=False)
+    results["embed"] = {"seconds": round(time.perf_counter() - started, 3)}
+    samples = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        index.select_context(prompt)
+        samples.append(time.perf_counter() - started)
+    results["query_hybrid"] = latency_summary(samples)
+
+    started = time.perf_counter()
+    index.remove_document("doc0")
+    results["remove"] = {"seconds": round(time.perf_counter() - started, 3), "chunks_left": len(index.bm25.chunks)}
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure document indexing and retrieval")
+    parser.add_argument("--pages", type=int, default=500, help="Pages of the synthetic PDF")
+    parser.add_argument("--chunks", type=int, default=20000, help="Chunks indexed across ten documents")
+    parser.add_argument("--queries", type=int, default=200, help="Queries timed per retrieval mode")
+    parser.add_argument("--format", choices=("table", "json"), default="table")
+    return parser.parse_args()
+
+
+def main():
+    """Print the indexing and retrieval timings."""
+    args = parse_args()
+    results = benchmark_retrieval(args.pages, args.chunks, args.queries)
+
+    if args.format == "json":
+        print(json.dumps(results, indent=2))
+        return
+
+    for stage, values in results.items():
+        print(f"{stage.ljust(14)}" + "  ".join(f"{name}={value}" for name, value in values.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measure the overhead the automatic model router adds to each turn.
+Usage: python run_router_benchmark.py [--iterations 2000] [--format json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from src.core.router import ModelRouter
+
+# Prompts shaped like the turns the router sees, from a short greeting to a pasted document
+SAMPLE_PROMPTS = {
+    "short": "Hi, what's the capital of France?",
+    "question": "Can you explain why the sky is blue and compare it to how sunsets get their colour? " * 3,
+    "code": "Refactor this function so it is easier to test:\n```python\ndef load(path):\n    import json\n"
+            "    return json.load(open(path))\n```\n" * 5,
+    "long": "Summarize the following meeting notes for the team. " + "The quarterly numbers were discussed. " * 500,
+    "huge": "Please review this log output and tell me what failed.\n" + "INFO request served in 12 ms\n" * 20000,
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def benchmark_router(router: ModelRouter, prompts: dict, iterations: int = 2000, conversation_depth: int = 4) -> dict:
+    """
+    Time router.route for every prompt.
+
+    Args:
+        router: Router to measure
+        prompts: Prompt text keyed by a name for the report
+        iterations: Number of timed calls per prompt
+        conversation_depth: Conversation depth passed with every call
+
+    Returns:
+        dict: Per prompt the chosen model, prompt length and the median, p99 and max routing time in microseconds
+    """
+    results = {}
+    for name, prompt in prompts.items():
+        decision = router.route(prompt, conversation_depth=conversation_depth)
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            router.route(prompt, conversation_depth=conversation_depth)
+            samples.append((time.perf_counter() - started) * 1_000_000)
+        results[name] = {
+            "model": decision.model,
+            "chars": len(prompt),
+            "p50_us": round(statistics.median(samples), 1),
+            "p99_us": round(percentile(samples, 0.99), 1),
+            "max_us": round(max(samples), 1),
+        }
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the per-turn overhead of automatic model routing")
+    parser.add_argument("--iterations", type=int, default=2000, help="Timed routing calls per sample prompt")
+    parser.add_argument("--format", choices=("table", "json"), default="table")
+    return parser.parse_args()
+
+
+def main():
+    """Print the routing overhead for each sample prompt."""
+    args = parse_args()
+    results = benchmark_router(ModelRouter(), SAMPLE_PROMPTS, args.iterations)
+
+    if args.format == "json":
+        print(json.dumps(results, indent=2))
+        return
+
+    columns = ["prompt", "model", "chars", "p50_us", "p99_us", "max_us"]
+    rows = [{"prompt": name, **result} for name, result in results.items()]
+    widths = {c: max([len(c)] + [len(str(row[c])) for row in rows]) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+if __name__ == "__main__":
+    main()
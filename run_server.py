@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Run the Streamlit chatbot application with a startup warm-up and a readiness endpoint.
+Usage: python run_server.py
+
+Streamlit is started in this process so the credentials, token cache, connection pools and image codecs prepared by
+the warm-up are the ones the app uses. The warm-up state is served at http://localhost:8081/ready, which only
+succeeds once the warm-up is done and Streamlit answers its own health check.
+"""
+
+import os
+import sys
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Create project root variable which will ensure repo directory will be used when importing modules
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from src.core.warmup import Warmup, default_steps, start_readiness_server
+from src.utils import setup_logger
+
+
+def main():
+    """Start the readiness endpoint and the warm-up, then run Streamlit."""
+    load_dotenv('config/.env.local')
+    load_dotenv('config/.env.local.secrets')
+    setup_logger()
+
+    app_path = str(project_root / "app.py")
+    port = int(os.getenv("PORT", "8080"))
+    readiness_port = int(os.getenv("READINESS_PORT", "8081"))
+
+    # The readiness endpoint answers 503 until every warm-up step has succeeded and Streamlit is serving
+    warmup = Warmup(default_steps(), timeout=float(os.getenv("WARMUP_TIMEOUT", "120")),
+                    retries=int(os.getenv("WARMUP_RETRIES", "5")),
+                    recheck_interval=float(os.getenv("WARMUP_RECHECK_INTERVAL", "30")) or None)
+    start_readiness_server(warmup, readiness_port, app_health_url=f"http://localhost:{port}/_stcore/health")
+    warmup.start()
+
+    print("Starting Streamlit chatbot application...")
+    print(f"App will be available at: http://localhost:{port}")
+    print(f"Readiness at: http://localhost:{readiness_port}/ready")
+
+    # Going through the streamlit command line keeps its handling of config files and STREAMLIT_* variables
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", app_path, "--server.port", str(port), "--server.headless", "true"]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Report token usage from the usage ledger.
+Usage: python run_usage_report.py [--group-by tenant_id user_id] [--since 2024-01-01] [--until 2024-01-31] [--format csv]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+from src.core.usage_ledger import GROUP_BY_COLUMNS, aggregate_usage
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Aggregate token usage from the usage ledger")
+    parser.add_argument("--db", default=None, help="Ledger database (defaults to USAGE_LEDGER_PATH)")
+    parser.add_argument("--group-by", nargs="*", default=["tenant_id", "user_id"], choices=GROUP_BY_COLUMNS)
+    parser.add_argument("--since", default=None, help="First day to include (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="Last day to include (YYYY-MM-DD)")
+    parser.add_argument("--tenant-id", default=None)
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--format", choices=("table", "csv", "json"), default="table")
+    return parser.parse_args()
+
+def main():
+    """Print the usage report."""
+    args = parse_args()
+    load_dotenv('config/.env.local')
+
+    db_path = args.db or os.getenv("USAGE_LEDGER_PATH", "data/usage_ledger.sqlite3")
+    if not os.path.exists(db_path):
+        print(f"Error: usage ledger {db_path} not found!")
+        sys.exit(1)
+
+    rows = aggregate_usage(
+        db_path,
+        group_by=args.group_by,
+        since=args.since,
+        until=args.until,
+        tenant_id=args.tenant_id,
+        user_id=args.user_id
+    )
+    columns = list(args.group_by) + ["requests", "prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"]
+
+    if args.format == "json":
+        print(json.dumps(rows, indent=2))
+    elif args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        widths = {c: max([len(c)] + [len(str(row[c])) for row in rows]) for c in columns}
+        print("  ".join(c.ljust(widths[c]) for c in columns))
+        for row in rows:
+            print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+if __name__ == "__main__":
+    main()
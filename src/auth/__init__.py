@@ -2,14 +2,25 @@
 Core chatbot functionality including chat operations and authentication.
 """
 
-from .client_auth import get_access_token_client_credentials, get_access_token_on_behalf_of
-from .user_auth import EntraUserAuth
+from .client_auth import get_access_token_client_credentials, get_access_token_on_behalf_of, get_default_credential
 from .security_context import UserSecurityContext, get_msdefender_user_json
+from .token_lifecycle import TokenLifecycleManager, get_token_lifecycle_manager
 
 __all__ = [
     'get_access_token_client_credentials',
     'get_access_token_on_behalf_of',
+    'get_default_credential',
     'EntraUserAuth',
     'UserSecurityContext',
-    'get_msdefender_user_json'
-]
\ No newline at end of file
+    'get_msdefender_user_json',
+    'TokenLifecycleManager',
+    'get_token_lifecycle_manager'
+]
+
+
+# EntraUserAuth needs Streamlit, so it is only imported when it is used; the batch CLI uses this package without it
+def __getattr__(name):
+    if name == "EntraUserAuth":
+        from .user_auth import EntraUserAuth
+        return EntraUserAuth
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
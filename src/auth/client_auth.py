@@ -1,15 +1,23 @@
 import logging, os
+from functools import lru_cache
 from azure.identity import DefaultAzureCredential, OnBehalfOfCredential, get_bearer_token_provider
 
 # Use the main logger for the application
 logger = logging.getLogger(__name__)
 
+# DefaultAzureCredential probes its chain of credentials on first use and caches tokens per instance,
+# so a single instance is shared by the process
+@lru_cache(maxsize=1)
+def get_default_credential():
+    """Return the process-wide DefaultAzureCredential."""
+    return DefaultAzureCredential()
+
 # Obtain Entra ID access token using the OAuth client credentials flow
 def get_access_token_client_credentials(scope):
     try: 
         logger.info("Obtaining access token using client credentials flow")
         token_provider = get_bearer_token_provider(
-            DefaultAzureCredential(),
+            get_default_credential(),
             scope
         )
         logger.info("Access token obtained successfully for client credentials flow")
@@ -0,0 +1,124 @@
+"""
+Microsoft Graph API client with a pooled HTTP session and a per-user profile cache.
+
+Profiles are served from the cache while they are fresh. Once they are stale they are revalidated with the ETag
+returned by Graph, so a returning user whose profile has not changed only costs a 304 response.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+GRAPH_ME_URL = "https://graph.microsoft.com/v1.0/me"
+
+# Connect and read timeouts in seconds for Microsoft Graph API calls
+GRAPH_TIMEOUT = (3.05, 10)
+
+
+@lru_cache(maxsize=1)
+def get_graph_session() -> requests.Session:
+    """Return the process-wide HTTP session used for Microsoft Graph API calls."""
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=32))
+    return session
+
+
+class GraphProfileCache:
+    """Bounded LRU cache of Microsoft Graph user profiles and their ETags keyed by home account id"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, profile: Dict, etag: Optional[str]):
+        with self._lock:
+            self._entries[key] = {"profile": profile, "etag": etag, "validated_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def touch(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["validated_at"] = time.monotonic()
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.monotonic() - entry["validated_at"] < self.ttl
+
+
+@lru_cache(maxsize=1)
+def get_graph_profile_cache() -> GraphProfileCache:
+    """Return the process-wide Graph profile cache. GRAPH_PROFILE_TTL sets its freshness window in seconds."""
+    return GraphProfileCache(ttl=float(os.getenv("GRAPH_PROFILE_TTL", "300")))
+
+
+def get_user_profile(access_token: str, cache_key: Optional[str] = None) -> Dict:
+    """
+    Get the signed in user's profile from the Microsoft Graph API.
+
+    Args:
+        access_token: Access token for the Microsoft Graph API
+        cache_key: Home account id of the user; enables the profile cache when set
+
+    Returns:
+        dict: The user's profile or an empty dict if it could not be retrieved
+    """
+    cache = get_graph_profile_cache()
+    cached = cache.get(cache_key) if cache_key else None
+    if cached is not None and cache.is_fresh(cached):
+        logger.info("Using cached Microsoft Graph user profile")
+        return cached["profile"]
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    if cached is not None and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+
+    try:
+        response = get_graph_session().get(GRAPH_ME_URL, headers=headers, timeout=GRAPH_TIMEOUT)
+    except requests.RequestException:
+        logger.error("Microsoft Graph user profile request failed", exc_info=True)
+        return cached["profile"] if cached is not None else {}
+
+    if response.status_code == 304 and cached is not None:
+        logger.info("Microsoft Graph user profile not modified; using cached profile")
+        cache.touch(cache_key)
+        return cached["profile"]
+
+    if response.status_code == 200:
+        user_data = response.json()
+
+        # Log the user attributes returned by the Microsoft Graph API
+        logger.info(f"Microsoft Graph user properties: {list(user_data.keys())}")
+        if cache_key:
+            cache.put(cache_key, user_data, response.headers.get("ETag") or user_data.get("@odata.etag"))
+        return user_data
+
+    logger.error(f"Microsoft Graph user profile request returned status {response.status_code}")
+    return {}
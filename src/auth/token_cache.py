@@ -0,0 +1,154 @@
+"""
+Process-wide MSAL application and per-user serialized token caches.
+
+A ConfidentialClientApplication is created once per process so authority and OpenID discovery only happen once.
+Each user gets their own application bound to their own SerializableTokenCache, which is persisted either to the
+Streamlit session or to an encrypted directory shared between replicas. The per-user applications reuse the shared
+application's HTTP session and discovery responses, so creating one makes no network calls.
+"""
+
+import logging
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import msal
+import streamlit as st
+from cryptography.fernet import Fernet, InvalidToken
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+
+class SessionTokenCacheStore:
+    """Stores serialized token caches in the Streamlit session state."""
+
+    SESSION_KEY = "msal_token_caches"
+
+    def load(self, home_account_id: str) -> Optional[str]:
+        return st.session_state.get(self.SESSION_KEY, {}).get(home_account_id)
+
+    def save(self, home_account_id: str, serialized_cache: str):
+        if self.SESSION_KEY not in st.session_state:
+            st.session_state[self.SESSION_KEY] = {}
+        st.session_state[self.SESSION_KEY][home_account_id] = serialized_cache
+
+    def delete(self, home_account_id: str):
+        st.session_state.get(self.SESSION_KEY, {}).pop(home_account_id, None)
+
+
+class EncryptedFileTokenCacheStore:
+    """Stores serialized token caches as Fernet encrypted files, one file per user."""
+
+    def __init__(self, directory: str, encryption_key: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fernet = Fernet(encryption_key)
+        self._lock = threading.Lock()
+
+    def _path(self, home_account_id: str) -> Path:
+        # Home account ids are "<object id>.<tenant id>" so they are safe to use as file names
+        return self.directory / f"{home_account_id}.bin"
+
+    def load(self, home_account_id: str) -> Optional[str]:
+        path = self._path(home_account_id)
+        if not path.exists():
+            return None
+        try:
+            return self.fernet.decrypt(path.read_bytes()).decode("utf-8")
+        except InvalidToken:
+            logger.error(f"Unable to decrypt token cache for account {home_account_id}; ignoring it")
+            return None
+
+    def save(self, home_account_id: str, serialized_cache: str):
+        path = self._path(home_account_id)
+        tmp_path = path.with_suffix(".tmp")
+        with self._lock:
+            # Write to a temporary file first so a concurrent reader never sees a partial cache
+            tmp_path.write_bytes(self.fernet.encrypt(serialized_cache.encode("utf-8")))
+            os.replace(tmp_path, path)
+
+    def delete(self, home_account_id: str):
+        self._path(home_account_id).unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=1)
+def get_token_cache_store():
+    """
+    Return the token cache store for this process.
+
+    Set TOKEN_CACHE_DIR and TOKEN_CACHE_KEY (a Fernet key) to share caches across replicas through a common
+    volume. Otherwise caches live in the user's Streamlit session.
+    """
+    cache_dir = os.getenv("TOKEN_CACHE_DIR")
+    if cache_dir:
+        encryption_key = os.getenv("TOKEN_CACHE_KEY")
+        if not encryption_key:
+            raise ValueError("TOKEN_CACHE_KEY must be set when TOKEN_CACHE_DIR is used")
+        logger.info(f"Using encrypted file token cache store at {cache_dir}")
+        return EncryptedFileTokenCacheStore(cache_dir, encryption_key)
+
+    logger.info("Using session token cache store")
+    return SessionTokenCacheStore()
+
+
+# Discovery responses cached by MSAL and shared by every application in the process. MSAL keeps no tokens here
+_msal_http_cache = {}
+
+
+@lru_cache(maxsize=None)
+def get_msal_app(client_id: str, tenant_id: str, client_secret: str) -> msal.ConfidentialClientApplication:
+    """Create the process-wide MSAL confidential client. Discovery happens once here."""
+    logger.info("Creating shared MSAL confidential client application")
+    return msal.ConfidentialClientApplication(
+        client_id=client_id,
+        client_credential=client_secret,
+        authority=f"https://login.microsoftonline.com/{tenant_id}",
+        http_cache=_msal_http_cache,
+    )
+
+
+def get_user_msal_app(client_id: str, tenant_id: str, client_secret: str,
+                      token_cache: msal.SerializableTokenCache) -> msal.ConfidentialClientApplication:
+    """
+    Return an MSAL application that reads and writes tokens in a single user's token cache.
+
+    MSAL binds the token cache when it builds its OAuth client, so each user needs an application of their own.
+    It shares the pooled HTTP session of the process-wide application, and the authority is resolved from the
+    discovery responses that application cached.
+    """
+    shared_app = get_msal_app(client_id, tenant_id, client_secret)
+    return msal.ConfidentialClientApplication(
+        client_id=client_id,
+        client_credential=client_secret,
+        authority=f"https://login.microsoftonline.com/{tenant_id}",
+        token_cache=token_cache,
+        http_client=shared_app.http_client,
+        http_cache=_msal_http_cache,
+        instance_discovery=False,
+    )
+
+
+def load_user_token_cache(home_account_id: Optional[str]) -> msal.SerializableTokenCache:
+    """Load the serialized token cache for a user, or return an empty cache."""
+    token_cache = msal.SerializableTokenCache()
+    if home_account_id:
+        serialized_cache = get_token_cache_store().load(home_account_id)
+        if serialized_cache:
+            token_cache.deserialize(serialized_cache)
+    return token_cache
+
+
+def save_user_token_cache(home_account_id: str, token_cache: msal.SerializableTokenCache):
+    """Persist a user's token cache if MSAL changed it."""
+    if home_account_id and token_cache.has_state_changed:
+        get_token_cache_store().save(home_account_id, token_cache.serialize())
+        token_cache.has_state_changed = False
+
+
+def delete_user_token_cache(home_account_id: Optional[str]):
+    """Remove a user's persisted token cache, for example on logout."""
+    if home_account_id:
+        get_token_cache_store().delete(home_account_id)
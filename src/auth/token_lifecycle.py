@@ -0,0 +1,259 @@
+"""
+Token lifecycle manager which refreshes user and application tokens in the background before they expire.
+
+Each Streamlit session registers its tokens and a refresher (usually EntraUserAuth.refresh_tokens). A single daemon
+worker refreshes tokens ahead of expiry, with random jitter so sessions that logged in together do not refresh at
+the same moment, and records refresh latency and failure metrics.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SessionTokens:
+    """Tokens held for a single session and the absolute times they expire"""
+
+    graph_access_token: Optional[str] = None
+    id_token: Optional[str] = None
+    graph_expires_at: Optional[float] = None
+    app_access_token: Optional[str] = None
+    app_expires_at: Optional[float] = None
+    next_refresh_at: Optional[float] = None
+    consecutive_failures: int = 0
+    refresh_count: int = 0
+    last_error: Optional[str] = None
+
+
+@dataclass
+class _SessionEntry:
+    tokens: SessionTokens
+    refresher: Callable[[], Dict]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class TokenLifecycleManager:
+    """Tracks token expiry per session and refreshes tokens silently before they expire"""
+
+    def __init__(
+        self,
+        refresh_margin: float = 300,
+        jitter: float = 60,
+        retry_delay: float = 15,
+        max_retry_delay: float = 300,
+        min_refresh_interval: float = 30,
+        poll_interval: float = 5,
+        metrics_interval: float = 300,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            refresh_margin: Seconds before the earliest expiry at which a refresh is attempted
+            jitter: Maximum random number of seconds subtracted from each refresh time
+            retry_delay: Delay before the first retry after a failed refresh; doubled on each failure
+            max_retry_delay: Upper bound for the retry delay
+            min_refresh_interval: Minimum seconds between refreshes of a session, for tokens reported without a
+                lifetime or already inside the refresh margin
+            poll_interval: Maximum time the background worker sleeps between checks
+            metrics_interval: Seconds between metrics log lines from the background worker
+            clock: Returns the current time in seconds; replaced with a fake clock in tests
+            rng: Random number generator used for jitter
+        """
+        self.refresh_margin = refresh_margin
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.min_refresh_interval = min_refresh_interval
+        self.poll_interval = poll_interval
+        self.metrics_interval = metrics_interval
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        self._sessions: Dict[str, _SessionEntry] = {}
+        self._sessions_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self._refresh_latencies = deque(maxlen=500)
+        self._refresh_successes = 0
+        self._refresh_failures = 0
+
+    def register(self, session_id: str, refresher: Callable[[], Dict], token_result: Dict):
+        """
+        Start tracking the tokens of a session.
+
+        Args:
+            session_id: Identifier of the Streamlit session
+            refresher: Callable returning a dict in the format of EntraUserAuth.refresh_tokens
+            token_result: Initial tokens with relative expires_in/expires_in_app values in seconds
+        """
+        tokens = SessionTokens()
+        self._apply_result(tokens, token_result)
+        with self._sessions_lock:
+            self._sessions[session_id] = _SessionEntry(tokens=tokens, refresher=refresher)
+        self._wakeup.set()
+
+    def unregister(self, session_id: str):
+        """Stop tracking a session, for example on logout."""
+        with self._sessions_lock:
+            self._sessions.pop(session_id, None)
+
+    def get_tokens(self, session_id: str) -> Optional[SessionTokens]:
+        """Return a snapshot of the current tokens for a session."""
+        with self._sessions_lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        with entry.lock:
+            return replace(entry.tokens)
+
+    def refresh_due(self) -> float:
+        """
+        Refresh every session whose refresh time has passed.
+
+        The session lock is only held to read and apply tokens, never during the refresh call itself, so readers
+        on the script thread are not blocked by a slow identity provider.
+
+        Returns:
+            float: Seconds until the next refresh is due, capped at the poll interval
+        """
+        now = self.clock()
+        with self._sessions_lock:
+            entries = list(self._sessions.items())
+
+        next_due = now + self.poll_interval
+        for session_id, entry in entries:
+            with entry.lock:
+                due = entry.tokens.next_refresh_at is not None and entry.tokens.next_refresh_at <= now
+            if due:
+                self._refresh(session_id, entry)
+            with entry.lock:
+                if entry.tokens.next_refresh_at is not None:
+                    next_due = min(next_due, entry.tokens.next_refresh_at)
+
+        return max(next_due - self.clock(), 0)
+
+    def metrics(self) -> Dict:
+        """Return refresh counters and latency percentiles in milliseconds."""
+        with self._metrics_lock:
+            latencies = sorted(self._refresh_latencies)
+            successes = self._refresh_successes
+            failures = self._refresh_failures
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 1)
+
+        with self._sessions_lock:
+            tracked = len(self._sessions)
+
+        return {
+            "tracked_sessions": tracked,
+            "refresh_successes": successes,
+            "refresh_failures": failures,
+            "refresh_latency_p50_ms": percentile(0.5),
+            "refresh_latency_p95_ms": percentile(0.95),
+        }
+
+    def start(self):
+        """Start the background refresh worker if it is not already running."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stop the background refresh worker."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join()
+
+    def _run(self):
+        next_metrics_at = time.monotonic() + self.metrics_interval
+        while not self._stopped.is_set():
+            try:
+                wait = self.refresh_due()
+            except Exception:
+                logger.error("Token refresh worker iteration failed", exc_info=True)
+                wait = self.poll_interval
+            if time.monotonic() >= next_metrics_at:
+                logger.info(f"Token lifecycle: {json.dumps(self.metrics())}")
+                next_metrics_at = time.monotonic() + self.metrics_interval
+            self._wakeup.wait(timeout=wait)
+            self._wakeup.clear()
+
+    def _refresh(self, session_id: str, entry: _SessionEntry):
+        started = time.perf_counter()
+        try:
+            result = entry.refresher()
+        except Exception as e:
+            with self._metrics_lock:
+                self._refresh_failures += 1
+            with entry.lock:
+                tokens = entry.tokens
+                tokens.consecutive_failures += 1
+                tokens.last_error = str(e)
+                delay = min(self.retry_delay * (2 ** (tokens.consecutive_failures - 1)), self.max_retry_delay)
+                tokens.next_refresh_at = self.clock() + delay
+                attempt = tokens.consecutive_failures
+            logger.warning(f"Token refresh failed for session {session_id} (attempt {attempt}): {e}")
+            return
+
+        latency = time.perf_counter() - started
+        with self._metrics_lock:
+            self._refresh_successes += 1
+            self._refresh_latencies.append(latency)
+        with entry.lock:
+            tokens = entry.tokens
+            tokens.consecutive_failures = 0
+            tokens.last_error = None
+            tokens.refresh_count += 1
+            self._apply_result(tokens, result)
+        logger.info(f"Refreshed tokens for session {session_id} in {latency * 1000:.0f} ms")
+
+    def _apply_result(self, tokens: SessionTokens, result: Dict):
+        now = self.clock()
+        if result.get("access_token"):
+            tokens.graph_access_token = result["access_token"]
+            tokens.id_token = result.get("id_token") or tokens.id_token
+            tokens.graph_expires_at = now + int(result.get("expires_in") or 0)
+        if result.get("access_token_app"):
+            tokens.app_access_token = result["access_token_app"]
+            tokens.app_expires_at = now + int(result.get("expires_in_app") or 0)
+
+        expiries = [e for e in (tokens.graph_expires_at, tokens.app_expires_at) if e is not None]
+        if not expiries:
+            tokens.next_refresh_at = None
+            return
+
+        # Refresh ahead of the earliest expiry, spread out by jitter to avoid refresh storms across sessions. Tokens
+        # without a lifetime would otherwise be due again immediately, so refreshes are at least this far apart
+        tokens.next_refresh_at = max(
+            min(expiries) - self.refresh_margin - self.rng.uniform(0, self.jitter),
+            now + self.min_refresh_interval
+        )
+
+
+@lru_cache(maxsize=1)
+def get_token_lifecycle_manager() -> TokenLifecycleManager:
+    """Return the process-wide token lifecycle manager with its background worker started."""
+    manager = TokenLifecycleManager()
+    manager.start()
+    return manager
@@ -1,28 +1,33 @@
-import msal
 import logging
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict
+from .graph_client import get_user_profile
+from .token_cache import get_user_msal_app, load_user_token_cache, save_user_token_cache
 
 # Use the main logger for the application
 logger = logging.getLogger(__name__)
 
+# Shared pool used to run the post-login Graph lookup and application token acquisition concurrently
+_login_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="login")
+
 # Define a new class to represent a logged in Entra ID user
 class EntraUserAuth:
 
     MS_GRAPH_SCOPES = ["User.Read"]
 
-    def __init__(self, client_id: str, tenant_id: str, redirect_uri: str, client_secret: str):
+    def __init__(self, client_id: str, tenant_id: str, redirect_uri: str, client_secret: str,
+                 home_account_id: Optional[str] = None):
         self.client_id = client_id
         self.tenant_id = tenant_id
         self.authority = f"https://login.microsoftonline.com/{tenant_id}"
         self.redirect_uri = redirect_uri
+        self.home_account_id = home_account_id
         
-        # Configure as OAuth confidential client
-        self.app = msal.ConfidentialClientApplication(
-            client_id=client_id,
-            client_credential=client_secret,
-            authority=self.authority,
-        )
+        # Configure as OAuth confidential client bound to this user's token cache. Discovery is shared across the
+        # process and the cache is persisted so silent acquisition works across reruns
+        self.token_cache = load_user_token_cache(home_account_id)
+        self.app = get_user_msal_app(client_id, tenant_id, client_secret, self.token_cache)
     
     # Function that generates a login URL with the MS Graph API scopes the application is requesting the user's consent for
     def get_login_url(self) -> str:
@@ -46,12 +51,34 @@ class EntraUserAuth:
             # If an access token is returned, store it in the access token variable, make a call to the Microsoft Graph
             # API to retieve additional user attributes, and set the expires_in variable
             if "access_token" in result:
-                return {
+                # The cache was empty before the exchange so it holds exactly this user's account
+                accounts = self.app.get_accounts()
+                if accounts:
+                    self.home_account_id = accounts[0]["home_account_id"]
+
+                # The Graph lookup and the application token acquisition are independent, so run them concurrently
+                user_info_future = _login_executor.submit(self._get_user_info, result["access_token"])
+                app_token_future = _login_executor.submit(self._acquire_application_token)
+
+                user_info = user_info_future.result()
+                try:
+                    app_token = app_token_future.result()
+                except Exception as e:
+                    logger.error(f"Unable to obtain application access token during login: {e}", exc_info=True)
+                    app_token = None
+
+                save_user_token_cache(self.home_account_id, self.token_cache)
+
+                callback_result = {
                     "access_token": result["access_token"],
                     "id_token": result.get("id_token"), 
-                    "user_info": self._get_user_info(result["access_token"]),
-                    "expires_in": result.get("expires_in")
+                    "user_info": user_info,
+                    "expires_in": result.get("expires_in"),
+                    "home_account_id": self.home_account_id
                 }
+                if app_token:
+                    callback_result.update(app_token)
+                return callback_result
         
         except Exception as e:
             st.error(f"Authentication failed and unable to obtain access token for Microsoft Graph API: {e}")
@@ -62,49 +89,89 @@ class EntraUserAuth:
     def get_application_token(self) -> Optional[Dict]:
         """Get application access token for the application itself."""
         try:
-
-            # Get the cached account from a prior login
-            accounts = self.app.get_accounts()
-            if not accounts:
-                logger.error("No cached accounts found for silent token acquisition")
-                return None
-
-            account = accounts[0]
-
-            result = self.app.acquire_token_silent(
-                scopes=[f"api://{self.client_id}/user_impersonation"],
-                account=account
-            )
-
-            logging.info(f"This is the result: {result}")
-            
-            # If an access token is returned, store it in the access token variable, and set the expires_in variable
-            if "access_token" in result:
-                return {
-                    "access_token_app": result["access_token"],
-                    "expires_in_app": result.get("expires_in")
-                }
+            result = self._acquire_application_token()
+            save_user_token_cache(self.home_account_id, self.token_cache)
+            return result
             
         except Exception as e:
             st.error(f"Authentication failed and unable to obtain application access token: {e}")
         
         return None
 
+    # Silently acquire the application token from the cached account. Safe to call from worker threads
+    def _acquire_application_token(self) -> Optional[Dict]:
+        """Acquire the application access token without touching Streamlit or persisting the cache."""
+        # Get the cached account for this user from a prior login
+        account = self._get_account()
+        if not account:
+            logger.error("No cached account found for silent token acquisition")
+            return None
+
+        result = self.app.acquire_token_silent(
+            scopes=[f"api://{self.client_id}/user_impersonation"],
+            account=account
+        )
+        if not result:
+            logger.error("Silent token acquisition returned no token for the cached account")
+            return None
+
+        # If an access token is returned, store it in the access token variable, and set the expires_in variable
+        if "access_token" in result:
+            return {
+                "access_token_app": result["access_token"],
+                "expires_in_app": result.get("expires_in")
+            }
+        return None
+
+    # Function that silently refreshes the Graph, ID and application tokens ahead of their expiry
+    def refresh_tokens(self) -> Dict:
+        """
+        Force a silent refresh of the user's tokens using the cached refresh token.
+
+        Only the in-memory token cache is updated; callers on the script thread persist it with
+        save_user_token_cache. Raises RuntimeError if either token cannot be refreshed.
+        """
+        account = self._get_account()
+        if not account:
+            raise RuntimeError("No cached account found for silent token refresh")
+
+        graph_result = self.app.acquire_token_silent_with_error(
+            scopes=self.MS_GRAPH_SCOPES,
+            account=account,
+            force_refresh=True
+        )
+        if not graph_result or "access_token" not in graph_result:
+            raise RuntimeError(
+                f"Silent refresh of the Microsoft Graph token failed: {(graph_result or {}).get('error_description')}"
+            )
+
+        app_result = self.app.acquire_token_silent_with_error(
+            scopes=[f"api://{self.client_id}/user_impersonation"],
+            account=account,
+            force_refresh=True
+        )
+        if not app_result or "access_token" not in app_result:
+            raise RuntimeError(
+                f"Silent refresh of the application token failed: {(app_result or {}).get('error_description')}"
+            )
+
+        return {
+            "access_token": graph_result["access_token"],
+            "id_token": graph_result.get("id_token"),
+            "expires_in": graph_result.get("expires_in"),
+            "access_token_app": app_result["access_token"],
+            "expires_in_app": app_result.get("expires_in")
+        }
+
+    # Select the user's account from the token cache by home account id
+    def _get_account(self) -> Optional[Dict]:
+        """Return the cached MSAL account for this user."""
+        if not self.home_account_id:
+            return None
+        accounts = self.app.get_accounts()
+        return next((a for a in accounts if a.get("home_account_id") == self.home_account_id), None)
+
     # Use the access token the application has obtained to query the MS Graph for additional user attributes
     def _get_user_info(self, access_token: str) -> Dict:
         """Get additional user attributes for the user from the Microsoft Graph API"""
-        import requests
-        
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(
-            "https://graph.microsoft.com/v1.0/me",
-            headers=headers
-        )
-        
-        if response.status_code == 200:
-            user_data = response.json()
-            
-            # Log the user attributes returned by the Microsoft Graph API
-            logger.info(f"Microsoft Graph user properties: {list(user_data.keys())}")
-            return user_data
-        return {}
\ No newline at end of file
+        return get_user_profile(access_token, cache_key=self.home_account_id)
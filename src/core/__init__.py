@@ -3,9 +3,11 @@ Core chatbot functionality including chat operations and authentication.
 """
 
 from .chat import ChatMessage, get_streaming_chat_completion, get_chat_completion
+from .client import create_azure_client
 
 __all__ = [
     'ChatMessage', 
     'get_streaming_chat_completion',
-    'get_chat_completion'
+    'get_chat_completion',
+    'create_azure_client'
 ]
\ No newline at end of file
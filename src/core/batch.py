@@ -0,0 +1,277 @@
+"""
+Headless batch runner which sends prompts from a JSONL file through the chat core without a Streamlit runtime.
+
+Each input line is a JSON object:
+    {"id": "q1", "prompt": "...", "image_path": "img.png", "image_detail": "low", "model": "gpt-4o", "max_tokens": 500}
+Only "prompt" is required. Rows without an "id" are identified by their line number.
+
+Results are appended to the output JSONL file as each prompt finishes. Rows that already have a successful result in
+the output file are skipped, so an interrupted run can be resumed by running the same command again.
+
+With a usage ledger every completion is recorded against the user of the security context, and a row whose user or
+tenant has used up its budget fails without being sent; it runs again on a resume once the budget allows.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+import openai
+
+from .chat import get_chat_completion, setup_assistant
+from .messages import create_user_message_text_only, create_user_message_with_image
+from .usage_ledger import BudgetExceededError
+from ..utils.image_processor import process_image
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+# Errors which are worth retrying; anything else is recorded as a failed row straight away
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+@dataclass
+class BatchOptions:
+    """Options for a batch run"""
+
+    default_model: str = "gpt-35-turbo"
+    default_max_tokens: int = 1000
+    system_prompt: str = "You are a helpful assistant"
+    concurrency: int = 4
+    requests_per_minute: Optional[float] = None
+    max_retries: int = 5
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 60.0
+
+
+class RateLimiter:
+    """Thread-safe limiter which spaces request starts evenly to stay under a requests per minute limit"""
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def read_batch_rows(input_path: Path) -> Iterator[Dict]:
+    """
+    Yield the rows of a JSONL prompt file, assigning line numbers as ids where none are given.
+
+    A line which is not a JSON object is yielded as a row with a parse_error, so it is recorded as a failed row
+    instead of ending the run.
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = {"parse_error": f"line {line_number} is not valid JSON: {e}"}
+            if not isinstance(row, dict):
+                row = {"parse_error": f"line {line_number} is not a JSON object"}
+            row.setdefault("id", str(line_number))
+            yield row
+
+
+def load_completed_ids(output_path: Path) -> Set[str]:
+    """Return the ids of rows which already have a successful result in the output file."""
+    completed = set()
+    if not output_path.exists():
+        return completed
+
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run; the row will be run again
+                continue
+            if result.get("error") is None:
+                completed.add(str(result.get("id")))
+    return completed
+
+
+def open_results_file(output_path: Path):
+    """
+    Open the results file for appending. A partially written last line from an interrupted run is terminated first,
+    so the next result starts on a line of its own.
+    """
+    if output_path.exists() and output_path.stat().st_size:
+        with open(output_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    return open(output_path, "a", encoding="utf-8")
+
+
+def build_messages(row: Dict, base_dir: Path, system_prompt: str) -> list:
+    """Build the message list for a batch row in the same format the chat UI uses."""
+    if "parse_error" in row:
+        raise ValueError(row["parse_error"])
+    prompt = row["prompt"]
+    image_path = row.get("image_path")
+    if image_path:
+        image_bytes = (base_dir / image_path).read_bytes()
+        image_detail = row.get("image_detail", "low")
+        user_message = create_user_message_with_image(prompt, process_image(image_bytes, image_detail), image_detail)
+    else:
+        user_message = create_user_message_text_only(prompt)
+
+    return [setup_assistant(row.get("system_prompt", system_prompt)), user_message]
+
+
+def run_row(client, row: Dict, base_dir: Path, options: BatchOptions, rate_limiter: RateLimiter,
+            security_context=None, usage_ledger=None) -> Dict:
+    """Run a single batch row with retries and return its result record."""
+    model = row.get("model", options.default_model)
+    result = {"id": row["id"], "model": model}
+
+    try:
+        messages = build_messages(row, base_dir, options.system_prompt)
+    except (KeyError, OSError, ValueError) as e:
+        result["error"] = f"Invalid row: {e}"
+        return result
+
+    if usage_ledger is not None:
+        try:
+            usage_ledger.check_budget(security_context)
+        except BudgetExceededError as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            return result
+
+    started = time.perf_counter()
+    for attempt in range(options.max_retries + 1):
+        rate_limiter.acquire()
+        try:
+            chat_message = get_chat_completion(
+                client=client,
+                deployment_name=model,
+                messages=messages,
+                max_tokens=row.get("max_tokens", options.default_max_tokens),
+                security_context=security_context
+            )
+            if usage_ledger is not None:
+                usage_ledger.record_completion(security_context, model, chat_message)
+            result.update({
+                "response": chat_message.full_response,
+                "prompt_tokens": chat_message.prompt_tokens,
+                "completion_tokens": chat_message.completion_tokens,
+                "total_tokens": chat_message.total_tokens,
+                "cached_tokens": chat_message.cached_tokens,
+                "attempts": attempt + 1,
+                "latency_ms": round((time.perf_counter() - started) * 1000),
+                "error": None
+            })
+            return result
+        except RETRYABLE_ERRORS as e:
+            if attempt == options.max_retries:
+                result["error"] = f"{type(e).__name__}: {e}"
+                break
+            # Exponential backoff with full jitter so workers do not retry in lockstep
+            delay = random.uniform(0, min(options.retry_max_delay, options.retry_base_delay * (2 ** attempt)))
+            logger.warning(f"Row {row['id']} failed with {type(e).__name__}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+        except openai.APIError as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            break
+        except Exception as e:
+            # For example a response without usage; the row fails but the rest of the run carries on
+            logger.error(f"Row {row['id']} failed", exc_info=True)
+            result["error"] = f"{type(e).__name__}: {e}"
+            break
+
+    result["attempts"] = attempt + 1
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000)
+    return result
+
+
+def run_batch(client, input_path, output_path, options: Optional[BatchOptions] = None, security_context=None,
+              usage_ledger=None) -> Dict:
+    """
+    Run every pending row of a JSONL prompt file and append the results to the output file as they finish.
+
+    Args:
+        client: Azure OpenAI client created with create_azure_client
+        input_path: Path of the JSONL prompt file
+        output_path: Path of the JSONL results file; existing successful results are skipped
+        options: Concurrency, rate limit, retry and default model settings
+        security_context: Optional UserSecurityContext sent with every request
+        usage_ledger: Optional UsageLedger the completions are recorded in and the budgets checked against
+
+    Returns:
+        dict: Counts of succeeded, failed and skipped rows
+    """
+    options = options or BatchOptions()
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    base_dir = input_path.parent
+
+    completed_ids = load_completed_ids(output_path)
+    if completed_ids:
+        logger.info(f"Resuming batch run; skipping {len(completed_ids)} completed rows")
+
+    rate_limiter = RateLimiter(options.requests_per_minute)
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+
+    # Keep a bounded number of rows in flight so large input files are never fully loaded into memory
+    max_in_flight = options.concurrency * 2
+    # Row id of each future, so a row whose worker raised is still recorded
+    in_flight = {}
+
+    def write_results(done, out):
+        for future in done:
+            row_id = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Row {row_id} failed", exc_info=True)
+                result = {"id": row_id, "error": f"{type(e).__name__}: {e}"}
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            counts["failed" if result.get("error") else "succeeded"] += 1
+
+    with ThreadPoolExecutor(max_workers=options.concurrency, thread_name_prefix="batch") as executor, \
+            open_results_file(output_path) as out:
+        for row in read_batch_rows(input_path):
+            if str(row["id"]) in completed_ids:
+                counts["skipped"] += 1
+                continue
+
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                write_results(done, out)
+
+            future = executor.submit(
+                run_row, client, row, base_dir, options, rate_limiter, security_context, usage_ledger
+            )
+            in_flight[future] = row["id"]
+
+        done, _ = wait(in_flight)
+        write_results(done, out)
+
+    logger.info(f"Batch run finished: {counts}")
+    return counts
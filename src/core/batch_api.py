@@ -0,0 +1,259 @@
+"""
+Azure OpenAI Batch API mode for large offline workloads.
+
+Rows in the same JSONL format as the batch runner are packed into Batch API input files, split so no file exceeds
+the request count or size limits, uploaded and submitted as batch jobs. Jobs are polled with backoff and their
+output and error files are streamed back into the results file, matched to the input rows by custom_id.
+
+Submitted jobs are recorded in a state file next to the results file, so an interrupted run resumes polling the
+existing jobs instead of submitting the prompts again.
+
+With a usage ledger the budget of the security context's user is checked before any job is submitted, and each
+completion is recorded as its result is written.
+"""
+
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .batch import BatchOptions, build_messages, load_completed_ids, open_results_file, read_batch_rows
+from .chat import ChatMessage
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+# Azure OpenAI Batch API limits for a single input file
+MAX_REQUESTS_PER_FILE = 100_000
+MAX_FILE_BYTES = 200 * 1024 * 1024
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_request(row: Dict, base_dir: Path, options: BatchOptions, security_context=None) -> Dict:
+    """Build a single Batch API request line for a batch row."""
+    body = {
+        "model": row.get("model", options.default_model),
+        "messages": build_messages(row, base_dir, options.system_prompt),
+        "max_tokens": row.get("max_tokens", options.default_max_tokens),
+    }
+    if security_context:
+        body["user_security_context"] = security_context.to_dict()
+
+    return {
+        "custom_id": str(row["id"]),
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": body,
+    }
+
+
+def pack_batch_files(requests: Iterator[Dict], directory: Path,
+                     max_requests: int = MAX_REQUESTS_PER_FILE, max_bytes: int = MAX_FILE_BYTES) -> List[Path]:
+    """
+    Write Batch API requests into as many JSONL input files as needed to stay under the per-file limits.
+
+    A batch job runs against a single deployment, so requests are grouped by their model and every file holds
+    requests for one model only.
+
+    Returns:
+        list: Paths of the input files written
+    """
+    paths = []
+    # Open file, request count and size of the file currently being filled for each model
+    open_files: Dict[str, list] = {}
+
+    try:
+        for request in requests:
+            line = (json.dumps(request) + "\n").encode("utf-8")
+            if len(line) > max_bytes:
+                raise ValueError(f"Request {request['custom_id']} is larger than the batch file size limit")
+
+            model = request["body"]["model"]
+            current = open_files.get(model)
+            if current is None or current[1] >= max_requests or current[2] + len(line) > max_bytes:
+                if current is not None:
+                    current[0].close()
+                path = directory / f"batch_input_{len(paths):04d}.jsonl"
+                paths.append(path)
+                current = open_files[model] = [open(path, "wb"), 0, 0]
+
+            current[0].write(line)
+            current[1] += 1
+            current[2] += len(line)
+    finally:
+        for out, _, _ in open_files.values():
+            out.close()
+
+    return paths
+
+
+def submit_batch_file(client, path: Path, completion_window: str = "24h") -> str:
+    """Upload a Batch API input file and create a batch job for it. Returns the batch id."""
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/chat/completions",
+        completion_window=completion_window
+    )
+    logger.info(f"Submitted batch {batch.id} for {path.name}")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id: str, initial_interval: float = 5, max_interval: float = 300,
+                   backoff: float = 1.5, sleep: Callable[[float], None] = time.sleep):
+    """Poll a batch job with exponential backoff until it reaches a terminal status and return it."""
+    interval = initial_interval
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            logger.info(f"Batch {batch_id} finished with status {batch.status}")
+            return batch
+
+        counts = batch.request_counts
+        if counts is not None:
+            logger.info(f"Batch {batch_id} is {batch.status}: {counts.completed}/{counts.total} requests completed")
+        sleep(interval)
+        interval = min(interval * backoff, max_interval)
+
+
+def iter_batch_file_lines(client, file_id: Optional[str]) -> Iterator[Dict]:
+    """Stream the JSON lines of a Batch API output or error file."""
+    if not file_id:
+        return
+    content = client.files.content(file_id)
+    for line in content.iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+def to_result_record(line: Dict) -> Dict:
+    """Convert a Batch API output or error line into the results format used by the batch runner."""
+    result = {"id": line.get("custom_id"), "error": None}
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+
+    if line.get("error") or response.get("status_code", 200) >= 400:
+        error = line.get("error") or body.get("error") or {}
+        result["error"] = f"{error.get('code')}: {error.get('message')}"
+        return result
+
+    usage = body.get("usage") or {}
+    choices = body.get("choices") or [{}]
+    result.update({
+        "model": body.get("model"),
+        "response": (choices[0].get("message") or {}).get("content"),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+    })
+    return result
+
+
+def _load_state(state_path: Path) -> Dict:
+    if state_path.exists():
+        return json.loads(state_path.read_text(encoding="utf-8"))
+    return {"pending_batches": []}
+
+
+def _save_state(state_path: Path, state: Dict):
+    tmp_path = state_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state), encoding="utf-8")
+    tmp_path.replace(state_path)
+
+
+def run_batch_api(client, input_path, output_path, options: Optional[BatchOptions] = None, security_context=None,
+                  poll_max_interval: float = 300, completion_window: str = "24h", usage_ledger=None) -> Dict:
+    """
+    Run every pending row of a JSONL prompt file through the Azure OpenAI Batch API.
+
+    Args:
+        client: Azure OpenAI client created with create_azure_client
+        input_path: Path of the JSONL prompt file
+        output_path: Path of the JSONL results file; existing successful results are skipped
+        options: Default model, max tokens and system prompt settings
+        security_context: Optional UserSecurityContext sent with every request
+        poll_max_interval: Upper bound in seconds for the polling backoff
+        completion_window: Batch API completion window
+        usage_ledger: Optional UsageLedger the completions are recorded in and the budgets checked against
+
+    Returns:
+        dict: Counts of succeeded, failed and skipped rows and the number of batches run
+    """
+    options = options or BatchOptions()
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    state_path = output_path.with_name(output_path.name + ".batches.json")
+    base_dir = input_path.parent
+
+    completed_ids = load_completed_ids(output_path)
+    state = _load_state(state_path)
+    counts = {"succeeded": 0, "failed": 0, "skipped": len(completed_ids), "batches": 0}
+
+    # Only submit new jobs if no jobs from an earlier run are still outstanding
+    if not state["pending_batches"]:
+        # Jobs cannot be stopped part way, so the budget is checked once before anything is submitted
+        if usage_ledger is not None:
+            usage_ledger.check_budget(security_context)
+        invalid_rows = []
+
+        def pending_requests():
+            for row in read_batch_rows(input_path):
+                if str(row["id"]) in completed_ids:
+                    continue
+                try:
+                    yield build_batch_request(row, base_dir, options, security_context)
+                except (KeyError, OSError, ValueError) as e:
+                    invalid_rows.append({"id": row["id"], "error": f"Invalid row: {e}"})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_files = pack_batch_files(pending_requests(), Path(tmp_dir))
+
+            with open_results_file(output_path) as out:
+                for result in invalid_rows:
+                    out.write(json.dumps(result) + "\n")
+            counts["failed"] += len(invalid_rows)
+
+            for path in input_files:
+                state["pending_batches"].append(submit_batch_file(client, path, completion_window))
+                _save_state(state_path, state)
+    else:
+        logger.info(f"Resuming {len(state['pending_batches'])} outstanding batches")
+
+    with open_results_file(output_path) as out:
+        for batch_id in list(state["pending_batches"]):
+            batch = wait_for_batch(client, batch_id, max_interval=poll_max_interval)
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                for line in iter_batch_file_lines(client, file_id):
+                    result = to_result_record(line)
+                    # A run interrupted while streaming this batch already wrote part of it
+                    if result["id"] in completed_ids:
+                        continue
+                    out.write(json.dumps(result) + "\n")
+                    if result["error"]:
+                        counts["failed"] += 1
+                    else:
+                        completed_ids.add(result["id"])
+                        counts["succeeded"] += 1
+                        if usage_ledger is not None:
+                            usage_ledger.record_completion(security_context, result["model"], ChatMessage(
+                                result["response"], result["prompt_tokens"], result["completion_tokens"],
+                                result["total_tokens"], result["cached_tokens"]
+                            ))
+                out.flush()
+
+            if batch.status != "completed":
+                logger.error(f"Batch {batch_id} ended with status {batch.status}; unfinished rows will run on resume")
+
+            state["pending_batches"].remove(batch_id)
+            _save_state(state_path, state)
+            counts["batches"] += 1
+
+    state_path.unlink(missing_ok=True)
+    logger.info(f"Batch API run finished: {counts}")
+    return counts
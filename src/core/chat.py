@@ -1,12 +1,24 @@
-import streamlit as st
+import socket
+import threading
 
 # Class to support completion and token usage
 class ChatMessage:
-    def __init__(self, full_response, prompt_tokens, completion_tokens, total_tokens):
+    def __init__(self, full_response, prompt_tokens, completion_tokens, total_tokens, cached_tokens=0,
+                 cancelled=False, usage_estimated=False):
         self.full_response = full_response
         self.prompt_tokens = prompt_tokens
         self.completion_tokens = completion_tokens
         self.total_tokens = total_tokens
+        # Prompt tokens served from the prompt cache
+        self.cached_tokens = cached_tokens
+        # Set when generation was stopped before the end; the usage is then estimated locally
+        self.cancelled = cancelled
+        self.usage_estimated = usage_estimated
+
+# Get the number of prompt tokens served from the prompt cache from a usage object
+def get_cached_tokens(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
 
 # Setup assistant
 def setup_assistant(system_prompt: str = "You are a helpful assistant"):
@@ -17,8 +29,70 @@ def setup_assistant(system_prompt: str = "You are a helpful assistant"):
     
     return message
 
-# Streaming chat completions
-async def get_streaming_chat_completion(client, deployment_name, messages, max_tokens, security_context=None):
+# Rough token estimate of roughly four characters per token, used when the service never reported usage
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+# Build the ChatMessage for a stream that was stopped before the service sent its usage chunk
+def build_cancelled_chat_message(messages, partial_response):
+    prompt_text = ""
+    for message in messages:
+        if isinstance(message["content"], str):
+            prompt_text += message["content"]
+        else:
+            prompt_text += "".join(item.get("text", "") for item in message["content"] if item["type"] == "text")
+
+    p_tokens = estimate_tokens(prompt_text)
+    c_tokens = estimate_tokens(partial_response)
+    return ChatMessage(partial_response, p_tokens, c_tokens, p_tokens + c_tokens, cancelled=True, usage_estimated=True)
+
+# Event which also calls callbacks when it is set, so a cancel can act from the cancelling thread
+class CancelEvent(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Call callback once the event is set, straight away if it already is. Returns a function removing it."""
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard_callback(callback)
+        callback()
+        return lambda: None
+
+    def _discard_callback(self, callback):
+        with self._callbacks_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def set(self):
+        with self._callbacks_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+# Shut down the socket under a streaming response so a read blocked on it, for example while waiting for the first
+# token, returns straight away. Closing the response from another thread does not wake a blocked read
+def abort_streaming_response(response):
+    http_response = getattr(response, "response", None)
+    network_stream = http_response.extensions.get("network_stream") if http_response is not None else None
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is None:
+        return
+    try:
+        # The plain socket method is used for TLS sockets too, leaving the TLS state to the reading thread
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+# Stream a chat completion, yielding the content delta (or None) and the usage (or None) of each chunk.
+# The stream stops as soon as cancel_event is set: a CancelEvent aborts the connection from the cancelling thread,
+# any other event is checked between chunks. The upstream response is always closed when the generator finishes or
+# is closed, so the connection goes back to the pool instead of reading tokens nobody will see
+def iter_streaming_chat_completion(client, deployment_name, messages, max_tokens, security_context=None, cancel_event=None):
     extra_body = {"user_security_context": security_context.to_dict()} if security_context else {}
     
     response = client.chat.completions.create(
@@ -31,40 +105,86 @@ async def get_streaming_chat_completion(client, deployment_name, messages, max_t
         },
         extra_body=extra_body
     )
-    assistant_message = st.chat_message("assistant")
+
+    # Once the generator has finished the connection may already serve another request, so it is no longer aborted
+    abort_lock = threading.Lock()
+    finished = False
+
+    def abort():
+        with abort_lock:
+            if not finished:
+                abort_streaming_response(response)
+
+    remove_abort = None
+    if isinstance(cancel_event, CancelEvent):
+        remove_abort = cancel_event.add_callback(abort)
+
+    try:
+        for chunk in response:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            content = None
+            if hasattr(chunk, 'choices') and chunk.choices:
+                content = chunk.choices[0].delta.content
+            yield content, chunk.usage
+    except Exception:
+        # A read interrupted by a cancel fails with a connection error; the stream simply ends
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        raise
+    finally:
+        if remove_abort is not None:
+            remove_abort()
+        with abort_lock:
+            finished = True
+        response.close()
+
+# Streaming chat completions. Each piece of content is passed to on_content with the response received so far;
+# without a callback the response is rendered into a Streamlit assistant chat message
+async def get_streaming_chat_completion(client, deployment_name, messages, max_tokens, security_context=None, on_content=None, cancel_event=None):
+    stream = iter_streaming_chat_completion(client, deployment_name, messages, max_tokens, security_context, cancel_event)
     full_response = ""
 
-    with assistant_message:
-        message_placeholder = st.empty()
+    if on_content is None:
+        # Imported here so the chat core can be used without a Streamlit runtime
+        import streamlit as st
+
+        assistant_message = st.chat_message("assistant")
+        with assistant_message:
+            message_placeholder = st.empty()
+        on_content = message_placeholder.markdown
 
     # Intialize token counts
     t_tokens = 0
     c_tokens = 0
     p_tokens = 0
-    usage_dict = None
-
-    
-    for chunk in response:
-        
-        # Extract token metrics from each chunk
-        if chunk.usage:
-            usage_dict = chunk.usage
-            if p_tokens == 0:
-                p_tokens = usage_dict.prompt_tokens
-                c_tokens = usage_dict.completion_tokens
-                t_tokens = usage_dict.total_tokens
-
-        # Extract the content from each chunk and display it in the chat
-        if hasattr(chunk, 'choices') and chunk.choices:
-            content = chunk.choices[0].delta.content
+    cached_tokens = 0
+
+    try:
+        for content, usage in stream:
+            
+            # Extract token metrics from each chunk
+            if usage and p_tokens == 0:
+                p_tokens = usage.prompt_tokens
+                c_tokens = usage.completion_tokens
+                t_tokens = usage.total_tokens
+                cached_tokens = get_cached_tokens(usage)
+
+            # Extract the content from each chunk and display it in the chat
             if content is not None:
                 full_response += content
-                message_placeholder.markdown(full_response)
+                on_content(full_response)
+    finally:
+        # Close the upstream stream right away if the loop was interrupted, for example by a Streamlit rerun
+        stream.close()
+
+    if cancel_event is not None and cancel_event.is_set() and p_tokens == 0:
+        return build_cancelled_chat_message(messages, full_response)
 
     if full_response == "":
         full_response = "Sorry, I was unable to generate a response."
 
-    return ChatMessage(full_response, p_tokens, c_tokens, t_tokens)
+    return ChatMessage(full_response, p_tokens, c_tokens, t_tokens, cached_tokens)
 
 # Non-streaming chat completion
 def get_chat_completion(client, deployment_name, messages, max_tokens, security_context=None):
@@ -83,8 +203,9 @@ def get_chat_completion(client, deployment_name, messages, max_tokens, security_
         p_tokens = response.usage.prompt_tokens
         c_tokens = response.usage.completion_tokens
         t_tokens = response.usage.total_tokens
+        cached_tokens = get_cached_tokens(response.usage)
 
-        return ChatMessage(full_response, p_tokens, c_tokens, t_tokens)
+        return ChatMessage(full_response, p_tokens, c_tokens, t_tokens, cached_tokens)
     else:
 
         full_response = "Sorry, I was unable to generate a response."
@@ -0,0 +1,26 @@
+import os
+from functools import lru_cache
+
+import httpx
+from openai import DEFAULT_MAX_RETRIES, AzureOpenAI
+
+# Shared HTTP client so every Azure OpenAI client reuses the same connection pool. Streams that are stopped early
+# are closed, which returns their connection to this pool
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """Return the process-wide HTTP client used for Azure OpenAI requests."""
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60),
+        timeout=httpx.Timeout(600.0, connect=5.0)
+    )
+
+# Create and return an Azure OpenAI client. Callers with their own retry loop pass max_retries=0
+def create_azure_client(token_provider, max_retries: int = DEFAULT_MAX_RETRIES):
+    """Create and return an Azure OpenAI client."""
+    return AzureOpenAI(
+        api_version=os.environ.get("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
+        azure_ad_token_provider=token_provider,
+        http_client=get_http_client(),
+        max_retries=max_retries
+    )
@@ -0,0 +1,115 @@
+"""
+Side-by-side comparison of several model deployments for the same prompt.
+
+Each deployment is streamed on its own worker thread so the total wait is the slowest model rather than the sum of
+all of them. Workers never touch Streamlit; they publish events to a queue which the caller drains on the script
+thread to update the UI.
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from .chat import (
+    CancelEvent, ChatMessage, build_cancelled_chat_message, get_cached_tokens, iter_streaming_chat_completion
+)
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelComparisonResult:
+    """Outcome and latency metrics of one deployment in a comparison"""
+
+    deployment_name: str
+    chat_message: Optional[ChatMessage] = None
+    time_to_first_token: Optional[float] = None
+    total_latency: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ComparisonEvent:
+    """Progress update from a comparison worker. result is only set on the final event of a deployment"""
+
+    deployment_name: str
+    full_response: str = ""
+    result: Optional[ModelComparisonResult] = None
+
+
+def _stream_deployment(client, deployment_name, messages, max_tokens, security_context, events: queue.Queue,
+                       cancel_event: threading.Event):
+    result = ModelComparisonResult(deployment_name=deployment_name)
+    started = time.perf_counter()
+    full_response = ""
+    p_tokens = c_tokens = t_tokens = cached_tokens = 0
+
+    try:
+        for content, usage in iter_streaming_chat_completion(
+            client, deployment_name, messages, max_tokens, security_context, cancel_event
+        ):
+            if usage and p_tokens == 0:
+                p_tokens = usage.prompt_tokens
+                c_tokens = usage.completion_tokens
+                t_tokens = usage.total_tokens
+                cached_tokens = get_cached_tokens(usage)
+
+            if content:
+                if result.time_to_first_token is None:
+                    result.time_to_first_token = time.perf_counter() - started
+                full_response += content
+                events.put(ComparisonEvent(deployment_name, full_response))
+
+        if cancel_event.is_set() and p_tokens == 0:
+            result.chat_message = build_cancelled_chat_message(messages, full_response)
+        else:
+            result.chat_message = ChatMessage(
+                full_response or "Sorry, I was unable to generate a response.", p_tokens, c_tokens, t_tokens, cached_tokens
+            )
+    except Exception as e:
+        logger.error(f"Comparison request to {deployment_name} failed", exc_info=True)
+        result.error = str(e)
+    finally:
+        result.total_latency = time.perf_counter() - started
+        events.put(ComparisonEvent(deployment_name, full_response, result))
+
+
+def compare_models(client, deployment_names: List[str], messages, max_tokens,
+                   security_context=None) -> Iterator[ComparisonEvent]:
+    """
+    Send the same messages to several deployments concurrently and yield their progress as it arrives.
+
+    Args:
+        client: Azure OpenAI client
+        deployment_names: Deployments to compare
+        messages: Message list sent to every deployment
+        max_tokens: Maximum completion tokens for each deployment
+        security_context: Optional UserSecurityContext sent with every request
+
+    Yields:
+        ComparisonEvent: Partial responses and, once per deployment, the final result
+    """
+    events = queue.Queue()
+    cancel_event = CancelEvent()
+    for deployment_name in deployment_names:
+        threading.Thread(
+            target=_stream_deployment,
+            args=(client, deployment_name, messages, max_tokens, security_context, events, cancel_event),
+            name=f"compare-{deployment_name}",
+            daemon=True
+        ).start()
+
+    remaining = len(deployment_names)
+    try:
+        while remaining:
+            event = events.get()
+            if event.result is not None:
+                remaining -= 1
+            yield event
+    finally:
+        # If the consumer stops early (a Streamlit rerun or stop), stop the workers and close their upstream streams
+        cancel_event.set()
@@ -0,0 +1,127 @@
+"""
+Conversation compaction which keeps the message list friendly to prompt caching.
+
+Messages are laid out as a stable prefix followed by the recent turns:
+
+    [system prompt, conversation summary (optional), recent turns...]
+
+When the conversation grows past the threshold, only the turns being dropped are summarized and the new summary
+text is appended to the end of the existing summary. The system prompt and the existing summary therefore never
+change, so every request shares the longest possible prefix with the ones before it.
+
+Appending alone would let the summary grow without bound, so once it passes max_summary_tokens it is rewritten into
+a shorter summary. That changes the prefix once, after which it is stable again until the next rewrite.
+"""
+
+import logging
+
+from .chat import ChatMessage, estimate_tokens, get_chat_completion
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Summary of the earlier conversation with the user:"
+
+SUMMARY_INSTRUCTION = (
+    "Summarize the conversation you've had with the user since the last summary. "
+    "Ensure you keep the most important points."
+)
+
+CONDENSE_INSTRUCTION = (
+    "The summary of the conversation so far has grown too long. Rewrite it as a shorter summary. "
+    "Ensure you keep the most important points."
+)
+
+
+def is_summary_message(message) -> bool:
+    """Return True if the message holds the running conversation summary."""
+    return (
+        message.get("role") == "system"
+        and isinstance(message.get("content"), str)
+        and message["content"].startswith(SUMMARY_HEADER)
+    )
+
+
+def split_conversation(messages):
+    """
+    Split a message list into its system prompt, summary message and remaining turns.
+
+    Returns:
+        tuple: (system message, summary message or None, list of turns)
+    """
+    system_message = messages[0]
+    if len(messages) > 1 and is_summary_message(messages[1]):
+        return system_message, messages[1], messages[2:]
+    return system_message, None, messages[1:]
+
+
+def combine_usage(first, second):
+    """Return a ChatMessage with the response of second and the token usage of both requests."""
+    return ChatMessage(
+        second.full_response,
+        first.prompt_tokens + second.prompt_tokens,
+        first.completion_tokens + second.completion_tokens,
+        first.total_tokens + second.total_tokens,
+        first.cached_tokens + second.cached_tokens
+    )
+
+
+def compact_conversation(client, deployment_name, messages, max_tokens, security_context=None,
+                         max_messages=7, keep_recent=2, max_summary_tokens=2000):
+    """
+    Summarize older turns into the running summary once the conversation exceeds max_messages.
+
+    Args:
+        client: Azure OpenAI client
+        deployment_name: Deployment used to write the summary
+        messages (list): Current message list, starting with the system prompt
+        max_tokens (int): Maximum tokens for the summary
+        security_context: Optional UserSecurityContext
+        max_messages (int): Message count above which the conversation is compacted
+        keep_recent (int): Number of most recent messages kept verbatim
+        max_summary_tokens (int): Estimated summary size above which the summary is rewritten shorter
+
+    Returns:
+        tuple: (new message list, ChatMessage with the usage of the summary requests or None if nothing was
+            compacted)
+    """
+    if len(messages) <= max_messages:
+        return messages, None
+
+    logger.info("Conversation has exceeded maximum threshold. Summarizing conversation...")
+    system_message, summary_message, turns = split_conversation(messages)
+    older_turns, recent_turns = turns[:-keep_recent], turns[-keep_recent:]
+
+    # The summary request starts with the same prefix as the chat requests so it is served from the cache too
+    prefix = [system_message] + ([summary_message] if summary_message else [])
+    chat_message = get_chat_completion(
+        client=client,
+        deployment_name=deployment_name,
+        messages=prefix + older_turns + [{"role": "user", "content": SUMMARY_INSTRUCTION}],
+        max_tokens=max_tokens,
+        security_context=security_context
+    )
+
+    # Only ever append to the summary so the cached prefix stays valid
+    if summary_message:
+        summary_content = f"{summary_message['content']}\n\n{chat_message.full_response}"
+    else:
+        summary_content = f"{SUMMARY_HEADER}\n{chat_message.full_response}"
+
+    if estimate_tokens(summary_content) > max_summary_tokens:
+        logger.info("Conversation summary has exceeded maximum size. Condensing summary...")
+        condense_message = get_chat_completion(
+            client=client,
+            deployment_name=deployment_name,
+            messages=[
+                system_message,
+                {"role": "system", "content": summary_content},
+                {"role": "user", "content": CONDENSE_INSTRUCTION}
+            ],
+            max_tokens=max_tokens,
+            security_context=security_context
+        )
+        summary_content = f"{SUMMARY_HEADER}\n{condense_message.full_response}"
+        chat_message = combine_usage(chat_message, condense_message)
+
+    return [system_message, {"role": "system", "content": summary_content}] + recent_turns, chat_message
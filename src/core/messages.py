@@ -0,0 +1,46 @@
+"""
+Builders for the chat messages sent to the Azure OpenAI chat completions API.
+"""
+
+
+def create_user_message_with_image(prompt, base64_data, image_detail):
+    """
+    Create a user message dictionary that includes both text and image.
+    
+    Args:
+        prompt (str): The text prompt from the user
+        base64_data (str): Base64 encoded image data
+        image_detail (str): Image detail level ("low" or "high")
+        
+    Returns:
+        dict: Formatted message dictionary for OpenAI API
+    """
+    return {
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": prompt
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/png;base64,{base64_data}",
+                    "detail": image_detail
+                }
+            }
+        ]
+    }
+
+
+def create_user_message_text_only(prompt):
+    """
+    Create a simple text-only user message.
+    
+    Args:
+        prompt (str): The text prompt from the user
+        
+    Returns:
+        dict: Formatted message dictionary
+    """
+    return {"role": "user", "content": prompt}
@@ -0,0 +1,145 @@
+"""
+Prompt cache hit tracking per deployment.
+
+Azure OpenAI serves repeated prompt prefixes from a cache and reports them as cached prompt tokens. These stats
+record the share of prompt tokens that were cached, per deployment and per time bucket, so changes to the message
+layout can be checked against the hit ratio over time. Completed buckets are logged periodically with the cumulative
+totals of their deployment.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheUsage:
+    """Prompt and cached token totals for a deployment or time bucket"""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        if not self.prompt_tokens:
+            return None
+        return self.cached_tokens / self.prompt_tokens
+
+    def to_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class PromptCacheStats:
+    """Thread-safe cumulative and bucketed prompt cache usage per deployment"""
+
+    def __init__(self, bucket_seconds: int = 3600, max_buckets: int = 168, log_interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            bucket_seconds: Length of a time bucket
+            max_buckets: Number of most recent buckets kept per deployment
+            log_interval: Seconds between logs of the buckets completed meanwhile; None to never log them
+            clock: Returns the current time in seconds; replaced with a fake clock in tests
+        """
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.log_interval = log_interval
+        self.clock = clock
+        self._totals: Dict[str, CacheUsage] = {}
+        self._buckets: Dict[str, "OrderedDict[int, CacheUsage]"] = {}
+        # Start of the first bucket not reported yet
+        self._reported_until = 0
+        self._lock = threading.Lock()
+        self._reporter: Optional[threading.Thread] = None
+
+    def record(self, deployment_name: str, prompt_tokens: int, cached_tokens: int):
+        """Record the prompt and cached tokens of one request."""
+        bucket_start = int(self.clock() // self.bucket_seconds * self.bucket_seconds)
+        with self._lock:
+            total = self._totals.setdefault(deployment_name, CacheUsage())
+            buckets = self._buckets.setdefault(deployment_name, OrderedDict())
+            bucket = buckets.get(bucket_start)
+            if bucket is None:
+                bucket = buckets[bucket_start] = CacheUsage()
+                while len(buckets) > self.max_buckets:
+                    buckets.popitem(last=False)
+
+            for usage in (total, bucket):
+                usage.requests += 1
+                usage.prompt_tokens += prompt_tokens or 0
+                usage.cached_tokens += cached_tokens or 0
+
+            if self.log_interval and self._reporter is None:
+                self._reporter = threading.Thread(target=self._report_forever, name="prompt-cache-stats", daemon=True)
+                self._reporter.start()
+
+    def hit_ratio(self, deployment_name: str) -> Optional[float]:
+        """Return the cumulative cache hit ratio of a deployment, or None if nothing was recorded."""
+        with self._lock:
+            total = self._totals.get(deployment_name)
+            return total.hit_ratio if total else None
+
+    def history(self, deployment_name: str) -> List[Dict]:
+        """Return the per-bucket usage of a deployment, oldest first."""
+        with self._lock:
+            buckets = list(self._buckets.get(deployment_name, {}).items())
+        return [{"bucket_start": bucket_start, **usage.to_dict()} for bucket_start, usage in buckets]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Return cumulative usage for every deployment."""
+        with self._lock:
+            return {name: usage.to_dict() for name, usage in self._totals.items()}
+
+    def report(self) -> Dict[str, Dict]:
+        """
+        Log the buckets completed since the last report, with the cumulative usage of their deployment.
+
+        Returns:
+            dict: What was logged for each deployment with completed buckets
+        """
+        current_bucket = int(self.clock() // self.bucket_seconds * self.bucket_seconds)
+        with self._lock:
+            reports = {}
+            for name, buckets in self._buckets.items():
+                completed = [
+                    {"bucket_start": bucket_start, **usage.to_dict()}
+                    for bucket_start, usage in buckets.items()
+                    if self._reported_until <= bucket_start < current_bucket
+                ]
+                if completed:
+                    reports[name] = {"total": self._totals[name].to_dict(), "buckets": completed}
+            self._reported_until = current_bucket
+
+        for name, report in reports.items():
+            logger.info(f"Prompt cache of {name}: {json.dumps(report)}")
+        return reports
+
+    def _report_forever(self):
+        while True:
+            time.sleep(self.log_interval)
+            try:
+                self.report()
+            except Exception:
+                logger.error("Reporting prompt cache stats failed", exc_info=True)
+
+
+@lru_cache(maxsize=1)
+def get_prompt_cache_stats() -> PromptCacheStats:
+    """Return the process-wide prompt cache stats, logged every PROMPT_CACHE_LOG_INTERVAL seconds (0 turns it off)."""
+    log_interval = float(os.getenv("PROMPT_CACHE_LOG_INTERVAL", "3600"))
+    return PromptCacheStats(log_interval=log_interval or None)
@@ -0,0 +1,391 @@
+"""
+Per-session retrieval over uploaded documents.
+
+Chunks are added to an incremental BM25 index as documents are uploaded, so adding a document never rebuilds the
+index. Queries only score chunks that share a term with the query. Removing a document compacts both indexes, so
+nothing of it stays in memory.
+
+An optional NumPy embedding index is filled on a background thread in batches while BM25 already answers queries;
+the chunks embedded so far are ranked densely and fused with BM25 by reciprocal rank fusion.
+"""
+
+import base64
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of", "on", "or",
+    "that", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "with", "you", "your"
+))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BM25Index:
+    """Incremental Okapi BM25 index over document chunks"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths: List[int] = []
+        self._total_length = 0
+
+    def add(self, chunks) -> List[int]:
+        """Add chunks to the index and return their ids."""
+        ids = []
+        for chunk in chunks:
+            chunk_id = len(self.chunks)
+            terms = Counter(tokenize(chunk.text))
+            for term, frequency in terms.items():
+                self._postings[term][chunk_id] = frequency
+            length = sum(terms.values())
+            self.chunks.append(chunk)
+            self._lengths.append(length)
+            self._total_length += length
+            ids.append(chunk_id)
+        return ids
+
+    def remove(self, chunk_ids: Sequence[int]) -> Dict[int, int]:
+        """
+        Remove chunks and renumber the remaining ones in order, so the index keeps nothing of the removed chunks.
+
+        Returns:
+            dict: New id of every remaining chunk keyed by its old id
+        """
+        removed = set(chunk_ids)
+        mapping = {}
+        chunks = []
+        lengths = []
+        for old_id, chunk in enumerate(self.chunks):
+            if old_id in removed:
+                continue
+            mapping[old_id] = len(chunks)
+            chunks.append(chunk)
+            lengths.append(self._lengths[old_id])
+
+        postings = defaultdict(dict)
+        for term, term_postings in self._postings.items():
+            kept = {mapping[chunk_id]: frequency for chunk_id, frequency in term_postings.items() if chunk_id in mapping}
+            if kept:
+                postings[term] = kept
+
+        self.chunks = chunks
+        self._lengths = lengths
+        self._postings = postings
+        self._total_length = sum(lengths)
+        return mapping
+
+    def search(self, query: str, k: int = 5) -> List[tuple]:
+        """Return up to k (chunk id, score) pairs, best first."""
+        if not self.chunks:
+            return []
+
+        live = len(self.chunks)
+        average_length = self._total_length / live
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (live - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class EmbeddingIndex:
+    """Optional dense index backed by a growable NumPy matrix of normalized embeddings"""
+
+    def __init__(self, embed: Callable[[List[str]], List[List[float]]], batch_size: int = 64):
+        """
+        Args:
+            embed: Returns one embedding vector per input text, for example an Azure OpenAI embeddings deployment
+            batch_size: Number of texts embedded per call
+        """
+        import numpy as np
+
+        self._np = np
+        self.embed = embed
+        self.batch_size = batch_size
+        self._matrix = None
+        self._ids = []
+        self._count = 0
+
+    def embed_texts(self, texts: Sequence[str]):
+        """Return the normalized embeddings of texts as a float32 matrix."""
+        np = self._np
+        vectors = np.asarray(self.embed(list(texts)), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors
+
+    def add_vectors(self, chunk_ids: Sequence[int], vectors):
+        """Add embedded chunks; the matrix grows by doubling so adds stay amortized O(n)."""
+        np = self._np
+        if self._matrix is None:
+            self._matrix = np.empty((max(len(vectors), 256), vectors.shape[1]), dtype=np.float32)
+        needed = self._count + len(vectors)
+        if needed > len(self._matrix):
+            grown = np.empty((max(needed, len(self._matrix) * 2), self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._count] = self._matrix[:self._count]
+            self._matrix = grown
+
+        self._matrix[self._count:needed] = vectors
+        self._ids.extend(chunk_ids)
+        self._count = needed
+
+    def add(self, chunk_ids: Sequence[int], texts: Sequence[str]):
+        """Embed and add chunks in batches of batch_size."""
+        for start in range(0, len(texts), self.batch_size):
+            self.add_vectors(chunk_ids[start:start + self.batch_size],
+                             self.embed_texts(texts[start:start + self.batch_size]))
+
+    def retain(self, mapping: Dict[int, int]):
+        """Drop the rows of chunks missing from mapping and renumber the others with it."""
+        keep = [row for row, chunk_id in enumerate(self._ids) if chunk_id in mapping]
+        if len(keep) == self._count:
+            self._ids = [mapping[chunk_id] for chunk_id in self._ids]
+            return
+        self._matrix = self._matrix[keep] if keep else None
+        self._ids = [mapping[self._ids[row]] for row in keep]
+        self._count = len(keep)
+
+    def __getstate__(self):
+        # The embed callable usually closes over a client, so it is supplied again by enable_embeddings
+        state = dict(self.__dict__)
+        del state["_np"]
+        state["embed"] = None
+        return state
+
+    def __setstate__(self, state):
+        import numpy as np
+
+        self.__dict__.update(state)
+        self._np = np
+
+    def search_vector(self, query_vector, k: int = 5) -> List[tuple]:
+        """Return up to k (chunk id, cosine similarity) pairs for a normalized query vector, best first."""
+        if not self._count:
+            return []
+        np = self._np
+        similarities = self._matrix[:self._count] @ query_vector
+
+        candidates = min(k, self._count)
+        top = np.argpartition(-similarities, candidates - 1)[:candidates]
+        top = top[np.argsort(-similarities[top])]
+        return [(self._ids[i], float(similarities[i])) for i in top]
+
+    def search(self, query: str, k: int = 5) -> List[tuple]:
+        """Return up to k (chunk id, cosine similarity) pairs, best first."""
+        if not self._count:
+            return []
+        return self.search_vector(self.embed_texts([query])[0], k)
+
+
+class DocumentIndex:
+    """Session index of uploaded documents combining BM25 with an optional embedding index"""
+
+    def __init__(self):
+        self.bm25 = BM25Index()
+        self.embeddings: Optional[EmbeddingIndex] = None
+        self.documents: Dict[str, List[int]] = {}
+        # Chunks are embedded in id order, so the first _embedded chunks are the ones in the embedding index
+        self._embedded = 0
+        # Bumped whenever chunk ids are renumbered, so the embedder drops a batch embedded under the old ids
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._embedder: Optional[threading.Thread] = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_lock"]
+        state["_embedder"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def to_dict(self) -> Dict:
+        """Return the index as JSON-serializable data; embeddings are stored as base64 float32 rows."""
+        with self._lock:
+            data = {
+                "chunks": [asdict(chunk) for chunk in self.bm25.chunks],
+                "documents": self.documents,
+                "embeddings": None,
+            }
+            embeddings = self.embeddings
+            if embeddings is not None and embeddings._count:
+                matrix = embeddings._matrix[:embeddings._count]
+                data["embeddings"] = {
+                    "ids": list(embeddings._ids),
+                    "dimensions": matrix.shape[1],
+                    "vectors": base64.b64encode(matrix.tobytes()).decode("ascii"),
+                }
+            return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DocumentIndex":
+        """
+        Rebuild an index from to_dict data. Embeddings come back without an embed callable, which
+        enable_embeddings supplies again before the next query.
+        """
+        from ..utils.document_processor import DocumentChunk
+
+        index = cls()
+        index.bm25.add([DocumentChunk(**chunk) for chunk in data["chunks"]])
+        index.documents = {document: list(ids) for document, ids in data["documents"].items()}
+        if data["embeddings"] is not None:
+            embeddings = EmbeddingIndex(None)
+            np = embeddings._np
+            vectors = np.frombuffer(base64.b64decode(data["embeddings"]["vectors"]), dtype=np.float32)
+            embeddings.add_vectors(data["embeddings"]["ids"], vectors.reshape(-1, data["embeddings"]["dimensions"]))
+            index.embeddings = embeddings
+            index._embedded = embeddings._count
+        return index
+
+    def add_document(self, key: str, chunks) -> int:
+        """Index the chunks of a document under a key; returns the number of chunks added."""
+        with self._lock:
+            if key in self.documents:
+                return 0
+            self.documents[key] = self.bm25.add(chunks)
+        return len(chunks)
+
+    def remove_document(self, key: str):
+        """Drop a document and compact the indexes, renumbering the chunks of the other documents."""
+        with self._lock:
+            chunk_ids = self.documents.pop(key, None)
+            if not chunk_ids:
+                return
+            mapping = self.bm25.remove(chunk_ids)
+            self.documents = {
+                document: [mapping[chunk_id] for chunk_id in ids] for document, ids in self.documents.items()
+            }
+            if self.embeddings is not None:
+                self.embeddings.retain(mapping)
+                self._embedded = self.embeddings._count
+            self._generation += 1
+
+    def enable_embeddings(self, embed: Callable[[List[str]], List[List[float]]], background: bool = True):
+        """
+        Use embed for queries and embed every chunk not embedded yet, on a background thread unless background is
+        False. Only new chunks are embedded.
+        """
+        with self._lock:
+            if self.embeddings is None:
+                self.embeddings = EmbeddingIndex(embed)
+            self.embeddings.embed = embed
+            if self._embedded >= len(self.bm25.chunks):
+                return
+            if not background:
+                self._embed_pending()
+                return
+            if self._embedder is None or not self._embedder.is_alive():
+                self._embedder = threading.Thread(target=self._embed_pending, name="document-embedder", daemon=True)
+                self._embedder.start()
+
+    @property
+    def embedding_pending(self) -> int:
+        """Number of chunks not embedded yet."""
+        with self._lock:
+            return len(self.bm25.chunks) - self._embedded if self.embeddings is not None else 0
+
+    def _embed_pending(self):
+        while True:
+            with self._lock:
+                start = self._embedded
+                chunk_ids = list(range(start, min(start + self.embeddings.batch_size, len(self.bm25.chunks))))
+                if not chunk_ids:
+                    return
+                texts = [self.bm25.chunks[i].text for i in chunk_ids]
+                generation = self._generation
+                embeddings = self.embeddings
+
+            # The embeddings request runs without the lock, so queries and uploads are never held up by it
+            try:
+                vectors = embeddings.embed_texts(texts)
+            except Exception:
+                logger.error("Embedding document chunks failed; they are retried on the next query", exc_info=True)
+                return
+
+            with self._lock:
+                if self._generation == generation and self._embedded == start:
+                    embeddings.add_vectors(chunk_ids, vectors)
+                    self._embedded = start + len(chunk_ids)
+
+    def search(self, query: str, k: int = 5) -> List:
+        """Return the k most relevant chunks for a query."""
+        with self._lock:
+            embeddings = self.embeddings
+            if embeddings is None or not embeddings._count:
+                return [self.bm25.chunks[chunk_id] for chunk_id, _ in self.bm25.search(query, k)]
+
+        # The query is embedded without the lock; both rankings are then taken from the same state of the index
+        try:
+            query_vector = embeddings.embed_texts([query])[0]
+        except Exception:
+            logger.error("Embedding the query failed; answering from keyword search only", exc_info=True)
+            with self._lock:
+                return [self.bm25.chunks[chunk_id] for chunk_id, _ in self.bm25.search(query, k)]
+
+        with self._lock:
+            bm25_results = self.bm25.search(query, k * 4)
+            dense_results = self.embeddings.search_vector(query_vector, k * 4)
+
+            # Reciprocal rank fusion of the sparse and dense rankings
+            fused = defaultdict(float)
+            for results in (bm25_results, dense_results):
+                for rank, (chunk_id, _) in enumerate(results):
+                    fused[chunk_id] += 1 / (60 + rank)
+            ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [self.bm25.chunks[chunk_id] for chunk_id, _ in ranked]
+
+    def select_context(self, query: str, k: int = 5, token_budget: int = 1500) -> List:
+        """Return the most relevant chunks for a query that fit within the token budget."""
+        selected = []
+        used = 0
+        for chunk in self.search(query, k):
+            if used + chunk.tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += chunk.tokens
+        return selected
+
+
+def build_context_message(user_message: Dict, chunks) -> Dict:
+    """Return a copy of a user message with the retrieved document excerpts placed before the question."""
+    if not chunks:
+        return user_message
+
+    excerpts = "\n\n".join(f"[{chunk.document}, page {chunk.page}]\n{chunk.text}" for chunk in chunks)
+    preamble = (
+        "Use the following excerpts from the user's uploaded documents if they are relevant to the question.\n\n"
+        f"{excerpts}\n\nQuestion: "
+    )
+
+    if isinstance(user_message["content"], str):
+        return {"role": "user", "content": preamble + user_message["content"]}
+
+    content = [dict(item) for item in user_message["content"]]
+    for item in content:
+        if item["type"] == "text":
+            item["text"] = preamble + item["text"]
+            break
+    return {"role": "user", "content": content}
@@ -0,0 +1,144 @@
+"""
+Automatic model routing for the "auto" model choice.
+
+The router scores how complex a turn is from cheap local features (estimated prompt tokens, attachments,
+conversation depth, code and reasoning cues) and sends simple turns to the faster deployment and complex or image
+turns to the stronger one. Only a bounded prefix of the prompt is scanned, so routing takes microseconds.
+
+Each decision is logged as a JSON line together with the latency and token usage of the response it led to, so the
+threshold and weights can be tuned offline. Set ROUTING_LOG_PATH to also write these lines to a file.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Optional
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+# Routing decisions and outcomes are written to their own logger so they can be collected separately
+decision_logger = logging.getLogger(__name__ + ".decisions")
+
+AUTO_MODEL = "auto"
+
+# Only this many characters of the prompt are scanned for cues; length is still taken from the full prompt
+SCAN_CHARS = 2000
+
+REASONING_CUES = re.compile(
+    r"\b(why|explain|analy[sz]e|compare|prove|derive|design|architecture|step[- ]by[- ]step|trade-?offs?|"
+    r"optimi[sz]e|debug|refactor|evaluate|critique|plan)\b"
+)
+CODE_CUES = re.compile(r"```|\bdef |\bclass |\bfunction\b|\bimport |;\s*$|\{\s*$", re.MULTILINE)
+
+
+@dataclass
+class RoutingFeatures:
+    """Local features of a turn used to estimate its complexity"""
+
+    prompt_tokens: int
+    has_image: bool
+    conversation_depth: int
+    reasoning_cues: int
+    has_code: bool
+
+
+@dataclass
+class RoutingDecision:
+    """Deployment chosen for a turn and why"""
+
+    model: str
+    score: float
+    reason: str
+    features: RoutingFeatures
+
+
+class ModelRouter:
+    """Routes turns between a fast and a strong deployment based on an estimated complexity score"""
+
+    def __init__(self, fast_model: str = "gpt-35-turbo", strong_model: str = "gpt-4o", threshold: float = 0.5,
+                 long_prompt_tokens: int = 600, deep_conversation: int = 6):
+        """
+        Args:
+            fast_model: Deployment for simple turns
+            strong_model: Deployment for complex and image turns
+            threshold: Complexity score at or above which the strong deployment is used
+            long_prompt_tokens: Estimated prompt tokens at which the length feature is saturated
+            deep_conversation: Number of messages at which the depth feature is saturated
+        """
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.threshold = threshold
+        self.long_prompt_tokens = long_prompt_tokens
+        self.deep_conversation = deep_conversation
+
+    def extract_features(self, prompt: str, has_image: bool = False, conversation_depth: int = 0) -> RoutingFeatures:
+        """Compute the routing features of a turn."""
+        scanned = prompt[:SCAN_CHARS].lower()
+        return RoutingFeatures(
+            prompt_tokens=(len(prompt) + 3) // 4,
+            has_image=has_image,
+            conversation_depth=conversation_depth,
+            reasoning_cues=len(REASONING_CUES.findall(scanned)),
+            has_code=CODE_CUES.search(scanned) is not None,
+        )
+
+    def score(self, features: RoutingFeatures) -> float:
+        """Return a complexity score between 0 and 1."""
+        length = min(features.prompt_tokens / self.long_prompt_tokens, 1.0)
+        depth = min(features.conversation_depth / self.deep_conversation, 1.0)
+        reasoning = min(features.reasoning_cues / 2, 1.0)
+        return 0.35 * length + 0.15 * depth + 0.3 * reasoning + 0.2 * features.has_code
+
+    def route(self, prompt: str, has_image: bool = False, conversation_depth: int = 0) -> RoutingDecision:
+        """Choose the deployment for a turn."""
+        features = self.extract_features(prompt, has_image, conversation_depth)
+        if has_image:
+            return RoutingDecision(self.strong_model, 1.0, "image attached", features)
+
+        score = self.score(features)
+        if score >= self.threshold:
+            return RoutingDecision(self.strong_model, score, f"score {score:.2f} >= {self.threshold}", features)
+        return RoutingDecision(self.fast_model, score, f"score {score:.2f} < {self.threshold}", features)
+
+
+@lru_cache(maxsize=1)
+def get_model_router() -> ModelRouter:
+    """Return the process-wide router. ROUTER_FAST_MODEL, ROUTER_STRONG_MODEL and ROUTER_THRESHOLD tune it."""
+    log_path = os.getenv("ROUTING_LOG_PATH")
+    if log_path:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        decision_logger.addHandler(handler)
+
+    return ModelRouter(
+        fast_model=os.getenv("ROUTER_FAST_MODEL", "gpt-35-turbo"),
+        strong_model=os.getenv("ROUTER_STRONG_MODEL", "gpt-4o"),
+        threshold=float(os.getenv("ROUTER_THRESHOLD", "0.5")),
+    )
+
+
+def record_routing_outcome(decision: RoutingDecision, latency: float, chat_message=None, error: Optional[str] = None):
+    """Log a routing decision with the latency and usage of the response it produced."""
+    outcome = {
+        "ts": time.time(),
+        "model": decision.model,
+        "score": round(decision.score, 4),
+        "reason": decision.reason,
+        "features": asdict(decision.features),
+        "latency_ms": round(latency * 1000),
+        "error": error,
+    }
+    if chat_message is not None:
+        outcome.update({
+            "prompt_tokens": chat_message.prompt_tokens,
+            "completion_tokens": chat_message.completion_tokens,
+            "total_tokens": chat_message.total_tokens,
+            "cached_tokens": getattr(chat_message, "cached_tokens", 0),
+            "cancelled": getattr(chat_message, "cancelled", False),
+        })
+    decision_logger.info(json.dumps(outcome))
@@ -0,0 +1,453 @@
+"""
+Per-session memory accounting with spilling and eviction of idle or oversized sessions.
+
+Session state belongs to the thread running the session's script, so the accountant never changes it from anywhere
+else. A background sweeper only reads the footprints measured by the sessions themselves and marks sessions for
+spilling or eviction:
+
+- sessions that are idle or over their cap have their large keys (conversation, document index) marked for
+  spilling to disk, from where the next run of the session restores them,
+- sessions idle for much longer are marked for eviction, which drops their conversation and credentials, and
+- sessions whose Streamlit state was garbage collected are forgotten and their process-wide resources released.
+
+Each session carries out its marks in its own thread: in SessionMemoryAccountant.housekeep, which the app runs
+periodically while a session is open, and at the start of every tracked run.
+
+Spilled state is written as Fernet encrypted JSON, so neither conversations nor document indexes sit on disk in
+plain text and nothing in the spill directory is ever unpickled.
+
+The accountant only needs item access on the session state, so it can be exercised with plain mappings.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass, field, is_dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from cryptography.fernet import Fernet, InvalidToken
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+# Objects from other libraries are counted shallowly, since they often reference shared process-wide state
+PROJECT_PACKAGE = __name__.split(".")[0]
+
+# Session state key of the marker whose collection tells the accountant that a session was closed
+MARKER_KEY = "_session_memory_marker"
+
+def estimate_size(value, seen: Optional[set] = None) -> int:
+    """
+    Estimate the memory held by a value in bytes.
+
+    Containers, dataclasses and objects defined in this project are followed; anything else is counted by
+    sys.getsizeof alone. Objects reachable more than once are counted once.
+    """
+    if seen is None:
+        seen = set()
+    pending = [value]
+    total = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        try:
+            total += sys.getsizeof(item)
+        except TypeError:
+            continue
+
+        if isinstance(item, (str, bytes, bytearray, int, float, bool)) or item is None:
+            continue
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif is_dataclass(item) or type(item).__module__.split(".")[0] == PROJECT_PACKAGE:
+            if hasattr(item, "__dict__"):
+                pending.append(item.__dict__)
+    return total
+
+
+class _SessionMarker:
+    """Kept in the session state only so the accountant can hold a weak reference to it"""
+
+    __slots__ = ("__weakref__",)
+
+
+@dataclass
+class _TrackedSession:
+    marker_ref: Callable
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    last_active: float = 0.0
+    measured_at: Optional[float] = None
+    bytes_by_key: Dict[str, int] = field(default_factory=dict)
+    spilled: bool = False
+    evicted: bool = False
+    # Set by the sweeper to "spill" or "evict" and carried out by the session itself
+    pending: Optional[str] = None
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self.bytes_by_key.values())
+
+
+class SessionMemoryAccountant:
+    """Process-wide accountant of the memory held by each session"""
+
+    def __init__(self, spill_keys: Sequence[str] = (), evict_keys: Sequence[str] = (),
+                 spill_dir: Optional[str] = None, spill_key: Optional[str] = None, spill_after: float = 900,
+                 evict_after: float = 86400, max_session_bytes: Optional[int] = None,
+                 max_total_bytes: Optional[int] = None, sweep_interval: float = 30,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            spill_keys: Session state keys written to disk when a session is spilled
+            evict_keys: Session state keys dropped when a session is evicted; the app starts an evicted session
+                over at the login page
+            spill_dir: Directory for spilled sessions. Without it sessions are only evicted
+            spill_key: Fernet key the spill files are encrypted with; required with spill_dir
+            spill_after: Seconds a session can be idle before it is spilled
+            evict_after: Seconds a session can be idle before it is evicted
+            max_session_bytes: Sessions above this estimated footprint are spilled whenever they are not running
+            max_total_bytes: Least recently active sessions are spilled until the total is below this
+            sweep_interval: Seconds between sweeps, and the least time between two measurements of a session
+            clock: Monotonic clock, replaceable for tests
+        """
+        if spill_dir and not spill_key:
+            raise ValueError("A spill key is required to spill sessions to disk")
+        self.spill_keys = tuple(spill_keys)
+        self.evict_keys = tuple(evict_keys)
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.spill_after = spill_after
+        self.evict_after = evict_after
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = max_total_bytes
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+
+        self._fernet = Fernet(spill_key) if self.spill_dir is not None else None
+        self._codecs: Dict[str, tuple] = {}
+        self._sessions: Dict[str, _TrackedSession] = {}
+        self._lock = threading.Lock()
+        self._release_listeners: List[Callable[[str], None]] = []
+        self._evict_listeners: List[Callable[[str, object], None]] = []
+        self._counters = {"spills": 0, "restores": 0, "evictions": 0, "closed": 0}
+        self._sweeper: Optional[threading.Thread] = None
+
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+    def add_release_listener(self, listener: Callable[[str], None]):
+        """Call listener with the session id whenever a session is evicted or closed."""
+        with self._lock:
+            if listener not in self._release_listeners:
+                self._release_listeners.append(listener)
+
+    def add_evict_listener(self, listener: Callable[[str, object], None]):
+        """Call listener with the session id and its state just before an idle session's state is dropped."""
+        with self._lock:
+            if listener not in self._evict_listeners:
+                self._evict_listeners.append(listener)
+
+    def register_codec(self, key: str, encode: Callable[[object], object], decode: Callable[[object], object]):
+        """
+        Spill the value of a session state key as encode(value) and restore it with decode. Values of keys without
+        a codec must be JSON-serializable as they are.
+        """
+        with self._lock:
+            self._codecs[key] = (encode, decode)
+
+    @contextmanager
+    def track(self, session_id: str, state):
+        """
+        Hold the session while a script run uses it, carrying out a pending eviction and restoring spilled keys
+        first. Runs may nest.
+
+        Args:
+            session_id: Identifier of the Streamlit session
+            state: The session state
+
+        Yields:
+            bool: True if the session was evicted when the run started
+        """
+        entry = self._entry(session_id, state)
+        with entry.lock:
+            evicted = entry.pending == "evict"
+            if evicted:
+                self._evict(session_id, entry, state)
+            else:
+                entry.evicted = False
+            # The session is running again, so a spill decided while it was idle no longer applies
+            entry.pending = None
+            if entry.spilled:
+                self._restore(session_id, entry, state)
+            entry.last_active = self.clock()
+            try:
+                yield evicted
+            finally:
+                entry.last_active = self.clock()
+                self._measure_if_due(entry, state)
+
+    def housekeep(self, session_id: str, state) -> Optional[str]:
+        """
+        Measure the session and carry out what the sweeper marked it for. Does not count as activity.
+
+        Returns:
+            Optional[str]: "spilled" or "evicted" if the session was spilled or evicted, otherwise None
+        """
+        entry = self._entry(session_id, state)
+        with entry.lock:
+            pending, entry.pending = entry.pending, None
+            if pending == "evict":
+                self._evict(session_id, entry, state)
+                return "evicted"
+            if pending == "spill" and not entry.spilled:
+                self._measure(entry, state)
+                if self._spill(session_id, entry, state):
+                    return "spilled"
+            self._measure_if_due(entry, state)
+        return None
+
+    def sweep(self):
+        """Mark idle and oversized sessions for spilling or eviction and forget closed sessions."""
+        now = self.clock()
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        resident = []
+        for session_id, entry in sessions:
+            if entry.marker_ref() is None:
+                self._forget(session_id, entry)
+                continue
+            # A session whose lock is held is running; it is looked at again next sweep
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                idle = now - entry.last_active
+                if entry.evicted or entry.pending == "evict":
+                    continue
+                if idle > self.evict_after:
+                    entry.pending = "evict"
+                elif not entry.spilled and self.spill_dir is not None:
+                    oversized = self.max_session_bytes is not None and entry.resident_bytes > self.max_session_bytes
+                    if idle > self.spill_after or oversized:
+                        entry.pending = "spill"
+                    else:
+                        resident.append(entry)
+            finally:
+                entry.lock.release()
+
+        if self.max_total_bytes is not None and self.spill_dir is not None:
+            self._enforce_total_cap(resident)
+
+    def metrics(self) -> Dict:
+        """Return totals of the sessions held by this process."""
+        with self._lock:
+            entries = list(self._sessions.values())
+            counters = dict(self._counters)
+
+        bytes_by_key: Dict[str, int] = {}
+        for entry in entries:
+            for key, size in entry.bytes_by_key.items():
+                bytes_by_key[key] = bytes_by_key.get(key, 0) + size
+        return {
+            "sessions": len(entries),
+            "spilled_sessions": sum(1 for entry in entries if entry.spilled),
+            "pending_spills": sum(1 for entry in entries if entry.pending == "spill"),
+            "resident_bytes": sum(entry.resident_bytes for entry in entries),
+            "largest_session_bytes": max((entry.resident_bytes for entry in entries), default=0),
+            "bytes_by_key": bytes_by_key,
+            **counters,
+        }
+
+    def _entry(self, session_id: str, state) -> _TrackedSession:
+        marker = state[MARKER_KEY] if MARKER_KEY in state else None
+        if marker is None:
+            marker = state[MARKER_KEY] = _SessionMarker()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry.marker_ref() is not marker:
+                entry = _TrackedSession(marker_ref=weakref.ref(marker), last_active=self.clock())
+                self._sessions[session_id] = entry
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="session-memory", daemon=True)
+                self._sweeper.start()
+        return entry
+
+    def _measure(self, entry: _TrackedSession, state):
+        seen = set()
+        entry.bytes_by_key = {
+            key: estimate_size(state[key], seen)
+            for key in dict.fromkeys(self.spill_keys + self.evict_keys) if key in state
+        }
+        entry.measured_at = self.clock()
+
+    def _measure_if_due(self, entry: _TrackedSession, state):
+        # Measuring walks the whole conversation and document index, so it is done at most once per sweep interval
+        if entry.measured_at is None or self.clock() - entry.measured_at >= self.sweep_interval:
+            self._measure(entry, state)
+
+    def _spill_bytes(self, entry: _TrackedSession) -> int:
+        return sum(entry.bytes_by_key.get(key, 0) for key in self.spill_keys)
+
+    def _spill_path(self, session_id: str) -> Path:
+        return self.spill_dir / f"{session_id}.bin"
+
+    def _spill(self, session_id: str, entry: _TrackedSession, state) -> bool:
+        if self.spill_dir is None:
+            return False
+        keys = [key for key in self.spill_keys if key in state]
+        if not keys:
+            return False
+        path = self._spill_path(session_id)
+        temporary = path.with_suffix(".tmp")
+        try:
+            data = {}
+            for key in keys:
+                encode = self._codecs.get(key, (None, None))[0]
+                data[key] = encode(state[key]) if encode else state[key]
+            temporary.write_bytes(self._fernet.encrypt(json.dumps(data).encode("utf-8")))
+            os.replace(temporary, path)
+        except Exception:
+            # The session simply stays in memory
+            logger.error(f"Unable to spill session {session_id}", exc_info=True)
+            temporary.unlink(missing_ok=True)
+            return False
+
+        for key in keys:
+            del state[key]
+        spilled_bytes = sum(entry.bytes_by_key.pop(key, 0) for key in keys)
+        entry.spilled = True
+        self._count("spills")
+        logger.info(f"Spilled {spilled_bytes} bytes of session {session_id} to disk")
+        return True
+
+    def _restore(self, session_id: str, entry: _TrackedSession, state):
+        path = self._spill_path(session_id)
+        try:
+            data = json.loads(self._fernet.decrypt(path.read_bytes()).decode("utf-8"))
+        except FileNotFoundError:
+            logger.warning(f"Spill file for session {session_id} is missing; starting it afresh")
+            data = {}
+        except InvalidToken:
+            logger.error(f"Unable to decrypt spill file for session {session_id}; starting it afresh")
+            data = {}
+        for key, value in data.items():
+            decode = self._codecs.get(key, (None, None))[1]
+            state[key] = decode(value) if decode else value
+        path.unlink(missing_ok=True)
+        entry.spilled = False
+        # Measured again at the end of the run
+        entry.measured_at = None
+        self._count("restores")
+
+    def _evict(self, session_id: str, entry: _TrackedSession, state):
+        with self._lock:
+            listeners = list(self._evict_listeners)
+        for listener in listeners:
+            try:
+                listener(session_id, state)
+            except Exception:
+                logger.error(f"Cleaning up evicted session {session_id} failed", exc_info=True)
+        for key in self.evict_keys:
+            if key in state:
+                del state[key]
+        if entry.spilled:
+            self._spill_path(session_id).unlink(missing_ok=True)
+            entry.spilled = False
+        entry.bytes_by_key = {}
+        entry.pending = None
+        entry.evicted = True
+        self._count("evictions")
+        logger.info(f"Evicted session {session_id} after {self.evict_after:.0f}s idle")
+        self._release(session_id)
+
+    def _forget(self, session_id: str, entry: _TrackedSession):
+        with self._lock:
+            if self._sessions.get(session_id) is not entry:
+                return
+            del self._sessions[session_id]
+        if entry.spilled:
+            self._spill_path(session_id).unlink(missing_ok=True)
+        self._count("closed")
+        self._release(session_id)
+
+    def _enforce_total_cap(self, resident: List[_TrackedSession]):
+        # Sessions marked earlier count without their spill keys; the least recently active of the others are marked
+        with self._lock:
+            entries = list(self._sessions.values())
+        total = sum(entry.resident_bytes - (self._spill_bytes(entry) if entry.pending == "spill" else 0)
+                    for entry in entries)
+        for entry in sorted(resident, key=lambda entry: entry.last_active):
+            if total <= self.max_total_bytes:
+                break
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                if entry.pending is None and not entry.spilled:
+                    entry.pending = "spill"
+                    total -= self._spill_bytes(entry)
+            finally:
+                entry.lock.release()
+
+    def _release(self, session_id: str):
+        with self._lock:
+            listeners = list(self._release_listeners)
+        for listener in listeners:
+            try:
+                listener(session_id)
+            except Exception:
+                logger.error(f"Releasing resources of session {session_id} failed", exc_info=True)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+                logger.info(f"Session memory: {json.dumps(self.metrics())}")
+            except Exception:
+                logger.error("Session memory sweep failed", exc_info=True)
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+@lru_cache(maxsize=1)
+def get_session_memory_accountant(spill_keys: Sequence[str] = (), evict_keys: Sequence[str] = ()) -> SessionMemoryAccountant:
+    """
+    Return the process-wide accountant.
+
+    Spilling is off unless SESSION_SPILL_DIR and SESSION_SPILL_KEY (a Fernet key) are set. SESSION_SPILL_AFTER and
+    SESSION_EVICT_AFTER (seconds idle), SESSION_MAX_BYTES, SESSION_MEMORY_MAX_BYTES and SESSION_SWEEP_INTERVAL
+    configure the rest.
+    """
+    spill_dir = os.getenv("SESSION_SPILL_DIR")
+    spill_key = os.getenv("SESSION_SPILL_KEY")
+    if spill_dir and not spill_key:
+        raise ValueError("SESSION_SPILL_KEY must be set when SESSION_SPILL_DIR is used")
+    return SessionMemoryAccountant(
+        spill_keys=spill_keys,
+        evict_keys=evict_keys,
+        spill_dir=spill_dir or None,
+        spill_key=spill_key,
+        spill_after=float(os.getenv("SESSION_SPILL_AFTER", "900")),
+        evict_after=float(os.getenv("SESSION_EVICT_AFTER", "86400")),
+        max_session_bytes=_optional_int("SESSION_MAX_BYTES"),
+        max_total_bytes=_optional_int("SESSION_MEMORY_MAX_BYTES"),
+        sweep_interval=float(os.getenv("SESSION_SWEEP_INTERVAL", "30")),
+    )
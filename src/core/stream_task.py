@@ -0,0 +1,211 @@
+"""
+Session-scoped background streaming which survives Streamlit reruns.
+
+A StreamTask reads a streaming chat completion on its own thread and writes the response into a buffer. The
+Streamlit script only renders from that buffer, so a rerun caused by any widget interaction just reattaches to the
+live task: it replays the text received so far and keeps following it, without a second upstream call.
+
+Tasks nobody has attached to for a while, for example because the browser tab was closed, are cancelled so they do
+not keep reading tokens nobody will see. A task dropped before its session recorded the result still has its usage
+recorded in the token usage ledger once it finishes, so reloading the page mid-answer does not escape the budgets.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .chat import CancelEvent, ChatMessage, get_streaming_chat_completion
+from .usage_ledger import get_usage_ledger
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+
+class StreamTask:
+    """A streaming chat completion running in the background for one session"""
+
+    def __init__(self, client, deployment_name, messages, max_tokens, security_context=None, metadata=None):
+        self.deployment_name = deployment_name
+        self.security_context = security_context
+        self.metadata = metadata or {}
+        self.chat_message: Optional[ChatMessage] = None
+        self.error: Optional[str] = None
+        self.cancel_event = CancelEvent()
+        self.last_attached = time.monotonic()
+
+        self._text = ""
+        self._done = False
+        self._done_callbacks: List[Callable[["StreamTask"], None]] = []
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(client, deployment_name, list(messages), max_tokens, security_context),
+            name=f"stream-{deployment_name}",
+            daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        """Stop the upstream stream; the task finishes with the partial response."""
+        self.cancel_event.set()
+
+    @property
+    def done(self) -> bool:
+        with self._condition:
+            return self._done
+
+    def add_done_callback(self, callback: Callable[["StreamTask"], None]):
+        """Call callback with the task once it has finished, straight away if it already has."""
+        with self._condition:
+            if not self._done:
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait_for_update(self, known_length: int, timeout: float = 0.25) -> Tuple[str, bool]:
+        """
+        Wait until the buffer holds more than known_length characters or the task is done.
+
+        Returns:
+            tuple: (response text received so far, whether the task is done)
+        """
+        self.last_attached = time.monotonic()
+        with self._condition:
+            self._condition.wait_for(lambda: self._done or len(self._text) > known_length, timeout=timeout)
+            return self._text, self._done
+
+    def _on_content(self, full_response):
+        with self._condition:
+            self._text = full_response
+            self._condition.notify_all()
+
+    def _run(self, client, deployment_name, messages, max_tokens, security_context):
+        try:
+            self.chat_message = asyncio.run(get_streaming_chat_completion(
+                client=client,
+                deployment_name=deployment_name,
+                messages=messages,
+                max_tokens=max_tokens,
+                security_context=security_context,
+                on_content=self._on_content,
+                cancel_event=self.cancel_event
+            ))
+        except Exception as e:
+            logger.error(f"Background stream from {deployment_name} failed", exc_info=True)
+            self.error = str(e)
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+                callbacks, self._done_callbacks = self._done_callbacks, []
+            for callback in callbacks:
+                callback(self)
+
+
+class StreamTaskRegistry:
+    """Process-wide registry of the background stream of each session"""
+
+    def __init__(self, abandon_timeout: float = 60, sweep_interval: float = 10,
+                 on_dropped: Optional[Callable[[StreamTask], None]] = None):
+        """
+        Args:
+            abandon_timeout: Seconds without an attached reader after which a task is cancelled and dropped
+            sweep_interval: Seconds between checks for abandoned tasks
+            on_dropped: Called with each task dropped before its session took its result, once the task finishes
+        """
+        self.abandon_timeout = abandon_timeout
+        self.sweep_interval = sweep_interval
+        self.on_dropped = on_dropped
+        self._tasks: Dict[str, StreamTask] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def start(self, session_id: str, task: StreamTask) -> StreamTask:
+        """Register and start a task for a session, cancelling any task it replaces."""
+        with self._lock:
+            previous = self._tasks.get(session_id)
+            self._tasks[session_id] = task
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="stream-sweeper", daemon=True)
+                self._sweeper.start()
+        if previous is not None:
+            self._drop(previous)
+        task.start()
+        return task
+
+    def get(self, session_id: str) -> Optional[StreamTask]:
+        with self._lock:
+            return self._tasks.get(session_id)
+
+    def remove(self, session_id: str, task: Optional[StreamTask] = None):
+        """
+        Drop the task of a session, cancelling it if it is still running.
+
+        A caller passing the task takes over its result and records its usage itself. Without it the task is handed
+        to on_dropped, for example when the session logs out or is closed.
+        """
+        with self._lock:
+            current = self._tasks.get(session_id)
+            if current is None or (task is not None and current is not task):
+                return
+            del self._tasks[session_id]
+        if task is None:
+            self._drop(current)
+        else:
+            current.cancel()
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for task in self._tasks.values() if not task.done)
+
+    def sweep(self):
+        """Cancel and drop tasks which no session has attached to within the abandon timeout."""
+        now = time.monotonic()
+        with self._lock:
+            abandoned = [
+                (session_id, task) for session_id, task in self._tasks.items()
+                if now - task.last_attached > self.abandon_timeout
+            ]
+            for session_id, _ in abandoned:
+                del self._tasks[session_id]
+
+        for session_id, task in abandoned:
+            logger.info(f"Dropping abandoned stream for session {session_id}")
+            self._drop(task)
+
+    def _drop(self, task: StreamTask):
+        task.cancel()
+        if self.on_dropped is not None:
+            task.add_done_callback(self._report_dropped)
+
+    def _report_dropped(self, task: StreamTask):
+        try:
+            self.on_dropped(task)
+        except Exception:
+            logger.error(f"Handling dropped stream from {task.deployment_name} failed", exc_info=True)
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.error("Stream sweeper iteration failed", exc_info=True)
+
+
+def record_dropped_usage(task: StreamTask):
+    """Record the token usage of a task whose session never took its result."""
+    if task.chat_message is None:
+        return
+    get_usage_ledger().record_completion(task.security_context, task.deployment_name, task.chat_message)
+
+
+@lru_cache(maxsize=1)
+def get_stream_task_registry() -> StreamTaskRegistry:
+    """Return the process-wide stream task registry, which records the usage of dropped tasks in the ledger."""
+    return StreamTaskRegistry(on_dropped=record_dropped_usage)
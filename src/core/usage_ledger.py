@@ -0,0 +1,378 @@
+"""
+Append-only token usage ledger with per-user and per-tenant budgets.
+
+Every completion is recorded against the end user and tenant from the UserSecurityContext. Records are written to
+SQLite by a background writer in batches, and each batch also updates a daily rollup table in the same transaction,
+so reports read the rollup instead of scanning millions of raw rows.
+
+Budget checks never touch the database on the hot path: rolling daily and monthly counters are kept in memory,
+loaded lazily from the rollup the first time a user or tenant is checked in a period. The counters only see the
+completions of this process, so they are reloaded from the rollup once they are older than counter_ttl. Replicas
+sharing a ledger database therefore see each other's usage within that window, and a budget can be overrun by at
+most what the other replicas served in it.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    tenant_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    deployment TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    estimated INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_events_tenant_user_ts ON usage_events (tenant_id, user_id, ts);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    tenant_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    deployment TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    PRIMARY KEY (day, tenant_id, user_id, deployment)
+);
+CREATE INDEX IF NOT EXISTS idx_usage_daily_user ON usage_daily (user_id, day);
+CREATE INDEX IF NOT EXISTS idx_usage_daily_tenant ON usage_daily (tenant_id, day);
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO usage_daily (day, tenant_id, user_id, deployment, requests, prompt_tokens, completion_tokens,
+                         total_tokens, cached_tokens)
+VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (day, tenant_id, user_id, deployment) DO UPDATE SET
+    requests = requests + 1,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    total_tokens = total_tokens + excluded.total_tokens,
+    cached_tokens = cached_tokens + excluded.cached_tokens
+"""
+
+GROUP_BY_COLUMNS = ("day", "month", "tenant_id", "user_id", "deployment")
+
+
+class _CounterLoad:
+    """Request for the writer thread to load counters from the rollup once everything queued before it is written"""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.values: Dict[tuple, int] = {}
+        self.done = threading.Event()
+
+
+class BudgetExceededError(Exception):
+    """Raised when a user or tenant has used up its token budget for the current period"""
+
+
+@dataclass
+class UsageRecord:
+    """Token usage of a single completion"""
+
+    ts: float
+    tenant_id: str
+    user_id: str
+    deployment: str
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cached_tokens: int = 0
+    estimated: bool = False
+
+    @property
+    def day(self) -> str:
+        return datetime.fromtimestamp(self.ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+@dataclass
+class Budgets:
+    """Token budgets; None means unlimited"""
+
+    user_daily: Optional[int] = None
+    user_monthly: Optional[int] = None
+    tenant_daily: Optional[int] = None
+    tenant_monthly: Optional[int] = None
+
+
+def connect(db_path) -> sqlite3.Connection:
+    """Open the ledger database and make sure the schema exists."""
+    connection = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class UsageLedger:
+    """Records token usage asynchronously and enforces budgets from in-memory rolling counters"""
+
+    def __init__(self, db_path, budgets: Optional[Budgets] = None, batch_size: int = 500,
+                 flush_interval: float = 1.0, counter_ttl: float = 60, clock: Callable[[], float] = time.time):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.budgets = budgets or Budgets()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.counter_ttl = counter_ttl
+        self.clock = clock
+
+        self._counters: Dict[tuple, int] = {}
+        self._loaded_at: Dict[tuple, float] = {}
+        self._loading: Dict[tuple, _CounterLoad] = {}
+        self._counters_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_forever, name="usage-ledger", daemon=True)
+        self._writer.start()
+
+    # Period keys for the rolling counters
+    def _periods(self, ts: float):
+        now = datetime.fromtimestamp(ts, tz=timezone.utc)
+        return now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+
+    def record(self, record: UsageRecord):
+        """Count a completion against its user and tenant and queue it for writing."""
+        day, month = self._periods(record.ts)
+        # Queued under the lock, so a record is either counted in memory or written before a pending counter load
+        with self._counters_lock:
+            for key in self._counter_keys(record.user_id, record.tenant_id, day, month):
+                if key in self._counters:
+                    self._counters[key] += record.total_tokens
+            self._queue.put(record)
+
+    def record_completion(self, security_context, deployment: str, chat_message):
+        """Record a ChatMessage for the user in a UserSecurityContext."""
+        self.record(UsageRecord(
+            ts=self.clock(),
+            tenant_id=(security_context.end_user_tenant_id if security_context else None) or "unknown",
+            user_id=(security_context.end_user_id if security_context else None) or "unknown",
+            deployment=deployment,
+            prompt_tokens=chat_message.prompt_tokens or 0,
+            completion_tokens=chat_message.completion_tokens or 0,
+            total_tokens=chat_message.total_tokens or 0,
+            cached_tokens=getattr(chat_message, "cached_tokens", 0) or 0,
+            estimated=getattr(chat_message, "usage_estimated", False)
+        ))
+
+    def usage(self, user_id: str, tenant_id: str, timeout: float = 10) -> Dict[str, int]:
+        """Return the tokens used today and this month by a user and their tenant."""
+        now = self.clock()
+        day, month = self._periods(now)
+        keys = self._counter_keys(user_id, tenant_id, day, month)
+        with self._counters_lock:
+            # Counters from earlier periods are no longer needed
+            for key in [k for k in self._counters if k[3] not in (day, month)]:
+                del self._counters[key]
+                self._loaded_at.pop(key, None)
+
+            pending = {key: self._loading[key] for key in keys if key in self._loading}
+            stale = [
+                key for key in keys
+                if key not in pending and (key not in self._counters or now - self._loaded_at[key] >= self.counter_ttl)
+            ]
+            if stale:
+                # The counters restart from zero and count records queued from here on; the writer adds the
+                # database total of everything queued before the request
+                request = _CounterLoad(stale)
+                for key in stale:
+                    self._counters[key] = 0
+                    self._loaded_at[key] = now
+                    self._loading[key] = request
+                    pending[key] = request
+                self._queue.put(request)
+
+        # Wait for the writer without holding the lock, so completions can still be recorded meanwhile
+        for request in set(pending.values()):
+            if not request.done.wait(timeout):
+                logger.error("Timed out loading usage counters from the ledger")
+
+        with self._counters_lock:
+            for key, request in pending.items():
+                if self._loading.get(key) is request and request.done.is_set():
+                    del self._loading[key]
+                    if key in self._counters:
+                        self._counters[key] += request.values.get(key, 0)
+            values = [self._counters.get(key, 0) for key in keys]
+        return dict(zip(("user_daily", "user_monthly", "tenant_daily", "tenant_monthly"), values))
+
+    def check_budget(self, security_context):
+        """Raise BudgetExceededError if the user or their tenant has no budget left for the current period."""
+        if all(budget is None for budget in vars(self.budgets).values()):
+            return
+
+        user_id = (security_context.end_user_id if security_context else None) or "unknown"
+        tenant_id = (security_context.end_user_tenant_id if security_context else None) or "unknown"
+        used = self.usage(user_id, tenant_id)
+        for name, used_tokens in used.items():
+            budget = getattr(self.budgets, name)
+            if budget is not None and used_tokens >= budget:
+                scope, period = name.split("_")
+                raise BudgetExceededError(
+                    f"The {period} token budget for this {scope} has been used ({used_tokens}/{budget} tokens)"
+                )
+
+    def flush(self, timeout: float = 10):
+        """Block until every queued record has been written."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _counter_keys(self, user_id, tenant_id, day, month):
+        return [
+            ("user", user_id, "day", day),
+            ("user", user_id, "month", month),
+            ("tenant", tenant_id, "day", day),
+            ("tenant", tenant_id, "month", month),
+        ]
+
+    def _load_counter(self, connection, scope, identifier, period, period_key) -> int:
+        column = "user_id" if scope == "user" else "tenant_id"
+        if period == "day":
+            where, args = "day = ?", (period_key,)
+        else:
+            where, args = "day >= ? AND day < ?", (f"{period_key}-01", f"{period_key}-32")
+        row = connection.execute(
+            f"SELECT COALESCE(SUM(total_tokens), 0) FROM usage_daily WHERE {column} = ? AND {where}",
+            (identifier, *args)
+        ).fetchone()
+        return row[0]
+
+    def _write_forever(self):
+        connection = connect(self.db_path)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Collect records until the batch is full or the flush interval passes; a flush or counter load
+            # request ends it early
+            while len(batch) < self.batch_size and not isinstance(batch[-1], (threading.Event, _CounterLoad)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            records = [item for item in batch if isinstance(item, UsageRecord)]
+            if records:
+                try:
+                    self._write_batch(connection, records)
+                except sqlite3.Error:
+                    logger.error(f"Failed to write {len(records)} usage records", exc_info=True)
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif isinstance(item, _CounterLoad):
+                    try:
+                        item.values = {key: self._load_counter(connection, *key) for key in item.keys}
+                    except sqlite3.Error:
+                        logger.error("Failed to load usage counters", exc_info=True)
+                    item.done.set()
+
+    def _write_batch(self, connection, records: List[UsageRecord]):
+        with connection:
+            connection.executemany(
+                "INSERT INTO usage_events (ts, day, tenant_id, user_id, deployment, prompt_tokens, "
+                "completion_tokens, total_tokens, cached_tokens, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (r.ts, r.day, r.tenant_id, r.user_id, r.deployment, r.prompt_tokens, r.completion_tokens,
+                     r.total_tokens, r.cached_tokens, int(r.estimated))
+                    for r in records
+                ]
+            )
+            connection.executemany(
+                ROLLUP_UPSERT,
+                [
+                    (r.day, r.tenant_id, r.user_id, r.deployment, r.prompt_tokens, r.completion_tokens,
+                     r.total_tokens, r.cached_tokens)
+                    for r in records
+                ]
+            )
+
+
+def aggregate_usage(db_path, group_by: Sequence[str] = ("tenant_id", "user_id"), since: Optional[str] = None,
+                    until: Optional[str] = None, tenant_id: Optional[str] = None,
+                    user_id: Optional[str] = None) -> List[Dict]:
+    """
+    Aggregate token usage from the daily rollup.
+
+    Args:
+        db_path: Path of the ledger database
+        group_by: Columns to group by; any of day, month, tenant_id, user_id, deployment
+        since: First day to include (YYYY-MM-DD)
+        until: Last day to include (YYYY-MM-DD)
+        tenant_id: Only include this tenant
+        user_id: Only include this user
+
+    Returns:
+        list: One dict per group with request and token totals, largest total first
+    """
+    invalid = [column for column in group_by if column not in GROUP_BY_COLUMNS]
+    if invalid:
+        raise ValueError(f"Cannot group by {invalid}; choose from {GROUP_BY_COLUMNS}")
+
+    select = [("substr(day, 1, 7) AS month" if column == "month" else column) for column in group_by]
+    filters, args = [], []
+    for clause, value in (("day >= ?", since), ("day <= ?", until), ("tenant_id = ?", tenant_id),
+                          ("user_id = ?", user_id)):
+        if value is not None:
+            filters.append(clause)
+            args.append(value)
+
+    sql = (
+        f"SELECT {', '.join(select + ['SUM(requests)', 'SUM(prompt_tokens)', 'SUM(completion_tokens)', 'SUM(total_tokens)', 'SUM(cached_tokens)'])} "
+        f"FROM usage_daily"
+        + (f" WHERE {' AND '.join(filters)}" if filters else "")
+        + (f" GROUP BY {', '.join(group_by)}" if group_by else "")
+        + " ORDER BY SUM(total_tokens) DESC"
+    )
+
+    connection = connect(db_path)
+    try:
+        rows = connection.execute(sql, args).fetchall()
+    finally:
+        connection.close()
+
+    columns = list(group_by) + ["requests", "prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+@lru_cache(maxsize=1)
+def get_usage_ledger() -> UsageLedger:
+    """Return the process-wide usage ledger configured from environment variables."""
+    return UsageLedger(
+        db_path=os.getenv("USAGE_LEDGER_PATH", "data/usage_ledger.sqlite3"),
+        budgets=Budgets(
+            user_daily=_env_int("USAGE_USER_DAILY_TOKEN_BUDGET"),
+            user_monthly=_env_int("USAGE_USER_MONTHLY_TOKEN_BUDGET"),
+            tenant_daily=_env_int("USAGE_TENANT_DAILY_TOKEN_BUDGET"),
+            tenant_monthly=_env_int("USAGE_TENANT_MONTHLY_TOKEN_BUDGET"),
+        ),
+        counter_ttl=float(os.getenv("USAGE_COUNTER_TTL", "60"))
+    )
@@ -0,0 +1,350 @@
+"""
+Startup warm-up and readiness reporting.
+
+Before a replica takes traffic, the warm-up runs the slow first-use steps that its first users would otherwise pay
+for: heavy imports and image codecs, the DefaultAzureCredential chain, MSAL discovery and the token cache store,
+and TLS to Microsoft Graph and the Azure OpenAI endpoint through the shared connection pools. Every step fills the
+same process-wide singleton the app uses later, so the work is not repeated.
+
+Failed steps are retried with exponential backoff until the warm-up timeout, so a transient failure at boot does not
+leave a replica unready for its whole life. Steps still failed when the warm-up is reported keep being retried in the
+background at a fixed interval, so the replica turns ready once the dependency recovers. Steps listed in WARMUP_SKIP
+are reported as skipped.
+
+A small HTTP server on a separate port reports the warm-up state and the latency of each dependency at /ready. It
+answers 503 until every step has succeeded and Streamlit itself answers its own health check, so it can back a
+container HEALTHCHECK or a readiness probe.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+
+class SkipStep(Exception):
+    """Raised by a warm-up step whose dependency is not configured"""
+
+
+@dataclass
+class StepResult:
+    """Outcome of one warm-up step"""
+
+    state: str = "pending"
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+
+class Warmup:
+    """Runs warm-up steps concurrently and records the outcome and latency of each"""
+
+    def __init__(self, steps: Dict[str, Callable[[], None]], timeout: float = 120, retries: int = 5,
+                 backoff: float = 1.0, recheck_interval: Optional[float] = 30):
+        """
+        Args:
+            steps: Callables keyed by dependency name; raising SkipStep marks a step skipped rather than failed
+            timeout: Seconds after which steps still running are reported as failed
+            retries: Times a failed step is run again
+            backoff: Seconds before the first retry, doubled for every further retry
+            recheck_interval: Seconds between further attempts at the steps that failed once the warm-up is
+                reported; None to leave them failed
+        """
+        self.steps = steps
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.recheck_interval = recheck_interval
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._results = {name: StepResult() for name in steps}
+        # Steps with an attempt running, including ones stuck past the timeout, which are not run a second time
+        self._in_flight = set(steps)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        """Run every step and block until all have finished or the timeout passes."""
+        self.started_at = time.time()
+        deadline = time.monotonic() + self.timeout
+        executor = ThreadPoolExecutor(max_workers=len(self.steps) or 1, thread_name_prefix="warmup")
+        futures = [executor.submit(self._run_step, name, step, deadline) for name, step in self.steps.items()]
+        for future in futures:
+            try:
+                future.result(timeout=max(deadline - time.monotonic(), 0))
+            except Exception:
+                pass
+        # A step stuck past the timeout keeps its thread but no longer holds up the report
+        executor.shutdown(wait=False)
+
+        with self._lock:
+            for name, result in self._results.items():
+                if result.state in ("pending", "running", "retrying"):
+                    result.state = "failed"
+                    result.error = f"Timed out after {self.timeout:g}s"
+        self.finished_at = time.time()
+        self._done.set()
+        logger.info(f"Warm-up finished: {json.dumps(self.status())}")
+
+        if self.recheck_interval and not self.ready:
+            threading.Thread(target=self._recheck_failed, name="warmup-recheck", daemon=True).start()
+
+    def start(self) -> threading.Thread:
+        """Run the warm-up on a background thread."""
+        thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._done.is_set() and all(result.state in ("ok", "skipped") for result in self._results.values())
+
+    def status(self) -> Dict:
+        """Return the overall state and the result of every step."""
+        with self._lock:
+            steps = {name: asdict(result) for name, result in self._results.items()}
+            done = self._done.is_set()
+        if not done:
+            state = "warming"
+        elif all(step["state"] in ("ok", "skipped") for step in steps.values()):
+            state = "ready"
+        else:
+            state = "failed"
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {"state": state, "duration_s": duration, "steps": steps}
+
+    def _run_step(self, name: str, step: Callable[[], None], deadline: float):
+        try:
+            self._run_step_attempts(name, step, deadline)
+        finally:
+            with self._lock:
+                self._in_flight.discard(name)
+
+    def _run_step_attempts(self, name: str, step: Callable[[], None], deadline: float):
+        delay = self.backoff
+        for attempt in range(1, self.retries + 2):
+            with self._lock:
+                result = self._results[name]
+                if result.state not in ("pending", "running", "retrying"):
+                    # Reported as timed out already
+                    return
+                result.state = "running"
+                result.attempts = attempt
+            state, error, latency_ms = self._attempt(name, step, attempt)
+
+            # The latency of the last attempt is the one a user would see
+            retry = state == "failed" and attempt <= self.retries and time.monotonic() + delay < deadline
+            with self._lock:
+                if result.state != "running":
+                    return
+                result.state = "retrying" if retry else state
+                result.error = error
+                result.latency_ms = latency_ms
+            if not retry:
+                return
+            time.sleep(delay)
+            delay *= 2
+
+    def _attempt(self, name: str, step: Callable[[], None], attempt: int):
+        started = time.perf_counter()
+        state, error = "ok", None
+        try:
+            step()
+        except SkipStep as e:
+            state, error = "skipped", str(e)
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed on attempt {attempt}", exc_info=True)
+            state, error = "failed", str(e)
+        return state, error, round((time.perf_counter() - started) * 1000, 1)
+
+    def _recheck_failed(self):
+        while True:
+            time.sleep(self.recheck_interval)
+            with self._lock:
+                failed = [name for name, result in self._results.items() if result.state == "failed"]
+                due = [name for name in failed if name not in self._in_flight]
+                self._in_flight.update(due)
+            if not failed:
+                logger.info("Every failed warm-up step has recovered")
+                return
+            for name in due:
+                threading.Thread(target=self._recheck_step, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+    def _recheck_step(self, name: str):
+        try:
+            with self._lock:
+                result = self._results[name]
+                result.attempts += 1
+                attempt = result.attempts
+            state, error, latency_ms = self._attempt(name, self.steps[name], attempt)
+            with self._lock:
+                # The step stays failed until an attempt succeeds
+                if state != "failed":
+                    result.state = state
+                result.error = error
+                result.latency_ms = latency_ms
+            if state != "failed":
+                logger.info(f"Warm-up step {name} recovered on attempt {attempt}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(name)
+
+
+def probe_url(url: str, timeout: float = 2) -> Optional[str]:
+    """Return None if url answers with a success status, otherwise why it did not."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout):
+            return None
+    except Exception as e:
+        return str(e)
+
+
+def _require_env(*names: str) -> list:
+    values = [os.getenv(name) for name in names]
+    missing = [name for name, value in zip(names, values) if not value]
+    if missing:
+        raise SkipStep(f"{', '.join(missing)} not set")
+    return values
+
+
+def warm_imports():
+    """Import the heavy libraries the app loads on first use."""
+    import numpy  # noqa: F401
+    import openai  # noqa: F401
+    import pypdf  # noqa: F401
+
+
+def warm_image_codecs():
+    """Load the Pillow plugins and run a small image through the upload pipeline."""
+    import io
+    from PIL import Image
+    from ..utils.image_processor import process_image
+
+    Image.init()
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, format="PNG")
+    process_image(original_image=buffer.getvalue(), image_detail="high")
+
+
+def warm_document_workers():
+    """Start the document worker processes."""
+    from ..utils.document_processor import chunk_pages, get_document_executor
+
+    get_document_executor().submit(chunk_pages, "warmup", ["warm up"]).result()
+
+
+def warm_credential():
+    """Resolve the DefaultAzureCredential chain and cache a token for Azure OpenAI."""
+    from ..auth.client_auth import get_default_credential
+
+    get_default_credential().get_token(COGNITIVE_SERVICES_SCOPE)
+
+
+def warm_msal():
+    """Run MSAL authority discovery and open the token cache store."""
+    from ..auth.token_cache import get_msal_app, get_token_cache_store
+
+    client_id, tenant_id, client_secret = _require_env("AZURE_CLIENT_ID", "AZURE_TENANT_ID", "AZURE_CLIENT_SECRET")
+    get_msal_app(client_id, tenant_id, client_secret)
+    get_token_cache_store()
+
+
+def warm_graph():
+    """Open a TLS connection to Microsoft Graph in the shared session."""
+    from ..auth.graph_client import GRAPH_TIMEOUT, get_graph_session
+
+    # Any HTTP response, including 401, means the connection is pooled and ready
+    get_graph_session().head("https://graph.microsoft.com/v1.0/", timeout=GRAPH_TIMEOUT)
+
+
+def warm_openai_endpoint():
+    """Open a TLS connection to the Azure OpenAI endpoint in the shared connection pool."""
+    from .client import get_http_client
+
+    endpoint, = _require_env("AZURE_OPENAI_ENDPOINT")
+    get_http_client().head(endpoint, timeout=10)
+
+
+def _skipped_step():
+    raise SkipStep("Listed in WARMUP_SKIP")
+
+
+def default_steps() -> Dict[str, Callable[[], None]]:
+    """
+    Return the warm-up steps for the app. Steps named in the comma-separated WARMUP_SKIP are reported as skipped, for
+    example credential in deployments that only call Azure OpenAI on behalf of the user.
+    """
+    steps = {
+        "imports": warm_imports,
+        "image_codecs": warm_image_codecs,
+        "document_workers": warm_document_workers,
+        "credential": warm_credential,
+        "msal": warm_msal,
+        "graph": warm_graph,
+        "openai_endpoint": warm_openai_endpoint,
+    }
+    skipped = {name.strip() for name in os.getenv("WARMUP_SKIP", "").split(",") if name.strip()}
+    for name in skipped - steps.keys():
+        logger.warning(f"WARMUP_SKIP names unknown warm-up step {name}")
+    return {name: _skipped_step if name in skipped else step for name, step in steps.items()}
+
+
+class _ReadinessHandler(BaseHTTPRequestHandler):
+    warmup: Warmup = None
+    app_health_url: Optional[str] = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/ready":
+            self.send_error(404)
+            return
+        status = self.warmup.status()
+        ready = self.warmup.ready
+        if self.app_health_url is not None:
+            error = probe_url(self.app_health_url)
+            status["app"] = {"state": "ok" if error is None else "failed", "error": error}
+            ready = ready and error is None
+        body = json.dumps(status).encode("utf-8")
+        self.send_response(200 if ready else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Probes arrive every few seconds, so keep them out of the application log
+        logger.debug(format % args)
+
+
+def start_readiness_server(warmup: Warmup, port: int, host: str = "0.0.0.0",
+                           app_health_url: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Serve the warm-up status at /ready on its own port from a background thread.
+
+    Args:
+        warmup: The warm-up to report on
+        port: Port to listen on
+        host: Address to bind
+        app_health_url: Health URL of the app, probed on every request; /ready fails while it does not answer
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    handler = type("ReadinessHandler", (_ReadinessHandler,), {"warmup": warmup, "app_health_url": app_health_url})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    logger.info(f"Readiness endpoint listening on http://{host}:{port}/ready")
+    return server
@@ -2,7 +2,51 @@
 Reusable UI components for the Streamlit chatbot application.
 """
 
+import functools
+import os
 import streamlit as st
+from ..core.messages import create_user_message_with_image, create_user_message_text_only
+from ..utils.rerun_profiler import get_rerun_profiler
+from .session import tracked_session_run
+
+
+def fragments_enabled():
+    """
+    Return whether the app runs its parts as Streamlit fragments. USE_FRAGMENTS=0 turns them off.
+    """
+    # Checked per call because the environment files are loaded after the app module is imported
+    return os.getenv("USE_FRAGMENTS", "1") != "0"
+
+
+def fragment(scope, run_every=None):
+    """
+    Run the decorated function as a Streamlit fragment, timed under scope in the rerun measurement mode and
+    holding the session in the memory accountant.
+    
+    Widgets inside a fragment only rerun the fragment. USE_FRAGMENTS=0 runs the function as plain code instead, which
+    is how the app behaved before it was split into fragments.
+    
+    Args:
+        scope (str): Name the runs of the fragment are recorded under
+        run_every (float): Seconds after which the fragment reruns on its own; None to only rerun on interaction
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with get_rerun_profiler().measure(scope), tracked_session_run():
+                return func(*args, **kwargs)
+
+        as_fragment = st.fragment(timed, run_every=run_every)
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            if not fragments_enabled():
+                return timed(*args, **kwargs)
+            return as_fragment(*args, **kwargs)
+
+        return run
+
+    return decorator
 
 def setup_main_page():
     """
@@ -35,19 +79,23 @@ def display_chat_messages(messages):
             st.chat_message(msg["role"]).write(msg["content"])
 
 
-def display_token_usage(status_box, chat_message):
+def display_token_usage(status_box, chat_message, cache_hit_ratio=None):
     """
-    Display token usage information in the sidebar status box.
+    Display token usage information in the status box above the chat input.
     
     Args:
         status_box: Streamlit empty container for displaying status
         chat_message: ChatMessage object containing token usage information
+        cache_hit_ratio (float): Optional share of prompt tokens served from the prompt cache for the deployment
     """
     token_count = (
-        f"Prompt tokens: {chat_message.prompt_tokens}, "
+        f"Prompt tokens: {chat_message.prompt_tokens} "
+        f"(cached: {chat_message.cached_tokens}), "
         f"Completion tokens: {chat_message.completion_tokens}, "
         f"Total tokens: {chat_message.total_tokens}"
     )
+    if cache_hit_ratio is not None:
+        token_count += f", Prompt cache hit ratio: {cache_hit_ratio:.0%}"
 
     status_box.markdown(
         f"""
@@ -59,47 +107,63 @@ def display_token_usage(status_box, chat_message):
     )
 
 
-def create_user_message_with_image(prompt, base64_data, image_detail):
+def display_rerun_profile():
     """
-    Create a user message dictionary that includes both text and image.
-    
-    Args:
-        prompt (str): The text prompt from the user
-        base64_data (str): Base64 encoded image data
-        image_detail (str): Image detail level ("low" or "high")
-        
-    Returns:
-        dict: Formatted message dictionary for OpenAI API
-    """
-    return {
-        "role": "user",
-        "content": [
-            {
-                "type": "text",
-                "text": prompt
-            },
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{base64_data}",
-                    "detail": image_detail
-                }
-            }
-        ]
-    }
-
-
-def create_user_message_text_only(prompt):
-    """
-    Create a simple text-only user message.
+    Display the rerun measurements when RERUN_PROFILE=1.
+    """
+    profiler = get_rerun_profiler()
+    if not profiler.enabled:
+        return
+
+    with st.expander("Rerun profile"):
+        st.caption("Fragments on" if fragments_enabled() else "Fragments off")
+        st.table([{"scope": scope, **stats} for scope, stats in profiler.snapshot().items()])
+
+
+def display_model_comparison(events, deployment_names):
+    """
+    Display a side-by-side comparison, streaming each model's answer into its own column.
     
     Args:
-        prompt (str): The text prompt from the user
+        events: Iterator of ComparisonEvent objects from compare_models
+        deployment_names (list): Deployments being compared, in column order
         
     Returns:
-        dict: Formatted message dictionary
+        dict: ModelComparisonResult objects keyed by deployment name
     """
-    return {"role": "user", "content": prompt}
+    columns = st.columns(len(deployment_names))
+    placeholders = {}
+    metrics = {}
+    for column, deployment_name in zip(columns, deployment_names):
+        with column:
+            st.markdown(f"**{deployment_name}**")
+            placeholders[deployment_name] = st.empty()
+            metrics[deployment_name] = st.empty()
+
+    results = {}
+    for event in events:
+        if event.result is None:
+            placeholders[event.deployment_name].markdown(event.full_response)
+            continue
+
+        result = event.result
+        results[event.deployment_name] = result
+        if result.error:
+            placeholders[event.deployment_name].error(result.error)
+            continue
+
+        placeholders[event.deployment_name].markdown(result.chat_message.full_response)
+        ttft = f"{result.time_to_first_token:.2f}s" if result.time_to_first_token is not None else "n/a"
+        metrics[event.deployment_name].caption(
+            f"Time to first token: {ttft} | "
+            f"Total latency: {result.total_latency:.2f}s | "
+            f"Prompt tokens: {result.chat_message.prompt_tokens} "
+            f"(cached: {result.chat_message.cached_tokens}), "
+            f"Completion tokens: {result.chat_message.completion_tokens}, "
+            f"Total tokens: {result.chat_message.total_tokens}"
+        )
+
+    return results
 
 
 def remove_image_from_message(messages, prompt):
@@ -0,0 +1,111 @@
+"""
+Connects Streamlit sessions to the process-wide session memory accountant.
+"""
+
+from contextlib import contextmanager
+
+import streamlit as st
+
+from ..auth.token_cache import (
+    EncryptedFileTokenCacheStore,
+    SessionTokenCacheStore,
+    delete_user_token_cache,
+    get_token_cache_store,
+)
+from ..auth.token_lifecycle import get_token_lifecycle_manager
+from ..core.retrieval import DocumentIndex
+from ..core.session_memory import get_session_memory_accountant
+from ..core.stream_task import get_stream_task_registry
+
+# Large session state moved to disk while a session is idle or over its cap
+SPILL_KEYS = ("messages", "document_index")
+
+# Session state dropped when a session is evicted; the app starts the session over at the login page
+EVICT_KEYS = SPILL_KEYS + (
+    "sidebar_config",
+    "last_token_usage",
+    "user_authenticated",
+    "user_info",
+    "auth_token",
+    "graph_access_token",
+    "id_token",
+    "auth_expiry",
+    "app_access_token",
+    "app_auth_expiry",
+    "home_account_id",
+    "user_auth",
+    "security_context",
+    SessionTokenCacheStore.SESSION_KEY
+)
+
+
+def release_session_resources(session_id):
+    """
+    Drop the process-wide resources of an evicted or closed session.
+
+    Args:
+        session_id (str): Identifier of the session
+    """
+    get_token_lifecycle_manager().unregister(session_id)
+    get_stream_task_registry().remove(session_id)
+
+
+def delete_evicted_token_cache(session_id, state):
+    """
+    Delete the persisted token cache of an evicted session, which would otherwise outlive its sign-in.
+
+    Args:
+        session_id (str): Identifier of the session
+        state: Session state of the session, before its evict keys are dropped
+    """
+    # Caches kept in the session state go with the evict keys
+    if isinstance(get_token_cache_store(), EncryptedFileTokenCacheStore):
+        delete_user_token_cache(state.get("home_account_id"))
+
+
+def get_session_memory():
+    """
+    Return the session memory accountant configured with this app's session state keys.
+
+    Returns:
+        SessionMemoryAccountant: The process-wide accountant
+    """
+    accountant = get_session_memory_accountant(SPILL_KEYS, EVICT_KEYS)
+    accountant.add_release_listener(release_session_resources)
+    accountant.add_evict_listener(delete_evicted_token_cache)
+    accountant.register_codec("document_index", DocumentIndex.to_dict, DocumentIndex.from_dict)
+    return accountant
+
+
+@contextmanager
+def tracked_session_run():
+    """
+    Hold this session in the accountant for the duration of a script or fragment run.
+    """
+    session_id = st.session_state.get("session_id")
+    if session_id is None:
+        yield
+        return
+
+    with get_session_memory().track(session_id, st.session_state) as evicted:
+        if evicted:
+            # Fragments rely on the state main() sets up, so start over with a full run, which shows the login page
+            st.rerun()
+        yield
+
+
+def run_session_housekeeping():
+    """
+    Spill or evict this session if the sweeper marked it. Runs as a fragment on a timer, so idle sessions act on
+    the marks without any interaction and without counting as active.
+    """
+    session_id = st.session_state.get("session_id")
+    if session_id is None:
+        return
+    if get_session_memory().housekeep(session_id, st.session_state) == "evicted":
+        st.rerun(scope="app")
+
+
+def schedule_session_housekeeping():
+    """Add the fragment that runs run_session_housekeeping once per sweep interval."""
+    st.fragment(run_session_housekeeping, run_every=get_session_memory().sweep_interval)()
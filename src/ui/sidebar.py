@@ -1,10 +1,25 @@
 """
 Sidebar configuration for the Streamlit chatbot application.
-Contains all sidebar elements including model selection, token configuration, and image upload.
+Contains all sidebar elements including model selection, token configuration, image and document upload.
+
+The controls run as a fragment, so changing one only reruns the sidebar. The configuration is kept in
+st.session_state.sidebar_config where the chat fragments read it on their next run.
 """
 
+import logging
 import streamlit as st
-from ..utils.image_processor import process_image
+from ..core.retrieval import DocumentIndex
+from ..core.router import AUTO_MODEL
+from ..utils.document_processor import process_document
+from .components import display_rerun_profile, fragment
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+MODEL_OPTIONS = (
+    "gpt-35-turbo",
+    "gpt-4o"
+)
 
 def create_sidebar():
     """
@@ -14,59 +29,107 @@ def create_sidebar():
         dict: A dictionary containing all sidebar configuration values
     """
     with st.sidebar:
-        model = st.selectbox(
-            label="Model",
-            options=(
-                "gpt-35-turbo",
-                "gpt-4o"
-            ),
-            placeholder="gpt-35-turbo"
+        sidebar_fragment()
+    return st.session_state.sidebar_config
+
+
+@fragment("sidebar")
+def sidebar_fragment():
+    """
+    Draw the sidebar controls and store the configuration they set in session state.
+    """
+    model = st.selectbox(
+        label="Model",
+        options=MODEL_OPTIONS + (AUTO_MODEL,),
+        placeholder="gpt-35-turbo",
+        help="auto sends simple prompts to the faster model and complex or image prompts to the stronger one"
+    )
+
+    # Comparison mode sends each prompt to several models at once and shows the answers side by side
+    compare_models = st.checkbox("Compare models")
+    compare_deployments = []
+    if compare_models:
+        compare_deployments = st.multiselect(
+            label="Models to compare",
+            options=MODEL_OPTIONS,
+            default=list(MODEL_OPTIONS)
         )
 
-        max_tokens = st.number_input(
-            label="Max tokens",
-            min_value=100,
-            max_value=10000,
-            value=1000
+    max_tokens = st.number_input(
+        label="Max tokens",
+        min_value=100,
+        max_value=10000,
+        value=1000
+    )
+
+    streaming = st.checkbox("Streaming")
+    on_behalf_of = st.checkbox("On Behalf Of User")
+
+    # Image upload section (only for gpt-4o, or auto which routes image prompts to gpt-4o)
+    uploaded_file = None
+    image_detail = "low"
+    
+    if model in ("gpt-4o", AUTO_MODEL):
+        # The key changes once the image has been sent, which clears the uploader and frees the file
+        uploaded_file = st.file_uploader(
+            "Upload an image", 
+            type=("png", "jpeg", "jpg", "gif", "webp"),
+            key=f"image_uploader_{st.session_state.get('image_uploader_key', 0)}"
         )
+        image_detail = st.selectbox(
+            label="Image detail",
+            options=("low", "high"),
+            placeholder="low"
+        )
+
+    # Documents are chunked and indexed so only the relevant excerpts are sent with each prompt
+    uploaded_documents = st.file_uploader(
+        "Upload documents",
+        type=("pdf", "txt", "md"),
+        accept_multiple_files=True
+    )
+    update_document_index(uploaded_documents or [])
+
+    display_rerun_profile()
 
-        streaming = st.checkbox("Streaming")
-        on_behalf_of = st.checkbox("On Behalf Of User")
-
-        # Image upload section (only for gpt-4o)
-        uploaded_file = None
-        base64_data = None
-        image_detail = "low"
-        
-        if model == "gpt-4o":
-            uploaded_file = st.file_uploader(
-                "Upload an image", 
-                type=("png", "jpeg", "jpg", "gif", "webp")
-            )
-            image_detail = st.selectbox(
-                label="Image detail",
-                options=("low", "high"),
-                placeholder="low"
-            )
-
-            # Process the image if uploaded
-            if uploaded_file is not None:
-                bytes_data = uploaded_file.getvalue()
-                base64_data = process_image(
-                    original_image=bytes_data, 
-                    image_detail=image_detail
-                )
-
-        # Setup status box for token usage
-        status_box = st.empty()
-
-    return {
+    # The image is encoded when a prompt is sent rather than on every sidebar change
+    st.session_state.sidebar_config = {
         'model': model,
         'max_tokens': max_tokens,
         'streaming': streaming,
         'on_behalf_of': on_behalf_of,
+        'compare_models': compare_models and len(compare_deployments) > 0,
+        'compare_deployments': compare_deployments,
         'uploaded_file': uploaded_file,
-        'base64_data': base64_data,
         'image_detail': image_detail,
-        'status_box': status_box
-    }
\ No newline at end of file
+        'uploaded_documents': uploaded_documents or []
+    }
+
+
+def update_document_index(uploaded_documents):
+    """
+    Index newly uploaded documents and drop documents removed from the uploader.
+    
+    Args:
+        uploaded_documents (list): Files currently in the document uploader
+    """
+    if "document_index" not in st.session_state:
+        st.session_state.document_index = DocumentIndex()
+    document_index = st.session_state.document_index
+
+    current = {f"{document.name}:{document.size}": document for document in uploaded_documents}
+    for key in [key for key in document_index.documents if key not in current]:
+        document_index.remove_document(key)
+
+    for key, document in current.items():
+        if key in document_index.documents:
+            continue
+        with st.spinner(f"Indexing {document.name}..."):
+            try:
+                chunks = process_document(document.name, document.getvalue())
+            except Exception as e:
+                st.error(f"Unable to read {document.name}: {e}")
+                logger.error(f"Document processing failed for {document.name}", exc_info=True)
+                continue
+        document_index.add_document(key, chunks)
+        logger.info(f"Indexed {len(chunks)} chunks from {document.name}")
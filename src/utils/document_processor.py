@@ -0,0 +1,123 @@
+import io
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator, List, Tuple
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+# Number of PDF pages extracted by a single worker task
+PDF_PAGES_PER_TASK = 50
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+@dataclass
+class DocumentChunk:
+    """A piece of an uploaded document small enough to inject into a prompt"""
+
+    document: str
+    page: int
+    text: str
+    tokens: int
+
+
+@lru_cache(maxsize=1)
+def get_document_executor() -> ProcessPoolExecutor:
+    """Return the process-wide worker pool used to parse and chunk documents."""
+    # Workers are spawned rather than forked: a fork would copy the server's threads' locks in whatever state they
+    # are in, along with every session's memory
+    return ProcessPoolExecutor(
+        max_workers=int(os.getenv("DOCUMENT_WORKERS", str(min(4, os.cpu_count() or 1)))),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def split_pdf(data: bytes, pages_per_part: int = PDF_PAGES_PER_TASK) -> Iterator[Tuple[int, bytes]]:
+    """
+    Parse a PDF once and yield it as smaller PDFs of consecutive pages.
+
+    Yields:
+        tuple: (index of the first page of the part, bytes of a PDF holding the part's pages)
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    for start in range(0, page_count, pages_per_part):
+        writer = PdfWriter()
+        for index in range(start, min(start + pages_per_part, page_count)):
+            writer.add_page(reader.pages[index])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        yield start, buffer.getvalue()
+
+
+def _extract_pdf_pages(data: bytes) -> List[str]:
+    from pypdf import PdfReader
+    return [page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages]
+
+
+def chunk_pages(document: str, pages: List[str], first_page: int = 1, chunk_tokens: int = 300,
+                overlap_tokens: int = 50) -> List[DocumentChunk]:
+    """
+    Split page texts into overlapping chunks of roughly chunk_tokens tokens.
+
+    Words are used as the unit and counted as 4/3 tokens each, which is close enough for budgeting.
+    """
+    chunk_words = max(int(chunk_tokens * 0.75), 1)
+    step = max(chunk_words - int(overlap_tokens * 0.75), 1)
+    chunks = []
+    for page_number, text in enumerate(pages, start=first_page):
+        words = WORD_PATTERN.findall(text)
+        for start in range(0, len(words), step):
+            piece = words[start:start + chunk_words]
+            chunks.append(DocumentChunk(document, page_number, " ".join(piece), (len(piece) * 4 + 2) // 3))
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+
+def _chunk_pdf_part(document: str, part: bytes, start: int, chunk_tokens: int,
+                    overlap_tokens: int) -> List[DocumentChunk]:
+    # Runs in a worker process on a part of the document only, so no worker parses the whole file
+    return chunk_pages(document, _extract_pdf_pages(part), start + 1, chunk_tokens, overlap_tokens)
+
+
+def process_document(name: str, data: bytes, chunk_tokens: int = 300, overlap_tokens: int = 50) -> List[DocumentChunk]:
+    """
+    Parse an uploaded PDF, text or markdown document and split it into chunks.
+
+    PDFs are parsed once and split into parts of consecutive pages, which are extracted and chunked in parallel in
+    the worker pool. Each part is submitted as soon as it is written.
+
+    Args:
+        name: File name of the document; its extension selects the parser
+        data: Raw bytes of the document
+        chunk_tokens: Approximate size of each chunk in tokens
+        overlap_tokens: Approximate overlap between consecutive chunks in tokens
+
+    Returns:
+        list: DocumentChunk objects in document order
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if extension != ".pdf":
+        text = data.decode("utf-8", errors="replace")
+        return chunk_pages(name, [text], 1, chunk_tokens, overlap_tokens)
+
+    executor = get_document_executor()
+    futures = [
+        executor.submit(_chunk_pdf_part, name, part, start, chunk_tokens, overlap_tokens)
+        for start, part in split_pdf(data)
+    ]
+    logger.info(f"Extracting {len(futures)} parts of up to {PDF_PAGES_PER_TASK} pages from {name}")
+
+    chunks = []
+    for future in futures:
+        chunks.extend(future.result())
+    return chunks
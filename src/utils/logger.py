@@ -1,8 +1,10 @@
 # Disable the Streamlit's overrides
 import logging
-import streamlit.logger
 
 def setup_logger():
+    # Imported here so modules shared with the batch CLI can use this package without loading Streamlit
+    import streamlit.logger
+
     streamlit.logger.get_logger = logging.getLogger
     streamlit.logger.setup_formatter = None
     streamlit.logger.update_formatter = lambda *a, **k: None
@@ -0,0 +1,73 @@
+"""
+Measurement mode for Streamlit reruns.
+
+Set RERUN_PROFILE=1 to time every full script run and every fragment run. Each run is the cost of one user
+interaction, so the totals per scope show how many rerun-seconds the app spends and where. Run once with
+USE_FRAGMENTS=0 to get the numbers for the app without fragments to compare against.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict
+
+# Use the main logger for the application
+logger = logging.getLogger(__name__)
+
+
+class RerunProfiler:
+    """Process-wide counters of how often and how long each scope of the app reruns"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        # Each Streamlit session runs its script on its own thread, so nesting is tracked per thread
+        self._local = threading.local()
+
+    @contextmanager
+    def measure(self, scope: str):
+        """
+        Time a run of a scope. Runs nested in another measured run count towards the outer one only, so a full
+        run of the app is not counted again for each fragment it draws.
+        """
+        if not self.enabled or getattr(self._local, "active", False):
+            yield
+            return
+
+        self._local.active = True
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            # st.rerun and st.stop end a run with an exception; the time spent up to then still counts
+            elapsed = time.perf_counter() - started
+            self._local.active = False
+            with self._lock:
+                stats = self._stats.setdefault(scope, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+            logger.info(f"Rerun of {scope} took {elapsed * 1000:.1f} ms")
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return the run count, total seconds and mean and max milliseconds of each scope."""
+        with self._lock:
+            return {
+                scope: {
+                    "runs": runs,
+                    "seconds": round(seconds, 3),
+                    "mean_ms": round(seconds / runs * 1000, 1),
+                    "max_ms": round(longest * 1000, 1),
+                }
+                for scope, (runs, seconds, longest) in self._stats.items()
+            }
+
+
+@lru_cache(maxsize=1)
+def get_rerun_profiler() -> RerunProfiler:
+    """Return the process-wide rerun profiler, enabled by RERUN_PROFILE=1."""
+    return RerunProfiler(enabled=os.getenv("RERUN_PROFILE") == "1")
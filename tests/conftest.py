@@ -0,0 +1,8 @@
+"""
+Shared pytest setup. The repository root is put on the import path the same way app.py does it.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,83 @@
+"""
+In-memory stand-in for the HTTP client MSAL uses, answering discovery and token requests for one tenant.
+"""
+
+import base64
+import json
+import time
+from urllib.parse import parse_qs
+
+TENANT_ID = "00000000-0000-0000-0000-0000000000aa"
+AUTHORITY_HOST = "https://login.microsoftonline.com"
+
+
+def _b64(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def make_id_token(oid: str, name: str) -> str:
+    claims = {
+        "iss": f"{AUTHORITY_HOST}/{TENANT_ID}/v2.0", "aud": "client", "oid": oid, "tid": TENANT_ID,
+        "preferred_username": f"{name}@example.com", "name": name, "iat": 0, "exp": 4102444800,
+    }
+    return ".".join((_b64({"alg": "none"}), _b64(claims), ""))
+
+
+class StubResponse:
+    def __init__(self, payload: dict, status_code: int = 200):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class StubHttpClient:
+    """
+    Serves instance and OpenID discovery and redeems authorization codes of the form "code-<user>".
+
+    refresh_delay adds latency in seconds to refresh token grants, standing in for the identity provider.
+    """
+
+    def __init__(self, refresh_delay: float = 0):
+        self.requests = []
+        self.refresh_delay = refresh_delay
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        self.requests.append(("GET", url))
+        if "discovery/instance" in url:
+            host = AUTHORITY_HOST.split("//")[1]
+            return StubResponse({"metadata": [{"preferred_network": host, "aliases": [host]}]})
+        base = f"{AUTHORITY_HOST}/{TENANT_ID}"
+        return StubResponse({
+            "authorization_endpoint": f"{base}/oauth2/v2.0/authorize",
+            "token_endpoint": f"{base}/oauth2/v2.0/token",
+            "issuer": f"{base}/v2.0",
+        })
+
+    def post(self, url, params=None, data=None, headers=None, **kwargs):
+        self.requests.append(("POST", url))
+        if isinstance(data, (str, bytes)):
+            data = {key: values[0] for key, values in parse_qs(data).items()}
+        data = data or {}
+        if data.get("grant_type") == "authorization_code":
+            user = data["code"].split("-", 1)[1]
+        elif data.get("grant_type") == "refresh_token":
+            user = data["refresh_token"].split("-", 1)[1]
+            time.sleep(self.refresh_delay)
+        else:
+            return StubResponse({"error": "unsupported_grant_type"}, 400)
+        return StubResponse({
+            "token_type": "Bearer",
+            "scope": data.get("scope", ""),
+            "expires_in": 3600,
+            "access_token": f"at-{user}",
+            "refresh_token": f"rt-{user}",
+            "id_token": make_id_token(f"oid-{user}", user),
+            "client_info": _b64({"uid": f"oid-{user}", "utid": TENANT_ID}),
+        })
+
+    def close(self):
+        pass
@@ -0,0 +1,151 @@
+"""
+In-memory stand-in for the parts of the Azure OpenAI client the chat core and the batch runners use.
+"""
+
+import json
+import threading
+from types import SimpleNamespace
+
+
+def make_completion(content, prompt_tokens=10, completion_tokens=5, usage=True, model="gpt-4o"):
+    usage_object = None
+    if usage:
+        usage_object = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+        )
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(model=model, choices=[SimpleNamespace(message=message)], usage=usage_object)
+
+
+class StubStream:
+    """
+    Streams the content of a completion word by word, then a final chunk with its usage. With a gate, every chunk
+    after the first waits for the gate to be set, so a test can hold the stream open.
+    """
+
+    def __init__(self, completion, gate=None):
+        self.completion = completion
+        self.gate = gate
+        self.closed = False
+
+    def __iter__(self):
+        words = self.completion.choices[0].message.content.split(" ")
+        pieces = [word + " " for word in words[:-1]] + words[-1:]
+        for i, piece in enumerate(pieces):
+            if i and self.gate is not None:
+                self.gate.wait(5)
+            delta = SimpleNamespace(content=piece)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=self.completion.usage)
+
+    def close(self):
+        self.closed = True
+
+
+class StubChatCompletions:
+    """
+    Answers every request with "echo: <last user message>". A prompt found in responses is answered with that
+    value instead: an exception is raised and a callable is called with the request. Streaming requests get a
+    StubStream of the answer, held at stream_gate when one is set.
+    """
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.requests = []
+        self.streams = []
+        self.stream_gate = None
+        self._lock = threading.Lock()
+
+    def create(self, **request):
+        with self._lock:
+            self.requests.append(request)
+        prompt = request["messages"][-1]["content"]
+        if isinstance(prompt, list):
+            prompt = prompt[0]["text"]
+        response = self.responses.get(prompt)
+        if isinstance(response, BaseException):
+            raise response
+        if callable(response):
+            response = response(request)
+        if response is None:
+            response = make_completion(f"echo: {prompt}", model=request["model"])
+        if request.get("stream"):
+            stream = StubStream(response, self.stream_gate)
+            with self._lock:
+                self.streams.append(stream)
+            return stream
+        return response
+
+
+class StubFileContent:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def iter_lines(self):
+        return iter(self.data.decode("utf-8").splitlines())
+
+
+class StubFiles:
+    def __init__(self):
+        self.files = {}
+
+    def create(self, file, purpose):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = file.read()
+        return SimpleNamespace(id=file_id)
+
+    def content(self, file_id):
+        return StubFileContent(self.files[file_id])
+
+
+class StubBatches:
+    """Completes every batch on its first retrieve by answering each request with an echo of its prompt."""
+
+    def __init__(self, files: StubFiles):
+        self.files = files
+        self.batches = {}
+
+    def create(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = SimpleNamespace(
+            id=batch_id, input_file_id=input_file_id, status="in_progress",
+            output_file_id=None, error_file_id=None, request_counts=None,
+        )
+        return self.batches[batch_id]
+
+    def retrieve(self, batch_id):
+        batch = self.batches[batch_id]
+        if batch.status != "completed":
+            self.complete(batch)
+        return batch
+
+    def requests(self, batch_id):
+        data = self.files.files[self.batches[batch_id].input_file_id]
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    def complete(self, batch):
+        lines = []
+        for request in self.requests(batch.id):
+            body = request["body"]
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": {
+                    "model": body["model"],
+                    "choices": [{"message": {"content": f"echo: {body['messages'][-1]['content']}"}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                }},
+            }))
+        output_file_id = f"file-{len(self.files.files)}"
+        self.files.files[output_file_id] = ("\n".join(lines) + "\n").encode("utf-8")
+        batch.output_file_id = output_file_id
+        batch.status = "completed"
+
+
+class StubClient:
+    def __init__(self, responses=None):
+        self.chat = SimpleNamespace(completions=StubChatCompletions(responses))
+        self.files = StubFiles()
+        self.batches = StubBatches(self.files)
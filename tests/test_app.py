@@ -0,0 +1,141 @@
+import sys
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import app
+import src.auth
+import src.core
+from src.core import usage_ledger
+from src.core.chat import setup_assistant
+from src.core.conversation import SUMMARY_HEADER
+from src.core.usage_ledger import UsageLedger
+from src.utils.rerun_profiler import get_rerun_profiler
+from tests.openai_stub import StubClient
+
+APP_PATH = str(Path(app.__file__))
+
+
+def run_input_fragment():
+    """A run of the input fragment alone, as when only the prompt box reruns."""
+    import app
+
+    app.initialize_session_state()
+    app.render_chat_input()
+
+
+@pytest.fixture
+def reruns(monkeypatch, tmp_path):
+    """Stubs the model and token services of the app and records full reruns instead of running them."""
+    requested = []
+    client = StubClient()
+    monkeypatch.setattr(app, "get_access_token_client_credentials", lambda scope: None)
+    monkeypatch.setattr(app, "create_azure_client", lambda token_provider: client)
+    ledger = UsageLedger(tmp_path / "ledger.sqlite3", flush_interval=0.05)
+    monkeypatch.setattr(app, "get_usage_ledger", lambda: ledger)
+    monkeypatch.setattr(app.st, "rerun", lambda *args, **kwargs: requested.append(kwargs))
+    # AppTest runs the script as __main__, which spawned document workers would otherwise import
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+    return requested
+
+
+def signed_in_session(at, messages, rendered_count):
+    at.session_state["user_authenticated"] = True
+    at.session_state["user_info"] = {"displayName": "Alice", "userPrincipalName": "alice@contoso.com"}
+    at.session_state["user_auth"] = None
+    at.session_state["messages"] = messages
+    at.session_state["history_rendered_count"] = rendered_count
+    at.session_state["sidebar_config"] = {
+        "model": "gpt-4o", "max_tokens": 100, "streaming": False, "on_behalf_of": False, "compare_models": False,
+        "compare_deployments": [], "uploaded_file": None, "image_detail": "auto", "uploaded_documents": [],
+    }
+
+
+def test_compaction_after_fragment_only_turns_forces_a_full_rerun(reruns):
+    at = AppTest.from_function(run_input_fragment, default_timeout=30)
+    # The history fragment last drew the first two messages; later turns came from runs of the input fragment
+    turns = [{"role": role, "content": f"turn {i}"} for i, role in enumerate(["user", "assistant"] * 3)]
+    signed_in_session(at, [setup_assistant(), {"role": "assistant", "content": "Hello!"}] + turns, 2)
+    at.run()
+    assert reruns == []
+
+    at.chat_input[0].set_value("next question").run()
+
+    messages = at.session_state["messages"]
+    # Compaction left [system, summary, latest turn], so the history is longer than what was drawn yet stale
+    assert messages[1]["content"].startswith(SUMMARY_HEADER)
+    assert len(messages) == 4 > at.session_state["history_rendered_count"]
+    assert reruns == [{}]
+
+
+def test_turn_without_compaction_stays_in_the_fragment(reruns):
+    at = AppTest.from_function(run_input_fragment, default_timeout=30)
+    signed_in_session(at, [setup_assistant(), {"role": "assistant", "content": "Hello!"}], 2)
+    at.run()
+
+    at.chat_input[0].set_value("hi").run()
+
+    assert [message["content"] for message in at.session_state["messages"][2:]] == ["hi", "echo: hi"]
+    assert reruns == []
+
+
+@pytest.fixture
+def full_app(monkeypatch, tmp_path):
+    """Runs app.py with the model and token services stubbed and the rerun measurement mode on."""
+    client = StubClient()
+    ledger = UsageLedger(tmp_path / "ledger.sqlite3", flush_interval=0.05)
+    # app.py runs as a fresh module on every run, so the names it imports are replaced where they are defined
+    monkeypatch.setattr(src.core, "create_azure_client", lambda token_provider: client)
+    monkeypatch.setattr(src.auth, "get_access_token_client_credentials", lambda scope: None)
+    monkeypatch.setattr(usage_ledger, "get_usage_ledger", lambda: ledger)
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+    monkeypatch.setenv("RERUN_PROFILE", "1")
+    get_rerun_profiler.cache_clear()
+
+    def start():
+        at = AppTest.from_file(APP_PATH, default_timeout=30)
+        at.session_state["user_authenticated"] = True
+        at.session_state["user_info"] = {"displayName": "Alice", "userPrincipalName": "alice@contoso.com"}
+        return at
+
+    start.client = client
+    yield start
+    get_rerun_profiler.cache_clear()
+
+
+def chat_transcript(at):
+    return [(message.name, message.markdown[0].value) for message in at.chat_message]
+
+
+@pytest.mark.parametrize("use_fragments", ["1", "0"])
+def test_turns_are_drawn_once_by_the_history_and_input_parts(full_app, monkeypatch, use_fragments):
+    monkeypatch.setenv("USE_FRAGMENTS", use_fragments)
+    at = full_app()
+    at.run()
+
+    # The input part draws the new turn; the next full run draws it as part of the history instead
+    at.chat_input[0].set_value("hi").run()
+    assert chat_transcript(at) == [("assistant", "Hello!"), ("user", "hi"), ("assistant", "echo: hi")]
+    at.run()
+    assert chat_transcript(at) == [("assistant", "Hello!"), ("user", "hi"), ("assistant", "echo: hi")]
+    assert not at.exception
+
+
+def test_sidebar_settings_reach_the_input_part(full_app):
+    at = full_app()
+    at.run()
+
+    at.sidebar.number_input[0].set_value(500).run()
+    at.chat_input[0].set_value("hi").run()
+
+    assert full_app.client.chat.completions.requests[-1]["max_tokens"] == 500
+    assert at.session_state["messages"][-1]["content"] == "echo: hi"
+
+
+def test_fragments_drawn_by_a_full_run_are_measured_as_part_of_it(full_app):
+    at = full_app()
+    at.run()
+    at.run()
+
+    assert {scope: stats["runs"] for scope, stats in get_rerun_profiler().snapshot().items()} == {"app": 2}
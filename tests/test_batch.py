@@ -0,0 +1,132 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import httpx
+import openai
+
+from src.auth.security_context import UserSecurityContext
+from src.core.batch import BatchOptions, run_batch
+from src.core.client import create_azure_client
+from src.core.usage_ledger import Budgets, UsageLedger
+from tests.openai_stub import StubClient, make_completion
+
+ALICE = UserSecurityContext("batch", "alice", "unknown", "contoso")
+
+
+def write_rows(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def read_results(path):
+    return {result["id"]: result for result in map(json.loads, path.read_text(encoding="utf-8").splitlines())}
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://example.openai.azure.com")
+    return openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+
+
+def test_run_batch_writes_a_result_per_row(tmp_path):
+    write_rows(tmp_path / "in.jsonl", [json.dumps({"id": f"q{i}", "prompt": f"p{i}"}) for i in range(10)])
+
+    counts = run_batch(StubClient(), tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+    results = read_results(tmp_path / "out.jsonl")
+    assert counts == {"succeeded": 10, "failed": 0, "skipped": 0}
+    assert results["q3"]["response"] == "echo: p3"
+
+
+def test_malformed_lines_are_recorded_and_the_run_continues(tmp_path):
+    write_rows(tmp_path / "in.jsonl", [
+        json.dumps({"id": "q1", "prompt": "first"}),
+        '{"id": "q2", "prompt": ',
+        "[1, 2]",
+        json.dumps({"id": "q4"}),
+        json.dumps({"id": "q5", "prompt": "last"}),
+    ])
+
+    counts = run_batch(StubClient(), tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+    results = read_results(tmp_path / "out.jsonl")
+    assert counts == {"succeeded": 2, "failed": 3, "skipped": 0}
+    assert "line 2 is not valid JSON" in results["2"]["error"]
+    assert "line 3 is not a JSON object" in results["3"]["error"]
+    assert results["q4"]["error"].startswith("Invalid row")
+    assert results["q5"]["response"] == "echo: last"
+
+
+def test_unexpected_response_fails_only_its_row(tmp_path):
+    write_rows(tmp_path / "in.jsonl", [json.dumps({"id": f"q{i}", "prompt": f"p{i}"}) for i in range(4)])
+    client = StubClient({"p1": make_completion("no usage", usage=False)})
+
+    counts = run_batch(client, tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+    results = read_results(tmp_path / "out.jsonl")
+    assert counts == {"succeeded": 3, "failed": 1, "skipped": 0}
+    assert results["q1"]["error"].startswith("AttributeError")
+
+
+def test_retryable_errors_are_retried(tmp_path):
+    write_rows(tmp_path / "in.jsonl", [json.dumps({"id": "q1", "prompt": "flaky"})])
+    attempts = []
+
+    def flaky(request):
+        attempts.append(request)
+        if len(attempts) < 3:
+            raise rate_limit_error()
+        return make_completion("finally")
+
+    options = BatchOptions(retry_base_delay=0.01, retry_max_delay=0.01)
+    counts = run_batch(StubClient({"flaky": flaky}), tmp_path / "in.jsonl", tmp_path / "out.jsonl", options)
+
+    assert counts["succeeded"] == 1
+    assert read_results(tmp_path / "out.jsonl")["q1"]["attempts"] == 3
+
+
+def test_resume_skips_completed_rows(tmp_path):
+    write_rows(tmp_path / "in.jsonl", [json.dumps({"id": f"q{i}", "prompt": f"p{i}"}) for i in range(3)])
+    (tmp_path / "out.jsonl").write_text(
+        json.dumps({"id": "q0", "response": "done", "error": None}) + "\n"
+        + json.dumps({"id": "q1", "error": "RateLimitError"}) + "\n"
+        + '{"id": "q2", "resp',
+        encoding="utf-8"
+    )
+    client = StubClient()
+
+    counts = run_batch(client, tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+
+    assert counts == {"succeeded": 2, "failed": 0, "skipped": 1}
+    assert len(client.chat.completions.requests) == 2
+    # The partial line is left behind on a line of its own
+    lines = (tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()
+    assert lines[2] == '{"id": "q2", "resp'
+    assert {json.loads(line)["id"] for line in lines[3:]} == {"q1", "q2"}
+
+
+def test_completions_are_recorded_until_the_budget_is_used(tmp_path):
+    write_rows(tmp_path / "in.jsonl", [json.dumps({"id": f"q{i}", "prompt": f"p{i}"}) for i in range(3)])
+    # Each stub completion uses 15 tokens, so the budget is used up after two rows
+    ledger = UsageLedger(tmp_path / "ledger.sqlite3", Budgets(user_daily=30), flush_interval=0.05)
+
+    counts = run_batch(StubClient(), tmp_path / "in.jsonl", tmp_path / "out.jsonl", BatchOptions(concurrency=1),
+                       ALICE, ledger)
+
+    results = read_results(tmp_path / "out.jsonl")
+    assert counts == {"succeeded": 2, "failed": 1, "skipped": 0}
+    assert results["q2"]["error"].startswith("BudgetExceededError")
+    assert ledger.usage("alice", "contoso")["tenant_daily"] == 30
+
+
+def test_batch_cli_does_not_import_streamlit():
+    check = "import sys, run_batch; sys.exit('streamlit' in sys.modules)"
+    subprocess.run([sys.executable, "-c", check], cwd=Path(__file__).parent.parent, check=True)
+
+
+def test_client_for_the_batch_runner_leaves_retries_to_it(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+
+    assert create_azure_client(lambda: "token", max_retries=0).max_retries == 0
+    assert create_azure_client(lambda: "token").max_retries == openai.DEFAULT_MAX_RETRIES
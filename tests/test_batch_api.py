@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from src.auth.security_context import UserSecurityContext
+from src.core.batch import BatchOptions
+from src.core.batch_api import _save_state, pack_batch_files, run_batch_api
+from src.core.usage_ledger import BudgetExceededError, Budgets, UsageLedger
+from tests.openai_stub import StubClient
+
+ALICE = UserSecurityContext("batch", "alice", "unknown", "contoso")
+
+
+def request(custom_id, model, padding=""):
+    return {"custom_id": custom_id, "method": "POST", "url": "/chat/completions",
+            "body": {"model": model, "messages": [{"role": "user", "content": padding}]}}
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_pack_keeps_each_file_to_one_model(tmp_path):
+    requests = [request(str(i), ("gpt-4o", "gpt-4o-mini")[i % 2]) for i in range(7)]
+
+    paths = pack_batch_files(iter(requests), tmp_path, max_requests=2)
+
+    models = [{line["body"]["model"] for line in read_lines(path)} for path in paths]
+    assert all(len(file_models) == 1 for file_models in models)
+    assert sorted(len(read_lines(path)) for path in paths) == [1, 2, 2, 2]
+    assert sorted(line["custom_id"] for path in paths for line in read_lines(path)) == sorted(map(str, range(7)))
+
+
+def test_pack_splits_on_size(tmp_path):
+    requests = [request(str(i), "gpt-4o", "x" * 100) for i in range(4)]
+    line_bytes = len(json.dumps(requests[0]).encode("utf-8")) + 1
+
+    paths = pack_batch_files(iter(requests), tmp_path, max_bytes=line_bytes * 2)
+
+    assert [len(read_lines(path)) for path in paths] == [2, 2]
+
+
+def test_run_batch_api_submits_one_batch_per_model(tmp_path):
+    rows = [{"id": f"q{i}", "prompt": f"p{i}", "model": ("gpt-4o", "gpt-4o-mini")[i % 2]} for i in range(6)]
+    rows.append({"id": "bad"})
+    (tmp_path / "in.jsonl").write_text("\n".join(map(json.dumps, rows)) + "\n", encoding="utf-8")
+    client = StubClient()
+
+    counts = run_batch_api(client, tmp_path / "in.jsonl", tmp_path / "out.jsonl", BatchOptions())
+
+    results = {result["id"]: result for result in read_lines(tmp_path / "out.jsonl")}
+    assert counts == {"succeeded": 6, "failed": 1, "skipped": 0, "batches": 2}
+    assert results["q2"] == {**results["q2"], "model": "gpt-4o", "response": "echo: p2", "error": None}
+    assert not (tmp_path / "out.jsonl.batches.json").exists()
+
+
+def test_resume_does_not_duplicate_streamed_results(tmp_path):
+    rows = [{"id": f"q{i}", "prompt": f"p{i}"} for i in range(4)]
+    (tmp_path / "in.jsonl").write_text("\n".join(map(json.dumps, rows)) + "\n", encoding="utf-8")
+    client = StubClient()
+
+    # An earlier run submitted a batch and was interrupted after streaming two results and part of a third
+    input_file = tmp_path / "batch.jsonl"
+    input_file.write_text("\n".join(json.dumps(request(row["id"], "gpt-4o", row["prompt"])) for row in rows))
+    with open(input_file, "rb") as f:
+        batch = client.batches.create(client.files.create(f, "batch").id, "/chat/completions", "24h")
+    _save_state(tmp_path / "out.jsonl.batches.json", {"pending_batches": [batch.id]})
+    client.batches.complete(batch)
+    streamed = client.files.content(batch.output_file_id).data.decode("utf-8").splitlines()
+    partial = json.dumps({"id": "q2", "response": "echo"})[:10]
+    (tmp_path / "out.jsonl").write_text(
+        "\n".join(json.dumps({"id": json.loads(line)["custom_id"], "error": None}) for line in streamed[:2])
+        + "\n" + partial,
+        encoding="utf-8"
+    )
+
+    counts = run_batch_api(client, tmp_path / "in.jsonl", tmp_path / "out.jsonl", BatchOptions())
+
+    ids = [json.loads(line)["id"] for line in (tmp_path / "out.jsonl").read_text().splitlines() if line != partial]
+    assert sorted(ids) == ["q0", "q1", "q2", "q3"]
+    assert counts == {"succeeded": 2, "failed": 0, "skipped": 2, "batches": 1}
+    assert len(client.batches.batches) == 1
+
+
+def test_batch_results_are_recorded_in_the_ledger(tmp_path):
+    rows = [{"id": f"q{i}", "prompt": f"p{i}"} for i in range(4)]
+    (tmp_path / "in.jsonl").write_text("\n".join(map(json.dumps, rows)) + "\n", encoding="utf-8")
+    ledger = UsageLedger(tmp_path / "ledger.sqlite3", Budgets(user_daily=60), flush_interval=0.05)
+
+    run_batch_api(StubClient(), tmp_path / "in.jsonl", tmp_path / "out.jsonl", BatchOptions(), ALICE,
+                  usage_ledger=ledger)
+    assert ledger.usage("alice", "contoso")["user_daily"] == 60
+
+    # The budget is used up, so the next run submits nothing
+    client = StubClient()
+    with pytest.raises(BudgetExceededError):
+        run_batch_api(client, tmp_path / "in.jsonl", tmp_path / "again.jsonl", BatchOptions(), ALICE,
+                      usage_ledger=ledger)
+    assert client.batches.batches == {}
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import openai
+import pytest
+
+from src.core.chat import CancelEvent, get_streaming_chat_completion, iter_streaming_chat_completion
+
+
+def sse_chunk(content=None, usage=None):
+    choices = [{"index": 0, "delta": {"content": content}}] if content is not None else []
+    data = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m", "choices": choices,
+            "usage": usage}
+    return f"data: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class StreamingServer:
+    """
+    Streams the given SSE chunks, then holds the response open without sending anything, like a model before its
+    first token. Records when the client closes the connection.
+    """
+
+    def __init__(self, chunks, finish=False):
+        self.chunks = chunks
+        self.finish = finish
+        self.client_closed = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in server.chunks:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+                if server.finish:
+                    done = b"data: [DONE]\n\n"
+                    self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+                    return
+                self.connection.settimeout(10)
+                try:
+                    if self.connection.recv(1) == b"":
+                        server.client_closed.set()
+                except OSError:
+                    server.client_closed.set()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def client(self):
+        return openai.OpenAI(
+            base_url=f"http://127.0.0.1:{self.httpd.server_port}/v1", api_key="test", http_client=httpx.Client()
+        )
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(chunks, finish=False):
+        servers.append(StreamingServer(chunks, finish))
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def consume_in_thread(stream):
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(stream), daemon=True)
+    thread.start()
+    return thread, received
+
+
+def test_cancel_closes_the_socket_while_waiting_for_the_first_token(make_server):
+    server = make_server([])
+    cancel_event = CancelEvent()
+    thread, received = consume_in_thread(
+        iter_streaming_chat_completion(server.client(), "m", [{"role": "user", "content": "hi"}], 10,
+                                       cancel_event=cancel_event)
+    )
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    cancel_event.set()
+    thread.join(2)
+
+    assert not thread.is_alive()
+    assert server.client_closed.wait(2)
+    assert time.perf_counter() - started < 1
+    assert received == []
+
+
+def test_cancel_after_partial_response_returns_estimated_usage(make_server):
+    server = make_server([sse_chunk("Hello"), sse_chunk(" there")])
+    cancel_event = CancelEvent()
+    received = []
+
+    def on_content(full_response):
+        received.append(full_response)
+        if full_response.endswith("there"):
+            threading.Timer(0.1, cancel_event.set).start()
+
+    chat_message = asyncio.run(get_streaming_chat_completion(
+        server.client(), "m", [{"role": "user", "content": "hi"}], 10, on_content=on_content,
+        cancel_event=cancel_event
+    ))
+
+    assert server.client_closed.wait(2)
+    assert chat_message.full_response == "Hello there"
+    assert chat_message.cancelled and chat_message.usage_estimated
+
+
+def test_finished_stream_is_not_aborted_by_a_later_cancel(make_server):
+    usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+    server = make_server([sse_chunk("Hi"), sse_chunk(usage=usage)], finish=True)
+    cancel_event = CancelEvent()
+
+    chat_message = asyncio.run(get_streaming_chat_completion(
+        server.client(), "m", [{"role": "user", "content": "hi"}], 10, on_content=lambda text: None,
+        cancel_event=cancel_event
+    ))
+    cancel_event.set()
+
+    assert chat_message.full_response == "Hi"
+    assert chat_message.total_tokens == 5
+    assert not chat_message.cancelled
+    assert cancel_event._callbacks == []
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from src.core import compare
+from src.core.compare import compare_models
+from tests.openai_stub import StubClient, make_completion
+
+MESSAGES = [{"role": "user", "content": "which is faster?"}]
+
+
+def answer_after(delays):
+    """Response which waits the delay given for the requested deployment, raising it if it is an exception."""
+    def respond(request):
+        delay = delays[request["model"]]
+        if isinstance(delay, BaseException):
+            raise delay
+        time.sleep(delay)
+        return make_completion(f"{request['model']} says hi", model=request["model"])
+    return respond
+
+
+def results(events):
+    return {event.deployment_name: event.result for event in events if event.result is not None}
+
+
+def test_total_time_is_the_slowest_deployment_not_the_sum():
+    delays = {"gpt-4o": 0.3, "gpt-4o-mini": 0.3, "gpt-4-turbo": 0.6}
+    client = StubClient({MESSAGES[-1]["content"]: answer_after(delays)})
+
+    started = time.perf_counter()
+    outcome = results(compare_models(client, list(delays), MESSAGES, 100))
+    elapsed = time.perf_counter() - started
+
+    assert 0.6 <= elapsed < sum(delays.values()) - 0.3
+    assert {name: result.chat_message.full_response for name, result in outcome.items()} == {
+        name: f"{name} says hi" for name in delays
+    }
+    assert outcome["gpt-4-turbo"].total_latency >= 0.6
+
+
+def test_a_failing_deployment_does_not_affect_the_others():
+    delays = {"gpt-4o": 0.05, "broken": ConnectionError("deployment not found"), "gpt-4o-mini": 0.05}
+    client = StubClient({MESSAGES[-1]["content"]: answer_after(delays)})
+
+    outcome = results(compare_models(client, list(delays), MESSAGES, 100))
+
+    assert outcome["broken"].error == "deployment not found"
+    assert outcome["broken"].chat_message is None
+    for name in ("gpt-4o", "gpt-4o-mini"):
+        assert outcome[name].error is None
+        assert outcome[name].chat_message.full_response == f"{name} says hi"
+        assert outcome[name].chat_message.prompt_tokens == 10
+
+
+def test_closing_the_comparison_early_cancels_the_workers(monkeypatch):
+    cancel_events = []
+
+    class RecordedCancelEvent(compare.CancelEvent):
+        def __init__(self):
+            super().__init__()
+            cancel_events.append(self)
+
+    monkeypatch.setattr(compare, "CancelEvent", RecordedCancelEvent)
+    client = StubClient()
+    gate = client.chat.completions.stream_gate = threading.Event()
+    names = ["gpt-4o", "gpt-4o-mini"]
+
+    # Each stream holds after its first word, so the comparison is left mid-answer
+    events = compare_models(client, names, MESSAGES, 100)
+    assert {next(events).deployment_name for _ in names} == set(names)
+    events.close()
+    assert cancel_events[0].is_set()
+
+    gate.set()
+    for thread in threading.enumerate():
+        if thread.name in {f"compare-{name}" for name in names}:
+            thread.join(5)
+            assert not thread.is_alive()
+    assert len(client.chat.completions.streams) == 2
+    assert all(stream.closed for stream in client.chat.completions.streams)
@@ -0,0 +1,61 @@
+from contextlib import nullcontext
+
+import pytest
+
+from src.ui import components
+from src.utils.rerun_profiler import RerunProfiler
+
+
+class FragmentRecorder:
+    """Stands in for st.fragment, recording the functions it wraps and how often their fragments run"""
+
+    def __init__(self):
+        self.fragments = {}
+
+    def __call__(self, func, run_every=None):
+        entry = self.fragments[func.__name__] = {"run_every": run_every, "runs": 0}
+
+        def run(*args, **kwargs):
+            entry["runs"] += 1
+            return func(*args, **kwargs)
+
+        return run
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = RerunProfiler(enabled=True)
+    monkeypatch.setattr(components, "get_rerun_profiler", lambda: profiler)
+    monkeypatch.setattr(components, "tracked_session_run", nullcontext)
+    return profiler
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = FragmentRecorder()
+    monkeypatch.setattr(components.st, "fragment", recorder)
+    return recorder
+
+
+def test_function_runs_as_a_timed_fragment(monkeypatch, profiler, recorder):
+    monkeypatch.delenv("USE_FRAGMENTS", raising=False)
+
+    @components.fragment("input", run_every=0.5)
+    def render(value):
+        return value * 2
+
+    assert render(21) == 42
+    assert recorder.fragments == {"render": {"run_every": 0.5, "runs": 1}}
+    assert profiler.snapshot()["input"]["runs"] == 1
+
+
+def test_fragments_can_be_turned_off(monkeypatch, profiler, recorder):
+    monkeypatch.setenv("USE_FRAGMENTS", "0")
+
+    @components.fragment("sidebar")
+    def render():
+        return "drawn"
+
+    assert render() == "drawn"
+    assert recorder.fragments["render"]["runs"] == 0
+    assert profiler.snapshot()["sidebar"]["runs"] == 1
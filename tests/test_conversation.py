@@ -0,0 +1,50 @@
+from src.core.chat import setup_assistant
+from src.core.conversation import (
+    CONDENSE_INSTRUCTION, SUMMARY_HEADER, SUMMARY_INSTRUCTION, compact_conversation, is_summary_message
+)
+from tests.openai_stub import StubClient, make_completion
+
+
+def turns(count):
+    return [{"role": ("user", "assistant")[i % 2], "content": f"turn {i}"} for i in range(count)]
+
+
+def test_short_conversation_is_left_alone():
+    messages = [setup_assistant()] + turns(4)
+
+    compacted, chat_message = compact_conversation(StubClient(), "gpt-4o", messages, 500)
+
+    assert compacted is messages
+    assert chat_message is None
+
+
+def test_summary_is_appended_to_keep_the_prefix_stable():
+    client = StubClient({SUMMARY_INSTRUCTION: make_completion("more points")})
+    summary = {"role": "system", "content": f"{SUMMARY_HEADER}\nearlier points"}
+    messages = [setup_assistant(), summary] + turns(8)
+
+    compacted, chat_message = compact_conversation(client, "gpt-4o", messages, 500)
+
+    assert compacted[1]["content"] == f"{SUMMARY_HEADER}\nearlier points\n\nmore points"
+    assert compacted[2:] == messages[-2:]
+    assert chat_message.total_tokens == 15
+    assert len(client.chat.completions.requests) == 1
+
+
+def test_summary_past_the_cap_is_condensed():
+    client = StubClient({
+        SUMMARY_INSTRUCTION: make_completion("y" * 400),
+        CONDENSE_INSTRUCTION: make_completion("short summary"),
+    })
+    summary = {"role": "system", "content": f"{SUMMARY_HEADER}\n" + "x" * 400}
+    messages = [setup_assistant(), summary] + turns(8)
+
+    compacted, chat_message = compact_conversation(client, "gpt-4o", messages, 500, max_summary_tokens=150)
+
+    assert is_summary_message(compacted[1])
+    assert compacted[1]["content"] == f"{SUMMARY_HEADER}\nshort summary"
+    assert len(compacted) == 4
+    # The usage of both the summary and the condense request is reported
+    assert chat_message.total_tokens == 30
+    condense_request = client.chat.completions.requests[1]["messages"]
+    assert condense_request[1]["content"].endswith("y" * 400)
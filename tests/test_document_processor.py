@@ -0,0 +1,41 @@
+from run_retrieval_benchmark import benchmark_retrieval, make_sample_pdf
+from src.utils.document_processor import get_document_executor, process_document, split_pdf
+
+
+def test_split_pdf_yields_parts_of_consecutive_pages():
+    from pypdf import PdfReader
+    import io
+
+    parts = list(split_pdf(make_sample_pdf(7), pages_per_part=3))
+
+    assert [start for start, _ in parts] == [0, 3, 6]
+    assert [len(PdfReader(io.BytesIO(part)).pages) for _, part in parts] == [3, 3, 1]
+
+
+def test_pdf_is_chunked_in_page_order():
+    pdf_chunks = process_document("sample.pdf", make_sample_pdf(120, lines=10))
+
+    pages = [chunk.page for chunk in pdf_chunks]
+    assert pages == sorted(pages)
+    assert set(pages) == set(range(1, 121))
+
+
+def test_text_documents_are_chunked_with_overlap():
+    words = " ".join(f"w{i}" for i in range(500))
+
+    text_chunks = process_document("notes.md", words.encode("utf-8"), chunk_tokens=100, overlap_tokens=20)
+
+    first, second = text_chunks[0].text.split(), text_chunks[1].text.split()
+    assert len(first) == 75
+    assert first[-15:] == second[:15]
+
+
+def test_workers_are_spawned():
+    assert get_document_executor()._mp_context.get_start_method() == "spawn"
+
+
+def test_retrieval_benchmark_runs():
+    results = benchmark_retrieval(pages=10, chunks=200, queries=5)
+
+    assert results["pdf"]["chunks"] > 0
+    assert results["remove"]["chunks_left"] == 180
@@ -0,0 +1,81 @@
+import pytest
+
+from src.auth import graph_client
+
+
+class StubGraphResponse:
+    def __init__(self, status_code, payload=None, etag=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = {"ETag": etag} if etag else {}
+
+    def json(self):
+        return self._payload
+
+
+class StubGraphSession:
+    """Answers /me with a fixed profile and ETag, and with 304 when the ETag matches."""
+
+    def __init__(self, etag='W/"1"'):
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(dict(headers))
+        if headers.get("If-None-Match") == self.etag:
+            return StubGraphResponse(304)
+        token = headers["Authorization"].split()[1]
+        return StubGraphResponse(200, {"displayName": token}, self.etag)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = StubGraphSession()
+    monkeypatch.setattr(graph_client, "get_graph_session", lambda: session)
+    return session
+
+
+def use_cache(monkeypatch, ttl):
+    cache = graph_client.GraphProfileCache(ttl=ttl)
+    monkeypatch.setattr(graph_client, "get_graph_profile_cache", lambda: cache)
+    return cache
+
+
+def test_fresh_profile_is_served_from_cache(session, monkeypatch):
+    use_cache(monkeypatch, ttl=300)
+
+    first = graph_client.get_user_profile("alice", cache_key="oid-alice")
+    second = graph_client.get_user_profile("alice", cache_key="oid-alice")
+
+    assert first == second == {"displayName": "alice"}
+    assert len(session.requests) == 1
+
+
+def test_profiles_are_cached_per_account(session, monkeypatch):
+    use_cache(monkeypatch, ttl=300)
+
+    graph_client.get_user_profile("alice", cache_key="oid-alice")
+    bob = graph_client.get_user_profile("bob", cache_key="oid-bob")
+
+    assert bob == {"displayName": "bob"}
+    assert len(session.requests) == 2
+
+
+def test_stale_profile_is_revalidated_with_etag(session, monkeypatch):
+    use_cache(monkeypatch, ttl=0)
+
+    graph_client.get_user_profile("alice", cache_key="oid-alice")
+    profile = graph_client.get_user_profile("alice", cache_key="oid-alice")
+
+    assert profile == {"displayName": "alice"}
+    assert session.requests[1]["If-None-Match"] == session.etag
+
+
+def test_profile_without_cache_key_is_not_cached(session, monkeypatch):
+    cache = use_cache(monkeypatch, ttl=300)
+
+    graph_client.get_user_profile("alice")
+    graph_client.get_user_profile("alice")
+
+    assert len(session.requests) == 2
+    assert cache.get(None) is None
@@ -0,0 +1,65 @@
+import logging
+
+from src.core.prompt_cache import PromptCacheStats
+
+HOUR = 3600
+NOW = 1_700_000_000 // HOUR * HOUR
+
+
+class FakeClock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_are_bucketed_by_hour():
+    clock = FakeClock()
+    stats = PromptCacheStats(bucket_seconds=HOUR, max_buckets=2, clock=clock)
+
+    stats.record("gpt-4o", 1000, 0)
+    clock.now += 1800
+    stats.record("gpt-4o", 1000, 800)
+    for _ in range(2):
+        clock.now += HOUR
+        stats.record("gpt-4o", 1000, 1000)
+
+    # Only the two most recent buckets are kept; the totals still count every request
+    assert [(bucket["bucket_start"] - NOW) // HOUR for bucket in stats.history("gpt-4o")] == [1, 2]
+    assert [bucket["requests"] for bucket in stats.history("gpt-4o")] == [1, 1]
+    assert stats.snapshot()["gpt-4o"]["requests"] == 4
+    assert stats.history("gpt-4-turbo") == []
+
+
+def test_hit_ratio_is_the_share_of_cached_prompt_tokens():
+    stats = PromptCacheStats(clock=FakeClock())
+
+    assert stats.hit_ratio("gpt-4o") is None
+    stats.record("gpt-4o", 1000, 0)
+    stats.record("gpt-4o", 3000, 2048)
+    stats.record("gpt-4-turbo", 0, 0)
+
+    assert stats.hit_ratio("gpt-4o") == 0.512
+    assert stats.hit_ratio("gpt-4-turbo") is None
+    assert stats.history("gpt-4o")[0]["hit_ratio"] == 0.512
+
+
+def test_report_logs_each_completed_bucket_once(caplog):
+    caplog.set_level(logging.INFO, logger="src.core.prompt_cache")
+    clock = FakeClock()
+    stats = PromptCacheStats(bucket_seconds=HOUR, clock=clock)
+    stats.record("gpt-4o", 1000, 500)
+
+    # The current bucket is still filling up
+    assert stats.report() == {}
+
+    clock.now += HOUR
+    stats.record("gpt-4o", 1000, 1000)
+    report = stats.report()
+    assert [bucket["bucket_start"] for bucket in report["gpt-4o"]["buckets"]] == [NOW]
+    assert report["gpt-4o"]["buckets"][0]["hit_ratio"] == 0.5
+    assert report["gpt-4o"]["total"]["hit_ratio"] == 0.75
+    assert "Prompt cache of gpt-4o" in caplog.text
+
+    assert stats.report() == {}
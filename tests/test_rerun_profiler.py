@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from src.utils.rerun_profiler import RerunProfiler
+
+
+class StopRun(Exception):
+    """Stands in for the exceptions st.rerun and st.stop end a run with"""
+
+
+def test_runs_are_counted_and_timed_per_scope():
+    profiler = RerunProfiler(enabled=True)
+
+    for _ in range(3):
+        with profiler.measure("sidebar"):
+            pass
+    with profiler.measure("app"):
+        pass
+
+    snapshot = profiler.snapshot()
+    assert snapshot["sidebar"]["runs"] == 3
+    assert snapshot["app"]["runs"] == 1
+    assert set(snapshot["sidebar"]) == {"runs", "seconds", "mean_ms", "max_ms"}
+
+
+def test_fragments_drawn_by_a_full_run_count_towards_the_full_run():
+    profiler = RerunProfiler(enabled=True)
+
+    with profiler.measure("app"):
+        with profiler.measure("history"):
+            pass
+        with profiler.measure("input"):
+            pass
+
+    assert list(profiler.snapshot()) == ["app"]
+
+
+def test_run_ended_by_an_exception_is_still_counted():
+    profiler = RerunProfiler(enabled=True)
+
+    with pytest.raises(StopRun):
+        with profiler.measure("input"):
+            raise StopRun()
+    with profiler.measure("history"):
+        pass
+
+    assert profiler.snapshot()["input"]["runs"] == 1
+    assert profiler.snapshot()["history"]["runs"] == 1
+
+
+def test_sessions_on_other_threads_are_measured_separately():
+    profiler = RerunProfiler(enabled=True)
+    inside, release = threading.Event(), threading.Event()
+
+    def other_session():
+        with profiler.measure("sidebar"):
+            inside.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    inside.wait(5)
+    with profiler.measure("app"):
+        pass
+    release.set()
+    thread.join(5)
+
+    assert {scope: stats["runs"] for scope, stats in profiler.snapshot().items()} == {"app": 1, "sidebar": 1}
+
+
+def test_nothing_is_recorded_when_disabled():
+    profiler = RerunProfiler()
+
+    with profiler.measure("app"):
+        pass
+
+    assert profiler.snapshot() == {}
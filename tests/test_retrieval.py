@@ -0,0 +1,133 @@
+import json
+import pickle
+import threading
+
+import numpy as np
+
+from run_retrieval_benchmark import hash_embed
+from src.core.retrieval import DocumentIndex, EmbeddingIndex
+from src.utils.document_processor import DocumentChunk
+
+
+def chunks(document, texts):
+    return [DocumentChunk(document, page, text, 10) for page, text in enumerate(texts, start=1)]
+
+
+def make_index():
+    index = DocumentIndex()
+    index.add_document("fruit", chunks("fruit", ["apples are red", "bananas are yellow", "cherries are dark red"]))
+    index.add_document("cars", chunks("cars", ["red sports cars are fast", "trucks carry cargo"]))
+    index.add_document("space", chunks("space", ["mars is the red planet"]))
+    return index
+
+
+def assert_embeddings_match_chunks(index):
+    embeddings = index.embeddings
+    for row, chunk_id in enumerate(embeddings._ids):
+        expected = np.asarray(hash_embed([index.bm25.chunks[chunk_id].text])[0], dtype=np.float32)
+        expected /= np.linalg.norm(expected) + 1e-12
+        assert np.allclose(embeddings._matrix[row], expected)
+
+
+def test_removing_a_document_compacts_the_bm25_index():
+    index = make_index()
+
+    index.remove_document("fruit")
+
+    assert [chunk.document for chunk in index.bm25.chunks] == ["cars", "cars", "space"]
+    assert index.documents == {"cars": [0, 1], "space": [2]}
+    assert "apples" not in index.bm25._postings
+    assert all(chunk_id < 3 for postings in index.bm25._postings.values() for chunk_id in postings)
+    assert [chunk.text for chunk in index.search("red", k=5)] == ["mars is the red planet", "red sports cars are fast"]
+
+
+def test_removing_a_document_compacts_the_embedding_index():
+    index = make_index()
+    index.enable_embeddings(hash_embed, background=False)
+
+    index.remove_document("cars")
+
+    assert index.embeddings._count == 4
+    assert index.embeddings._ids == [0, 1, 2, 3]
+    assert_embeddings_match_chunks(index)
+    assert index.search("mars planet", k=1)[0].text == "mars is the red planet"
+
+
+def test_embedding_runs_in_the_background():
+    index = make_index()
+    release = threading.Event()
+
+    def slow_embed(texts):
+        release.wait(5)
+        return hash_embed(texts)
+
+    index.enable_embeddings(slow_embed)
+    # BM25 answers while the chunks are being embedded
+    assert index.search("trucks", k=1)[0].text == "trucks carry cargo"
+    assert index.embedding_pending == 6
+
+    release.set()
+    index._embedder.join(5)
+    assert index.embedding_pending == 0
+
+
+def test_failed_query_embedding_falls_back_to_bm25():
+    index = make_index()
+    index.enable_embeddings(hash_embed, background=False)
+
+    def failing_embed(texts):
+        raise ConnectionError("embeddings deployment unavailable")
+
+    index.embeddings.embed = failing_embed
+
+    assert [chunk.text for chunk in index.search("trucks", k=1)] == ["trucks carry cargo"]
+
+
+def test_batches_embedded_across_a_removal_are_not_misnumbered():
+    index = make_index()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_embed(texts):
+        started.set()
+        release.wait(5)
+        return hash_embed(texts)
+
+    index.embeddings = EmbeddingIndex(slow_embed, batch_size=2)
+    index.enable_embeddings(slow_embed)
+    # The first batch is still being embedded when the document its chunks belong to is removed
+    started.wait(5)
+    index.remove_document("fruit")
+    release.set()
+    index._embedder.join(5)
+
+    assert index.embedding_pending == 0
+    assert sorted(index.embeddings._ids) == [0, 1, 2]
+    assert_embeddings_match_chunks(index)
+
+
+def test_index_pickles_without_its_lock_or_embedder():
+    index = make_index()
+    index.enable_embeddings(hash_embed, background=False)
+
+    restored = pickle.loads(pickle.dumps(index))
+    restored.enable_embeddings(hash_embed)
+
+    assert restored.search("bananas", k=1)[0].text == "bananas are yellow"
+    restored.remove_document("space")
+    assert len(restored.bm25.chunks) == 5
+
+
+def test_index_round_trips_through_json():
+    index = make_index()
+    index.enable_embeddings(hash_embed, background=False)
+    index.remove_document("cars")
+
+    restored = DocumentIndex.from_dict(json.loads(json.dumps(index.to_dict())))
+
+    assert restored.documents == index.documents
+    assert restored.bm25.chunks == index.bm25.chunks
+    assert restored.embeddings.embed is None
+    restored.enable_embeddings(hash_embed, background=False)
+    assert restored.embedding_pending == 0
+    assert_embeddings_match_chunks(restored)
+    assert [chunk.text for chunk in restored.search("red", k=2)] == [chunk.text for chunk in index.search("red", k=2)]
@@ -0,0 +1,41 @@
+from run_router_benchmark import SAMPLE_PROMPTS, benchmark_router
+from src.core.router import ModelRouter
+
+
+def test_simple_prompt_goes_to_the_fast_model():
+    decision = ModelRouter().route("Hi, what's the capital of France?")
+
+    assert decision.model == "gpt-35-turbo"
+
+
+def test_code_and_reasoning_go_to_the_strong_model():
+    prompt = "Explain step by step why this is slow and refactor it:\n```python\ndef f():\n    pass\n```"
+
+    decision = ModelRouter().route(prompt, conversation_depth=2)
+
+    assert decision.model == "gpt-4o"
+    assert decision.features.has_code
+
+
+def test_image_goes_to_the_strong_model():
+    decision = ModelRouter().route("What is this?", has_image=True)
+
+    assert decision.model == "gpt-4o"
+    assert decision.reason == "image attached"
+
+
+def test_only_a_prefix_of_the_prompt_is_scanned():
+    prompt = "Hello there. " * 1000 + "Please explain and compare these designs."
+
+    features = ModelRouter().extract_features(prompt)
+
+    assert features.reasoning_cues == 0
+    assert features.prompt_tokens == (len(prompt) + 3) // 4
+
+
+def test_routing_overhead_stays_below_a_millisecond():
+    results = benchmark_router(ModelRouter(), SAMPLE_PROMPTS, iterations=50)
+
+    assert set(results) == set(SAMPLE_PROMPTS)
+    # Generous bound for shared CI machines; the cost does not grow with the prompt beyond the scanned prefix
+    assert all(result["p50_us"] < 1000 for result in results.values())
@@ -0,0 +1,292 @@
+import gc
+import hashlib
+import json
+import logging
+import random
+import threading
+import tracemalloc
+
+import pytest
+from cryptography.fernet import Fernet
+
+from run_retrieval_benchmark import hash_embed
+from src.core import session_memory
+from src.core.retrieval import DocumentIndex
+from src.core.session_memory import SessionMemoryAccountant
+from src.utils.document_processor import DocumentChunk
+
+SPILL_KEYS = ("messages", "document_index")
+EVICT_KEYS = SPILL_KEYS + ("user_authenticated", "auth_token")
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_accountant(tmp_path, clock):
+    def make(**kwargs):
+        kwargs.setdefault("spill_dir", tmp_path / "sessions")
+        kwargs.setdefault("spill_key", Fernet.generate_key())
+        accountant = SessionMemoryAccountant(SPILL_KEYS, EVICT_KEYS, spill_after=900, evict_after=86400,
+                                             clock=clock, **kwargs)
+        accountant.register_codec("document_index", DocumentIndex.to_dict, DocumentIndex.from_dict)
+        return accountant
+    return make
+
+
+def session_state(text="hello"):
+    index = DocumentIndex()
+    index.add_document("notes", [DocumentChunk("notes", 1, f"secret notes about {text}", 5)])
+    return {
+        "messages": [{"role": "user", "content": text}],
+        "document_index": index,
+        "user_authenticated": True,
+        "auth_token": "token",
+    }
+
+
+def digest(messages):
+    return hashlib.sha256(json.dumps(messages).encode("utf-8")).hexdigest()
+
+
+def run(accountant, session_id, state):
+    with accountant.track(session_id, state) as evicted:
+        return evicted
+
+
+def test_idle_session_spills_encrypted_and_restores(make_accountant, clock, tmp_path):
+    accountant = make_accountant()
+    state = session_state("the quarterly plan")
+    run(accountant, "s1", state)
+
+    clock.now += 901
+    accountant.sweep()
+    # The sweeper only marks the session; its state is untouched until the session acts on the mark
+    assert "messages" in state
+    assert accountant.housekeep("s1", state) == "spilled"
+
+    assert "messages" not in state and "document_index" not in state
+    assert state["auth_token"] == "token"
+    spill_file = tmp_path / "sessions" / "s1.bin"
+    assert b"quarterly" not in spill_file.read_bytes()
+
+    assert run(accountant, "s1", state) is False
+    assert state["messages"] == [{"role": "user", "content": "the quarterly plan"}]
+    assert state["document_index"].search("quarterly")[0].text == "secret notes about the quarterly plan"
+    assert not spill_file.exists()
+    assert accountant.metrics()["restores"] == 1
+
+
+def test_restored_document_index_keeps_its_embeddings(make_accountant, clock):
+    accountant = make_accountant()
+    state = session_state()
+    state["document_index"].enable_embeddings(hash_embed, background=False)
+    run(accountant, "s1", state)
+
+    clock.now += 901
+    accountant.sweep()
+    accountant.housekeep("s1", state)
+    run(accountant, "s1", state)
+
+    index = state["document_index"]
+    assert index.embeddings._count == 1
+    index.enable_embeddings(hash_embed, background=False)
+    assert index.search("secret notes", k=1)[0].document == "notes"
+
+
+def test_running_session_is_not_marked(make_accountant, clock):
+    accountant = make_accountant()
+    state = session_state()
+
+    with accountant.track("s1", state):
+        clock.now += 100_000
+        # The sweeper runs on its own thread, so it finds the session's lock taken
+        sweeper = threading.Thread(target=accountant.sweep)
+        sweeper.start()
+        sweeper.join()
+    clock.now += 1
+
+    assert accountant.housekeep("s1", state) is None
+    assert "messages" in state
+
+
+def test_activity_cancels_a_pending_spill(make_accountant, clock):
+    accountant = make_accountant()
+    state = session_state()
+    run(accountant, "s1", state)
+
+    clock.now += 901
+    accountant.sweep()
+    run(accountant, "s1", state)
+
+    assert accountant.housekeep("s1", state) is None
+    assert "messages" in state
+
+
+def test_eviction_happens_on_the_next_run_and_only_once(make_accountant, clock):
+    released = []
+    accountant = make_accountant()
+    accountant.add_release_listener(released.append)
+    state = session_state()
+    run(accountant, "s1", state)
+
+    clock.now += 86401
+    accountant.sweep()
+    assert state["user_authenticated"] is True
+
+    assert run(accountant, "s1", state) is True
+    assert not any(key in state for key in EVICT_KEYS)
+    assert released == ["s1"]
+
+    # The run that follows an eviction starts the session over instead of evicting it again
+    assert run(accountant, "s1", state) is False
+    accountant.sweep()
+    assert accountant.housekeep("s1", state) is None
+    assert accountant.metrics()["evictions"] == 1
+
+
+def test_evict_listeners_see_the_state_before_it_is_dropped(make_accountant, clock):
+    seen = []
+    accountant = make_accountant()
+    accountant.add_evict_listener(lambda session_id, state: seen.append((session_id, state.get("auth_token"))))
+    state = session_state()
+    run(accountant, "s1", state)
+
+    clock.now += 86401
+    accountant.sweep()
+    run(accountant, "s1", state)
+
+    assert seen == [("s1", "token")]
+    assert "auth_token" not in state
+
+
+def test_housekeeping_evicts_an_idle_session(make_accountant, clock):
+    accountant = make_accountant()
+    state = session_state()
+    run(accountant, "s1", state)
+
+    clock.now += 901
+    accountant.sweep()
+    accountant.housekeep("s1", state)
+    clock.now += 86401
+    accountant.sweep()
+
+    assert accountant.housekeep("s1", state) == "evicted"
+    assert not any(key in state for key in EVICT_KEYS)
+    assert accountant.metrics()["spilled_sessions"] == 0
+
+
+def test_unreadable_spill_file_starts_the_session_afresh(make_accountant, clock, tmp_path):
+    accountant = make_accountant()
+    state = session_state()
+    run(accountant, "s1", state)
+    clock.now += 901
+    accountant.sweep()
+    accountant.housekeep("s1", state)
+
+    (tmp_path / "sessions" / "s1.bin").write_bytes(b"not a fernet token")
+    run(accountant, "s1", state)
+
+    assert "messages" not in state
+    assert accountant.metrics()["spilled_sessions"] == 0
+
+
+def test_spilling_is_off_without_a_directory(make_accountant, clock):
+    accountant = make_accountant(spill_dir=None, spill_key=None)
+    state = session_state()
+    run(accountant, "s1", state)
+
+    clock.now += 901
+    accountant.sweep()
+
+    assert accountant.housekeep("s1", state) is None
+    assert "messages" in state
+
+
+def test_spill_directory_requires_a_key(tmp_path):
+    with pytest.raises(ValueError):
+        SessionMemoryAccountant(SPILL_KEYS, EVICT_KEYS, spill_dir=tmp_path)
+
+
+def test_closed_session_is_forgotten(make_accountant):
+    released = []
+    accountant = make_accountant()
+    accountant.add_release_listener(released.append)
+    state = session_state()
+    run(accountant, "s1", state)
+
+    del state
+    gc.collect()
+    accountant.sweep()
+
+    assert released == ["s1"]
+    assert accountant.metrics()["sessions"] == 0
+
+
+def test_soak_many_sessions_keep_real_memory_bounded(make_accountant, clock, caplog):
+    # Captured log records of every spill would otherwise be counted as well
+    caplog.set_level(logging.WARNING, logger=session_memory.__name__)
+    rng = random.Random(0)
+    cap = 2_000_000
+    accountant = make_accountant(max_total_bytes=cap)
+    states = {}
+    # Digests rather than copies of the conversations, so the check itself does not hold them in memory
+    expected = {}
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        # Sessions come and go over simulated hours; each sweep is followed by every open session's housekeeping
+        # run. The conversations add up to about five times the cap
+        for step in range(15):
+            for _ in range(200):
+                session_id = f"s{rng.randrange(500)}"
+                state = states.setdefault(session_id, session_state(session_id))
+                with accountant.track(session_id, state):
+                    content = f"{session_id} turn {len(state['messages'])} " + "x" * rng.randrange(2000, 6000)
+                    state["messages"].append({"role": "user", "content": content})
+                    state["auth_token"] = "token"
+                    expected[session_id] = digest(state["messages"])
+                accountant._measure(accountant._sessions[session_id], state)
+
+            # Some tabs are closed
+            for session_id in rng.sample(sorted(states), 20):
+                del states[session_id]
+                del expected[session_id]
+            state = None
+            gc.collect()
+
+            clock.now += 120
+            accountant.sweep()
+            for session_id, state in states.items():
+                accountant.housekeep(session_id, state)
+            state = None
+            gc.collect()
+
+            metrics = accountant.metrics()
+            assert metrics["resident_bytes"] <= cap
+            assert metrics["sessions"] == len(states)
+            # What is really allocated stays near the cap, with room for the bookkeeping of each open session and
+            # for threads other tests left running, instead of growing with the conversations
+            allocated = tracemalloc.get_traced_memory()[0] - baseline
+            assert allocated <= 2 * cap, f"{allocated} bytes allocated after step {step}"
+    finally:
+        tracemalloc.stop()
+
+    assert accountant.metrics()["spills"] > 0
+    for session_id in rng.sample(sorted(states), 100):
+        state = states[session_id]
+        run(accountant, session_id, state)
+        assert digest(state["messages"]) == expected[session_id]
+        assert state["document_index"].documents == {"notes": [0]}
@@ -0,0 +1,158 @@
+import threading
+
+import pytest
+
+from src.auth.security_context import UserSecurityContext
+from src.core import stream_task
+from src.core.chat import ChatMessage
+from src.core.stream_task import StreamTask, StreamTaskRegistry, record_dropped_usage
+from src.core.usage_ledger import UsageLedger
+from tests.openai_stub import StubClient
+
+MESSAGES = [{"role": "user", "content": "hello there"}]
+ALICE = UserSecurityContext("chat", "alice", "127.0.0.1", "contoso")
+
+
+@pytest.fixture
+def client():
+    """A client whose streams hold after their first word until the test releases them."""
+    client = StubClient()
+    client.chat.completions.stream_gate = threading.Event()
+    yield client
+    client.chat.completions.stream_gate.set()
+
+
+class DroppedTasks(list):
+    """Collects the tasks a registry hands to on_dropped"""
+
+    def __init__(self):
+        super().__init__()
+        self.arrived = threading.Event()
+
+    def __call__(self, task):
+        self.append(task)
+        self.arrived.set()
+
+
+@pytest.fixture
+def dropped():
+    return DroppedTasks()
+
+
+@pytest.fixture
+def registry(dropped):
+    return StreamTaskRegistry(abandon_timeout=60, sweep_interval=3600, on_dropped=dropped)
+
+
+def start(registry, client, session_id="s1", security_context=None):
+    task = StreamTask(client, "gpt-4o", MESSAGES, 100, security_context)
+    return registry.start(session_id, task)
+
+
+def test_swept_task_is_handed_over_once_it_finishes(client, registry, dropped):
+    task = start(registry, client, security_context=ALICE)
+    task.last_attached -= 120
+
+    registry.sweep()
+    client.chat.completions.stream_gate.set()
+
+    assert dropped.arrived.wait(5)
+    assert dropped == [task]
+    assert task.chat_message.cancelled and task.chat_message.usage_estimated
+    assert task.security_context is ALICE
+
+
+def test_task_of_a_closed_session_is_handed_over(client, registry, dropped):
+    task = start(registry, client)
+
+    registry.remove("s1")
+    client.chat.completions.stream_gate.set()
+
+    assert dropped.arrived.wait(5)
+    assert dropped == [task]
+
+
+def test_replaced_task_is_handed_over(client, registry, dropped):
+    first = start(registry, client)
+    start(registry, client)
+    client.chat.completions.stream_gate.set()
+
+    assert dropped.arrived.wait(5)
+    assert dropped == [first]
+
+
+def test_task_taken_by_its_session_is_not_handed_over(client, registry, dropped):
+    client.chat.completions.stream_gate.set()
+    task = start(registry, client)
+    while not task.wait_for_update(0, timeout=5)[1]:
+        pass
+
+    registry.remove("s1", task)
+
+    assert task.chat_message.full_response == "echo: hello there"
+    assert dropped == []
+
+
+def test_usage_of_a_dropped_task_is_recorded_in_the_ledger(monkeypatch, tmp_path):
+    ledger = UsageLedger(tmp_path / "ledger.sqlite3", flush_interval=0.05)
+    monkeypatch.setattr(stream_task, "get_usage_ledger", lambda: ledger)
+    task = StreamTask(StubClient(), "gpt-4o", MESSAGES, 100, ALICE)
+    task.chat_message = ChatMessage("partial", 40, 2, 42, cancelled=True, usage_estimated=True)
+
+    record_dropped_usage(task)
+    # A task which failed before producing a message has nothing to record
+    record_dropped_usage(StreamTask(StubClient(), "gpt-4o", MESSAGES, 100, ALICE))
+
+    assert ledger.usage("alice", "contoso")["user_daily"] == 42
+
+
+def test_reattaching_replays_the_buffer_without_a_second_request(client, registry):
+    task = start(registry, client)
+    text, done = task.wait_for_update(0, timeout=5)
+    assert (text, done) == ("echo: ", False)
+
+    # A rerun reattaches from nothing drawn yet and gets what was received so far
+    reattached = registry.get("s1")
+    assert reattached is task
+    assert reattached.wait_for_update(0) == ("echo: ", False)
+
+    client.chat.completions.stream_gate.set()
+    while not done:
+        text, done = reattached.wait_for_update(len(text), timeout=5)
+
+    assert text == "echo: hello there"
+    assert len(client.chat.completions.requests) == 1
+
+
+def test_start_cancels_the_task_it_replaces(client, registry):
+    first = start(registry, client)
+    second = start(registry, client)
+
+    assert first.cancel_event.is_set()
+    assert not second.cancel_event.is_set()
+    assert registry.get("s1") is second
+
+
+def test_sweep_drops_only_abandoned_tasks(client, registry):
+    abandoned = start(registry, client, "s1")
+    followed = start(registry, client, "s2")
+    abandoned.last_attached -= 120
+    followed.last_attached -= 30
+
+    registry.sweep()
+
+    assert abandoned.cancel_event.is_set()
+    assert not followed.cancel_event.is_set()
+    assert registry.get("s1") is None
+    assert registry.get("s2") is followed
+    assert registry.active_count() == 1
+
+
+def test_removing_a_task_which_is_no_longer_current_keeps_the_current_one(client, registry):
+    first = start(registry, client)
+    second = start(registry, client)
+
+    registry.remove("s1", first)
+
+    assert registry.get("s1") is second
+    assert not second.cancel_event.is_set()
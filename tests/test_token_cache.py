@@ -0,0 +1,101 @@
+import msal
+import pytest
+from cryptography.fernet import Fernet
+
+from src.auth import token_cache
+from src.ui import session
+from tests.msal_stub import StubHttpClient, TENANT_ID
+
+CLIENT_ID = "client"
+SECRET = "secret"
+
+
+@pytest.fixture
+def http_client(monkeypatch):
+    """Make the shared MSAL application use the stub HTTP client."""
+    stub = StubHttpClient()
+    real_app = msal.ConfidentialClientApplication
+
+    def app_with_stub(*args, **kwargs):
+        kwargs.setdefault("http_client", stub)
+        return real_app(*args, **kwargs)
+
+    token_cache.get_msal_app.cache_clear()
+    token_cache._msal_http_cache.clear()
+    monkeypatch.setattr(token_cache.msal, "ConfidentialClientApplication", app_with_stub)
+    yield stub
+    token_cache.get_msal_app.cache_clear()
+    token_cache._msal_http_cache.clear()
+
+
+def redeem(user_app, user):
+    return user_app.acquire_token_by_authorization_code(
+        f"code-{user}", scopes=["User.Read"], redirect_uri="http://localhost/callback"
+    )
+
+
+def test_code_redemption_lands_in_the_per_user_cache(http_client):
+    user_cache = msal.SerializableTokenCache()
+    user_app = token_cache.get_user_msal_app(CLIENT_ID, TENANT_ID, SECRET, user_cache)
+
+    result = redeem(user_app, "alice")
+
+    assert result["access_token"] == "at-alice"
+    accounts = user_app.get_accounts()
+    assert [account["home_account_id"] for account in accounts] == [f"oid-alice.{TENANT_ID}"]
+    assert user_cache.has_state_changed
+    assert token_cache.get_msal_app(CLIENT_ID, TENANT_ID, SECRET).get_accounts() == []
+
+
+def test_users_do_not_share_tokens(http_client):
+    alice_app = token_cache.get_user_msal_app(CLIENT_ID, TENANT_ID, SECRET, msal.SerializableTokenCache())
+    bob_app = token_cache.get_user_msal_app(CLIENT_ID, TENANT_ID, SECRET, msal.SerializableTokenCache())
+
+    redeem(alice_app, "alice")
+    redeem(bob_app, "bob")
+
+    assert [a["username"] for a in alice_app.get_accounts()] == ["alice@example.com"]
+    assert [a["username"] for a in bob_app.get_accounts()] == ["bob@example.com"]
+
+
+def test_per_user_apps_reuse_discovery(http_client):
+    token_cache.get_user_msal_app(CLIENT_ID, TENANT_ID, SECRET, msal.SerializableTokenCache())
+    discovery_requests = [request for request in http_client.requests if request[0] == "GET"]
+
+    for _ in range(5):
+        token_cache.get_user_msal_app(CLIENT_ID, TENANT_ID, SECRET, msal.SerializableTokenCache())
+
+    assert [request for request in http_client.requests if request[0] == "GET"] == discovery_requests
+
+
+def test_persisted_cache_round_trip(http_client, monkeypatch):
+    store = {}
+    monkeypatch.setattr(token_cache, "get_token_cache_store", lambda: type("Store", (), {
+        "load": staticmethod(store.get),
+        "save": staticmethod(store.__setitem__),
+        "delete": staticmethod(lambda key: store.pop(key, None)),
+    })())
+    user_cache = token_cache.load_user_token_cache(None)
+    user_app = token_cache.get_user_msal_app(CLIENT_ID, TENANT_ID, SECRET, user_cache)
+    redeem(user_app, "alice")
+    home_account_id = user_app.get_accounts()[0]["home_account_id"]
+
+    token_cache.save_user_token_cache(home_account_id, user_cache)
+
+    restored_app = token_cache.get_user_msal_app(
+        CLIENT_ID, TENANT_ID, SECRET, token_cache.load_user_token_cache(home_account_id)
+    )
+    assert restored_app.get_accounts()[0]["home_account_id"] == home_account_id
+
+
+def test_eviction_deletes_the_user_cache_from_the_file_store(monkeypatch, tmp_path):
+    store = token_cache.EncryptedFileTokenCacheStore(tmp_path, Fernet.generate_key())
+    monkeypatch.setattr(session, "get_token_cache_store", lambda: store)
+    monkeypatch.setattr(token_cache, "get_token_cache_store", lambda: store)
+    store.save("alice.contoso", "{}")
+    store.save("bob.contoso", "{}")
+
+    session.delete_evicted_token_cache("s1", {"home_account_id": "alice.contoso"})
+
+    assert store.load("alice.contoso") is None
+    assert store.load("bob.contoso") == "{}"
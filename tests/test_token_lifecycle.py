@@ -0,0 +1,132 @@
+import random
+import threading
+
+from src.auth.token_lifecycle import TokenLifecycleManager
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_manager(clock, **kwargs):
+    kwargs.setdefault("jitter", 0)
+    return TokenLifecycleManager(clock=clock, rng=random.Random(0), **kwargs)
+
+
+def token_result(expires_in=3600, suffix="1"):
+    return {
+        "access_token": f"graph-{suffix}",
+        "expires_in": expires_in,
+        "access_token_app": f"app-{suffix}",
+        "expires_in_app": expires_in,
+    }
+
+
+def test_refreshes_ahead_of_expiry():
+    clock = FakeClock()
+    calls = []
+    manager = make_manager(clock, refresh_margin=300)
+    manager.register("s1", lambda: calls.append(1) or token_result(suffix="2"), token_result())
+
+    clock.now += 3600 - 301
+    manager.refresh_due()
+    assert calls == []
+
+    clock.now += 2
+    manager.refresh_due()
+    assert calls == [1]
+    tokens = manager.get_tokens("s1")
+    assert tokens.app_access_token == "app-2"
+    assert tokens.app_expires_at == clock.now + 3600
+
+
+def test_jitter_spreads_sessions():
+    clock = FakeClock()
+    manager = TokenLifecycleManager(clock=clock, refresh_margin=300, jitter=60, rng=random.Random(1))
+    for i in range(20):
+        manager.register(f"s{i}", token_result, token_result())
+
+    refresh_times = {manager.get_tokens(f"s{i}").next_refresh_at for i in range(20)}
+    assert len(refresh_times) == 20
+    assert all(clock.now + 3600 - 360 <= t <= clock.now + 3300 for t in refresh_times)
+
+
+def test_failed_refresh_backs_off_exponentially():
+    clock = FakeClock()
+
+    def failing():
+        raise RuntimeError("invalid_grant")
+
+    manager = make_manager(clock, refresh_margin=300, retry_delay=15, max_retry_delay=60)
+    manager.register("s1", failing, token_result(expires_in=400))
+
+    delays = []
+    for _ in range(4):
+        clock.now = manager.get_tokens("s1").next_refresh_at
+        manager.refresh_due()
+        delays.append(manager.get_tokens("s1").next_refresh_at - clock.now)
+
+    assert delays == [15, 30, 60, 60]
+    assert manager.get_tokens("s1").last_error == "invalid_grant"
+    assert manager.metrics()["refresh_failures"] == 4
+
+
+def test_missing_lifetime_does_not_busy_loop():
+    clock = FakeClock()
+    calls = []
+    manager = make_manager(clock, min_refresh_interval=30)
+    manager.register("s1", lambda: calls.append(1) or token_result(expires_in=0), token_result(expires_in=0))
+
+    assert manager.get_tokens("s1").next_refresh_at == clock.now + 30
+    for _ in range(10):
+        manager.refresh_due()
+    assert calls == []
+
+    clock.now += 30
+    assert manager.refresh_due() > 0
+    assert calls == [1]
+
+
+def test_readers_are_not_blocked_during_refresh():
+    clock = FakeClock()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_refresher():
+        started.set()
+        release.wait(5)
+        return token_result(suffix="2")
+
+    manager = make_manager(clock, min_refresh_interval=0)
+    manager.register("s1", slow_refresher, token_result(expires_in=0))
+    worker = threading.Thread(target=manager.refresh_due)
+    worker.start()
+    assert started.wait(5)
+
+    # The refresh is in flight; reading the current tokens must not wait for it
+    reader = threading.Thread(target=manager.get_tokens, args=("s1",))
+    reader.start()
+    reader.join(1)
+    assert not reader.is_alive()
+
+    release.set()
+    worker.join(5)
+    assert manager.get_tokens("s1").app_access_token == "app-2"
+
+
+def test_unregister_stops_refreshing():
+    clock = FakeClock()
+    calls = []
+    manager = make_manager(clock)
+    manager.register("s1", lambda: calls.append(1) or token_result(), token_result(expires_in=0))
+    manager.unregister("s1")
+
+    clock.now += 3600
+    manager.refresh_due()
+    assert calls == []
+    assert manager.get_tokens("s1") is None
+    assert manager.metrics()["tracked_sessions"] == 0
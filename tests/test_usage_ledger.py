@@ -0,0 +1,118 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.usage_ledger import BudgetExceededError, Budgets, UsageLedger, UsageRecord
+
+NOW = 1_700_000_000.0
+
+
+class FakeClock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def context(user_id="alice", tenant_id="contoso"):
+    return SimpleNamespace(end_user_id=user_id, end_user_tenant_id=tenant_id)
+
+
+def record(ledger, tokens, user_id="alice", tenant_id="contoso"):
+    ledger.record(UsageRecord(ts=ledger.clock(), tenant_id=tenant_id, user_id=user_id, deployment="gpt-4o",
+                              prompt_tokens=tokens, completion_tokens=0, total_tokens=tokens))
+
+
+@pytest.fixture
+def make_ledger(tmp_path):
+    def make(budgets=None, clock=None, **kwargs):
+        return UsageLedger(tmp_path / "ledger.sqlite3", budgets, flush_interval=0.05, clock=clock or FakeClock(),
+                           **kwargs)
+    return make
+
+
+def test_usage_counts_records_before_and_after_loading(make_ledger):
+    ledger = make_ledger()
+    record(ledger, 100)
+    assert ledger.usage("alice", "contoso")["user_daily"] == 100
+
+    record(ledger, 50)
+    record(ledger, 25, user_id="bob")
+    usage = ledger.usage("alice", "contoso")
+
+    assert usage == {"user_daily": 150, "user_monthly": 150, "tenant_daily": 175, "tenant_monthly": 175}
+
+
+def test_budget_of_zero_blocks_requests(make_ledger):
+    ledger = make_ledger(Budgets(user_daily=0))
+
+    with pytest.raises(BudgetExceededError):
+        ledger.check_budget(context())
+
+
+def test_exhausted_budget_raises(make_ledger):
+    ledger = make_ledger(Budgets(tenant_monthly=100))
+    ledger.check_budget(context())
+    record(ledger, 60, user_id="bob")
+    record(ledger, 40)
+
+    with pytest.raises(BudgetExceededError, match="monthly token budget for this tenant"):
+        ledger.check_budget(context())
+
+
+def test_recording_is_not_blocked_while_counters_load(make_ledger):
+    ledger = make_ledger()
+    write_batch = ledger._write_batch
+
+    def slow_write_batch(connection, records):
+        time.sleep(0.5)
+        write_batch(connection, records)
+
+    ledger._write_batch = slow_write_batch
+    record(ledger, 10)
+    checker = threading.Thread(target=ledger.usage, args=("alice", "contoso"))
+    checker.start()
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    record(ledger, 5)
+    assert time.perf_counter() - started < 0.1
+    checker.join()
+
+    assert ledger.usage("alice", "contoso")["user_daily"] == 15
+
+
+def test_concurrent_records_are_counted_exactly_once(make_ledger):
+    ledger = make_ledger(counter_ttl=0)
+
+    def record_many():
+        for _ in range(200):
+            record(ledger, 1)
+
+    threads = [threading.Thread(target=record_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # Counters are reloaded on every check while the records arrive
+    while any(thread.is_alive() for thread in threads):
+        ledger.usage("alice", "contoso")
+    for thread in threads:
+        thread.join()
+
+    assert ledger.usage("alice", "contoso")["user_daily"] == 800
+
+
+def test_counters_pick_up_other_replicas_after_the_ttl(make_ledger):
+    clock = FakeClock()
+    replica_a = make_ledger(clock=clock, counter_ttl=60)
+    replica_b = make_ledger(clock=clock, counter_ttl=60)
+    assert replica_a.usage("alice", "contoso")["user_daily"] == 0
+
+    record(replica_b, 70)
+    replica_b.flush()
+    assert replica_a.usage("alice", "contoso")["user_daily"] == 0
+
+    clock.now += 60
+    assert replica_a.usage("alice", "contoso")["user_daily"] == 70
@@ -0,0 +1,68 @@
+import time
+
+import msal
+import pytest
+
+from src.auth import token_cache, user_auth
+from tests.msal_stub import StubHttpClient, TENANT_ID
+
+
+@pytest.fixture
+def stub():
+    return StubHttpClient()
+
+
+@pytest.fixture
+def auth(monkeypatch, stub):
+    real_app = msal.ConfidentialClientApplication
+
+    def app_with_stub(*args, **kwargs):
+        kwargs.setdefault("http_client", stub)
+        return real_app(*args, **kwargs)
+
+    token_cache.get_msal_app.cache_clear()
+    token_cache._msal_http_cache.clear()
+    monkeypatch.setattr(token_cache.msal, "ConfidentialClientApplication", app_with_stub)
+    monkeypatch.setattr(token_cache, "get_token_cache_store", lambda: token_cache.SessionTokenCacheStore())
+    monkeypatch.setattr(user_auth, "get_user_profile", lambda access_token, cache_key: {"cache_key": cache_key})
+    monkeypatch.setattr(token_cache, "st", type("St", (), {"session_state": {}})())
+    yield user_auth.EntraUserAuth("client", TENANT_ID, "http://localhost/callback", "secret")
+    token_cache.get_msal_app.cache_clear()
+    token_cache._msal_http_cache.clear()
+
+
+def test_handle_callback_returns_account_and_application_token(auth):
+    result = auth.handle_callback("code-alice")
+
+    home_account_id = f"oid-alice.{TENANT_ID}"
+    assert result["home_account_id"] == home_account_id
+    assert result["access_token_app"] == "at-alice"
+    assert result["user_info"] == {"cache_key": home_account_id}
+
+
+def test_refresh_tokens_after_login(auth):
+    auth.handle_callback("code-alice")
+
+    refreshed = auth.refresh_tokens()
+
+    assert refreshed["access_token"] == "at-alice"
+    assert refreshed["access_token_app"] == "at-alice"
+
+
+def test_login_runs_graph_lookup_and_application_token_concurrently(auth, stub, monkeypatch):
+    delay = 0.3
+    stub.refresh_delay = delay
+
+    def slow_profile(access_token, cache_key):
+        time.sleep(delay)
+        return {"cache_key": cache_key}
+
+    monkeypatch.setattr(user_auth, "get_user_profile", slow_profile)
+
+    started = time.perf_counter()
+    result = auth.handle_callback("code-alice")
+    elapsed = time.perf_counter() - started
+
+    assert result["access_token_app"] == "at-alice"
+    # Run one after the other the two lookups would take at least twice the delay
+    assert elapsed < delay * 1.8
@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.core.warmup import SkipStep, Warmup, default_steps, start_readiness_server
+
+
+def flaky(failures):
+    calls = []
+
+    def step():
+        calls.append(None)
+        if len(calls) <= failures:
+            raise ConnectionError(f"transient failure {len(calls)}")
+
+    return step
+
+
+def skipped():
+    raise SkipStep("not configured")
+
+
+def get_ready(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(server):
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def app_health(servers):
+    """A stand-in for Streamlit's health endpoint whose status the test controls."""
+    health = {"status": 200}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(health["status"])
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = servers(ThreadingHTTPServer(("127.0.0.1", 0), Handler))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    health["url"] = f"http://127.0.0.1:{server.server_address[1]}/_stcore/health"
+    return health
+
+
+def test_transient_failures_are_retried(servers):
+    warmup = Warmup({"credential": flaky(2), "imports": skipped}, backoff=0.01)
+    warmup.run()
+
+    steps = warmup.status()["steps"]
+    assert warmup.ready
+    assert (steps["credential"]["state"], steps["credential"]["error"], steps["credential"]["attempts"]) == ("ok", None, 3)
+    assert steps["imports"]["state"] == "skipped"
+    assert get_ready(servers(start_readiness_server(warmup, 0, "127.0.0.1")))[0] == 200
+
+
+def test_persistent_failure_fails_after_the_retries(servers):
+    warmup = Warmup({"graph": flaky(100)}, retries=2, backoff=0.01)
+    warmup.run()
+
+    status_code, status = get_ready(servers(start_readiness_server(warmup, 0, "127.0.0.1")))
+    assert status_code == 503
+    assert status["state"] == "failed"
+    assert status["steps"]["graph"]["attempts"] == 3
+    assert status["steps"]["graph"]["error"] == "transient failure 3"
+
+
+def test_retries_stop_at_the_timeout():
+    warmup = Warmup({"graph": flaky(100)}, timeout=0.3, retries=100, backoff=0.05)
+    warmup.run()
+
+    step = warmup.status()["steps"]["graph"]
+    assert step["state"] == "failed"
+    assert 2 <= step["attempts"] < 10
+
+
+def test_stuck_step_times_out():
+    release = threading.Event()
+    warmup = Warmup({"msal": lambda: release.wait(5)}, timeout=0.1)
+    warmup.run()
+    release.set()
+
+    assert warmup.status()["steps"]["msal"] == {"state": "failed", "latency_ms": None,
+                                                "error": "Timed out after 0.1s", "attempts": 1}
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_failed_steps_are_retried_after_the_report(servers):
+    warmup = Warmup({"graph": flaky(4), "imports": skipped}, retries=1, backoff=0.01, recheck_interval=0.05)
+    warmup.run()
+    server = servers(start_readiness_server(warmup, 0, "127.0.0.1"))
+    assert get_ready(server)[0] == 503
+
+    wait_until(lambda: warmup.ready)
+
+    status_code, status = get_ready(server)
+    assert (status_code, status["state"]) == (200, "ready")
+    assert (status["steps"]["graph"]["state"], status["steps"]["graph"]["error"]) == ("ok", None)
+    assert status["steps"]["graph"]["attempts"] == 5
+
+
+def test_stuck_step_is_not_run_again_until_it_returns():
+    calls = []
+    release = threading.Event()
+
+    def stuck():
+        calls.append(None)
+        release.wait(5)
+
+    warmup = Warmup({"msal": stuck}, timeout=0.1, recheck_interval=0.05)
+    warmup.run()
+    time.sleep(0.3)
+    assert len(calls) == 1
+
+    release.set()
+    wait_until(lambda: warmup.ready)
+    assert len(calls) == 2
+
+
+def test_ready_while_warming_and_with_the_app_down(servers, app_health):
+    release = threading.Event()
+    warmup = Warmup({"imports": release.wait})
+    server = servers(start_readiness_server(warmup, 0, "127.0.0.1", app_health_url=app_health["url"]))
+    thread = warmup.start()
+
+    status_code, status = get_ready(server)
+    assert (status_code, status["state"]) == (503, "warming")
+
+    release.set()
+    thread.join(5)
+    status_code, status = get_ready(server)
+    assert (status_code, status["app"]["state"]) == (200, "ok")
+
+    app_health["status"] = 500
+    status_code, status = get_ready(server)
+    assert (status_code, status["state"], status["app"]["state"]) == (503, "ready", "failed")
+
+
+def test_ready_fails_when_the_app_is_not_listening(servers):
+    warmup = Warmup({})
+    warmup.run()
+    server = servers(start_readiness_server(warmup, 0, "127.0.0.1", app_health_url="http://127.0.0.1:9/_stcore/health"))
+
+    status_code, status = get_ready(server)
+    assert status_code == 503
+    assert status["app"]["state"] == "failed"
+
+
+def test_steps_can_be_skipped_by_name(monkeypatch):
+    monkeypatch.setenv("WARMUP_SKIP", "credential, graph")
+    steps = default_steps()
+
+    warmup = Warmup({name: steps[name] for name in ("credential", "graph")})
+    warmup.run()
+
+    assert warmup.ready
+    assert {step["error"] for step in warmup.status()["steps"].values()} == {"Listed in WARMUP_SKIP"}